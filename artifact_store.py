@@ -0,0 +1,315 @@
+# artifact_store.py
+"""
+Pluggable storage for run artifacts so several workers / nodes can share runs.
+
+A run is addressed by its workdir; artifacts by their path inside the run
+folder ("generated.html", "webtemplate/applet_x.swt", ...).  The local
+output/ tree is always the working copy: conversions write there as
+before, `publish_run` pushes the artifacts to the configured backend and
+`materialize_run` pulls a run that was produced on another node into the
+local tree (read-through cache: hot runs are served from disk, and every
+local copy, pulled or produced here, is revalidated against the backend
+every ARTIFACT_CACHE_TTL s, so a regenerate on another node reaches it).
+
+    ARTIFACT_STORE=local            default, output/ only (publish/materialize are no-ops)
+    ARTIFACT_STORE=sqlite           blobs in ARTIFACT_SQLITE_PATH (default output/_store/artifacts.sqlite)
+    ARTIFACT_STORE=s3               ARTIFACT_S3_BUCKET, ARTIFACT_S3_PREFIX, ARTIFACT_S3_ENDPOINT
+                                    (endpoint for MinIO/moto; credentials via the usual AWS_* env)
+
+At rest, the large text artifacts (COMPRESSED_ARTIFACTS) are gzipped once a
+request has finished with them (`compress_run`, ARTIFACT_COMPRESS=0 turns it
+off).  Readers go through `read_text` / `artifact_path`, which accept either
+the plain file or its .gz sibling.
+"""
+import gzip
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+APP_ROOT = Path(__file__).parent.resolve()
+OUTPUT_ROOT = APP_ROOT / "output"
+UPLOAD_ROOT = APP_ROOT / "uploads"
+
+CACHE_TTL = float(os.getenv("ARTIFACT_CACHE_TTL", "300"))
+CACHE_MARKER = ".store_cache"          # mtime = last sync of the run folder with the backend
+SOURCE_PREFIX = "_source/"             # the uploaded screenshot travels with its run
+COMPRESS = os.getenv("ARTIFACT_COMPRESS", "1") not in {"0", "false", "no"}
+COMPRESSED_ARTIFACTS = ("raw_response.txt", "generated.html", "manifest.json")
+
+
+# ---- compressed at-rest artifacts ----
+
+def artifact_path(out_dir: Path, name: str) -> Path | None:
+    """The stored file for an artifact: plain if present, else its .gz, else None."""
+    fp = out_dir / name
+    if fp.is_file():
+        return fp
+    gz = fp.with_name(fp.name + ".gz")
+    return gz if gz.is_file() else None
+
+
+def read_text(path: Path) -> str:
+    """Text of `path` or of `path`.gz (transparently decompressed); FileNotFoundError if neither."""
+    path = Path(path)
+    fp = path if path.is_file() else path.with_name(path.name + ".gz")
+    data = fp.read_bytes()
+    if fp.suffix == ".gz":
+        data = gzip.decompress(data)
+    return data.decode("utf-8", errors="ignore")
+
+
+def compress_run(out_dir: Path) -> int:
+    """Gzip the run's large text artifacts in place (plain file replaced by .gz); returns bytes saved."""
+    if not COMPRESS:
+        return 0
+    saved = 0
+    for name in COMPRESSED_ARTIFACTS:
+        fp = out_dir / name
+        if not fp.is_file():
+            continue
+        data = fp.read_bytes()
+        gz = fp.with_name(fp.name + ".gz")
+        tmp = fp.with_name(fp.name + ".gz.tmp")
+        # mtime=0 keeps the bytes deterministic (same run -> same .gz)
+        tmp.write_bytes(gzip.compress(data, compresslevel=6, mtime=0))
+        st = fp.stat()
+        os.utime(tmp, (st.st_atime, st.st_mtime))
+        tmp.replace(gz)
+        fp.unlink()
+        saved += len(data) - gz.stat().st_size
+    return saved
+
+
+def _run_files(out_dir: Path) -> list[str]:
+    """Artifact names of a local run folder (derived zips and cache markers excluded)."""
+    names = []
+    for fp in sorted(out_dir.rglob("*")):
+        if not fp.is_file() or fp.name == CACHE_MARKER or fp.suffix in {".zip", ".tmp"}:
+            continue
+        names.append(fp.relative_to(out_dir).as_posix())
+    return names
+
+
+class ArtifactStore:
+    """Backend interface: flat (workdir, name) -> bytes with modification times."""
+
+    remote = True
+
+    def put(self, workdir: str, name: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def get(self, workdir: str, name: str) -> bytes | None:
+        raise NotImplementedError
+
+    def workdirs(self) -> list[str]:
+        """Every run the backend holds artifacts for."""
+        raise NotImplementedError
+
+    def list(self, workdir: str) -> dict[str, float]:
+        """name -> mtime (epoch seconds) of every artifact of a run; {} when unknown."""
+        raise NotImplementedError
+
+
+class LocalStore(ArtifactStore):
+    """The output/ tree itself."""
+
+    remote = False
+
+    def __init__(self, root: Path = OUTPUT_ROOT):
+        self.root = root
+
+    def put(self, workdir, name, data):
+        fp = self.root / workdir / name
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        fp.write_bytes(data)
+
+    def get(self, workdir, name):
+        fp = self.root / workdir / name
+        return fp.read_bytes() if fp.is_file() else None
+
+    def list(self, workdir):
+        d = self.root / workdir
+        return {n: (d / n).stat().st_mtime for n in _run_files(d)} if d.is_dir() else {}
+
+    def workdirs(self):
+        return sorted(d.name for d in self.root.iterdir() if d.is_dir()) if self.root.is_dir() else []
+
+
+class SQLiteStore(ArtifactStore):
+    """All artifacts as blobs in one SQLite file (shared volume / single host, many workers)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS artifacts (workdir TEXT, name TEXT, data BLOB, "
+                      "mtime REAL, PRIMARY KEY (workdir, name))")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, workdir, name, data):
+        with self._conn() as c:
+            c.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)",
+                      (workdir, name, sqlite3.Binary(data), time.time()))
+
+    def get(self, workdir, name):
+        row = self._conn().execute("SELECT data FROM artifacts WHERE workdir=? AND name=?",
+                                   (workdir, name)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def list(self, workdir):
+        rows = self._conn().execute("SELECT name, mtime FROM artifacts WHERE workdir=?", (workdir,))
+        return dict(rows.fetchall())
+
+    def workdirs(self):
+        rows = self._conn().execute("SELECT DISTINCT workdir FROM artifacts ORDER BY workdir")
+        return [r[0] for r in rows.fetchall()]
+
+
+class S3Store(ArtifactStore):
+    """S3-compatible object storage (AWS, MinIO, moto server) at s3://bucket/prefix/<workdir>/<name>."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str | None = None):
+        import boto3  # optional dependency, imported only when this backend is selected
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+
+    def _key(self, workdir, name):
+        return f"{self.prefix}{workdir}/{name}"
+
+    def put(self, workdir, name, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(workdir, name), Body=data)
+
+    def get(self, workdir, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(workdir, name))["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def list(self, workdir):
+        base = self._key(workdir, "")
+        out = {}
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=base):
+            for obj in page.get("Contents", []):
+                out[obj["Key"][len(base):]] = obj["LastModified"].timestamp()
+        return out
+
+    def workdirs(self):
+        out = []
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=self.prefix, Delimiter="/")
+        for page in pages:
+            out += [p["Prefix"][len(self.prefix):].rstrip("/") for p in page.get("CommonPrefixes", [])]
+        return sorted(out)
+
+
+_store: ArtifactStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ArtifactStore:
+    """Process-wide backend selected by ARTIFACT_STORE."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            kind = os.getenv("ARTIFACT_STORE", "local").lower()
+            if kind == "sqlite":
+                _store = SQLiteStore(Path(os.getenv("ARTIFACT_SQLITE_PATH")
+                                          or OUTPUT_ROOT / "_store" / "artifacts.sqlite"))
+            elif kind == "s3":
+                _store = S3Store(os.environ["ARTIFACT_S3_BUCKET"], os.getenv("ARTIFACT_S3_PREFIX", "runs"),
+                                 os.getenv("ARTIFACT_S3_ENDPOINT"))
+            else:
+                _store = LocalStore()
+        return _store
+
+
+def run_in_store(workdir: str) -> bool:
+    """True when a remote backend already holds artifacts for `workdir`."""
+    store = get_store()
+    return store.remote and bool(store.list(workdir))
+
+
+def publish_run(out_dir: Path, names: list[str] | None = None, source: Path | None = None) -> int:
+    """Push a local run's artifacts (all, or just `names`) and optionally its source image."""
+    store = get_store()
+    if not store.remote or not out_dir.is_dir():
+        return 0
+    n = 0
+    for name in names if names is not None else _run_files(out_dir):
+        fp = out_dir / name
+        if fp.is_file():
+            store.put(out_dir.name, name, fp.read_bytes())
+            n += 1
+    if source is not None and source.is_file():
+        store.put(out_dir.name, SOURCE_PREFIX + source.name, source.read_bytes())
+        n += 1
+    (out_dir / CACHE_MARKER).touch()                  # in sync now; revalidated after CACHE_TTL
+    return n
+
+
+def source_image(run_dir: Path) -> Path | None:
+    """
+    The screenshot a run was converted from, or None when it is gone.  A run
+    produced on another node records that node's upload path; materialize_run
+    put the image into this node's uploads/ under the same name.
+    """
+    src = run_dir / "source_image.txt"
+    if not src.exists():
+        return None
+    recorded = Path(src.read_text("utf-8").strip())
+    for fp in (recorded, UPLOAD_ROOT / recorded.name):
+        if recorded.name and fp.is_file():
+            return fp
+    return None
+
+
+def materialize_run(workdir: str, output_root: Path = OUTPUT_ROOT) -> bool:
+    """
+    Make sure `output_root/workdir` holds the run, pulling it from the backend when
+    it was produced elsewhere.  Returns False when the run exists nowhere.
+    """
+    out_dir = output_root / workdir
+    marker = out_dir / CACHE_MARKER
+    store = get_store()
+    if not workdir or not store.remote:
+        return out_dir.is_dir()
+    if marker.exists() and time.time() - marker.stat().st_mtime < CACHE_TTL:
+        return True                                    # synced recently (pulled or published here)
+
+    remote = store.list(workdir)
+    if not remote:
+        if out_dir.is_dir():                           # local-only run: don't ask again before the TTL
+            marker.touch()
+        return out_dir.is_dir()
+    for name, mtime in remote.items():
+        if name.startswith(SOURCE_PREFIX):
+            fp = UPLOAD_ROOT / Path(name[len(SOURCE_PREFIX):]).name
+        else:
+            fp = out_dir / name
+            if not fp.resolve().is_relative_to(out_dir.resolve()):
+                continue
+        if fp.exists() and fp.stat().st_mtime >= mtime:
+            continue
+        data = store.get(workdir, name)
+        if data is None:
+            continue
+        fp.parent.mkdir(parents=True, exist_ok=True)
+        tmp = fp.with_name(fp.name + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(fp)
+        os.utime(fp, (mtime, mtime))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    marker.touch()
+    return True
@@ -0,0 +1,157 @@
+# bulk_regen.py
+"""
+Regenerate Siebel webtemplates for every stored run.
+
+Finds run folders under output/ that have generated.html + manifest.json,
+repairs their manifest selectors and re-runs
+generate_siebel_templates_from_hierarchy for each, as /api/generate_siebel
+does, in a process pool (one worker per CPU by default, so BeautifulSoup
+work is not bound to a single GIL), rebuilds the webtemplate zip and
+writes a JSON summary with per-run timings to output/_reports/.  A failing run is recorded in the
+report and never stops the others.
+
+With a shared artifact store (ARTIFACT_STORE=sqlite|s3) the runs held by the
+store are materialized into output/ first, so runs produced on other nodes
+are covered too, and every worker publishes the rewritten webtemplates and
+repaired manifest back, so all nodes serve the new templates.
+
+    python bulk_regen.py                    # all runs, cpu_count workers
+    python bulk_regen.py --workers 4 20250921_143304 20250921_145314
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from artifact_store import artifact_path, get_store, materialize_run, read_text
+
+APP_ROOT = Path(__file__).parent.resolve()
+OUTPUT_ROOT = APP_ROOT / "output"
+REPORT_DIR = OUTPUT_ROOT / "_reports"
+
+
+def find_runs(output_root: Path = OUTPUT_ROOT, only: list[str] | None = None) -> list[Path]:
+    """Run folders that contain both generated.html and manifest.json (local and shared-store runs)."""
+    store = get_store()
+    names = only or sorted(n for n in {d.name for d in output_root.iterdir() if d.is_dir()}
+                           | set(store.workdirs() if store.remote else [])
+                           if not n.startswith("_"))        # _index, _reports, _store, ...
+    for name in names:
+        materialize_run(name, output_root)    # no-op for the local backend
+    dirs = [output_root / w for w in names]
+    return [d for d in dirs
+            if d.is_dir() and artifact_path(d, "generated.html") and artifact_path(d, "manifest.json")]
+
+
+def regenerate_run(run_dir: str) -> dict:
+    """Worker: regenerate one run's webtemplates + zip. Never raises."""
+    t0 = time.perf_counter()
+    out_dir = Path(run_dir)
+    entry = {"workdir": out_dir.name, "ok": False}
+    try:
+        from main_router import (
+            generate_siebel_templates_from_hierarchy, _load_manifest_safely, _publish_generated,
+            _repair_selectors, _zip_webtemplate,
+        )
+        html = read_text(out_dir / "generated.html")
+        manifest = _load_manifest_safely(out_dir / "manifest.json")
+        # same repair stage as /api/generate_siebel (writes manifest.repaired.json + .diff)
+        manifest, repair = _repair_selectors(html, manifest, out_dir)
+        result = generate_siebel_templates_from_hierarchy(html, manifest, out_dir, out_dir.name)
+        zip_path = _zip_webtemplate(out_dir)
+        _publish_generated(out_dir)
+        entry.update(ok=True, applets=len(result["applets"]), zip=zip_path.name,
+                     repaired=repair["fixed"], unresolved=len(repair["unresolved"]))
+    except Exception as e:
+        entry.update(error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc(limit=5))
+    entry["seconds"] = round(time.perf_counter() - t0, 3)
+    return entry
+
+
+def _write_report(path: Path, report: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(report, indent=2), "utf-8")
+    tmp.replace(path)
+
+
+def regenerate_all(workdirs: list[str] | None = None, workers: int | None = None,
+                   report_path: Path | None = None) -> dict:
+    """
+    Regenerate all (or the given) runs in a process pool and write the summary report.
+    If the job itself fails (pool could not start, output/ unreadable, ...) the
+    report is written and returned with status "failed" and the error.
+    """
+    report_path = report_path or REPORT_DIR / f"regen_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    report = {"status": "running", "started": datetime.now().isoformat(timespec="seconds"), "runs": []}
+    try:
+        return _regenerate_all(workdirs, workers, report_path, report)
+    except Exception as e:
+        report.update(status="failed", finished=datetime.now().isoformat(timespec="seconds"),
+                      error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc(limit=5))
+        _write_report(report_path, report)
+        logging.getLogger("api").error("bulk regeneration failed", extra={"error": report["error"]})
+        return report
+
+
+def _regenerate_all(workdirs: list[str] | None, workers: int | None, report_path: Path, report: dict) -> dict:
+    runs = find_runs(OUTPUT_ROOT, workdirs)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(runs) or 1))
+    report.update(workers=workers, total=len(runs))
+    _write_report(report_path, report)
+
+    t0 = time.perf_counter()
+    # spawn: safe to start from a threaded Flask worker as well as from the CLI
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {pool.submit(regenerate_run, str(r)): r for r in runs}
+        for fut in as_completed(futures):
+            try:
+                entry = fut.result()
+            except Exception as e:  # worker process died (e.g. OOM) – isolate to this run
+                entry = {"workdir": futures[fut].name, "ok": False, "error": f"{type(e).__name__}: {e}"}
+            report["runs"].append(entry)
+
+    report["runs"].sort(key=lambda e: e["workdir"])
+    ok = [e for e in report["runs"] if e.get("ok")]
+    report.update(
+        status="done",
+        finished=datetime.now().isoformat(timespec="seconds"),
+        succeeded=len(ok),
+        failed=len(report["runs"]) - len(ok),
+        wall_seconds=round(time.perf_counter() - t0, 3),
+        cpu_seconds=round(sum(e.get("seconds", 0) for e in report["runs"]), 3),
+        slowest=[e["workdir"] for e in sorted(ok, key=lambda e: e["seconds"], reverse=True)[:10]],
+        report=str(report_path.relative_to(APP_ROOT)) if report_path.is_relative_to(APP_ROOT) else str(report_path),
+    )
+    _write_report(report_path, report)
+    return report
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Regenerate webtemplates for all stored runs.")
+    ap.add_argument("workdirs", nargs="*", help="run folder names (default: all runs)")
+    ap.add_argument("--workers", type=int, default=None, help="pool size (default: CPU count)")
+    args = ap.parse_args(argv)
+
+    report = regenerate_all(args.workdirs or None, args.workers)
+    if report["status"] == "failed":
+        print(f"bulk regeneration failed: {report['error']}", file=sys.stderr)
+        return 1
+    for e in report["runs"]:
+        status = f"{e.get('applets', 0)} applets" if e.get("ok") else f"FAILED {e.get('error')}"
+        print(f"{e['workdir']}: {status} ({e.get('seconds', 0):.2f}s)")
+    print(f"{report['succeeded']}/{report['total']} runs regenerated with {report['workers']} workers "
+          f"in {report['wall_seconds']:.2f}s -> {report['report']}")
+    return 0 if report["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
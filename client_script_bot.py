@@ -1,16 +1,25 @@
 # client_script_bot.py
-import os, traceback
+import os
+import re
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from openai import OpenAI
-import markdown
 import logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
+from provider_scheduler import scheduler, estimate_text_tokens
+from log_pipeline import prompt_fingerprint
+import deadline
+
+log = logging.getLogger("bot")
 
 load_dotenv()
 
 API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
 VECTOR_STORE_ID = os.getenv("OPENAI_VECTOR_STORE_ID")
+BATCH_CONCURRENCY = int(os.getenv("BOT_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BOT_BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_ITEMS = int(os.getenv("BOT_BATCH_MAX_ITEMS", "100"))
 
 SYSTEM = (
     "You are a Siebel Open UI expert. Answer ONLY about Siebel Open UI. "
@@ -19,22 +28,26 @@ SYSTEM = (
 )
 
 _client_instance = None
-def get_client() -> OpenAI:
+def get_client():
     global _client_instance
     if _client_instance is None:
         if not API_KEY:
             raise RuntimeError("OPENAI_API_KEY is not set")
+        from openai import OpenAI  # imported on first use (heavy SDK)
         _client_instance = OpenAI(api_key=API_KEY)
     return _client_instance
 def _log_prompt_and_tools(model, system_text, user_text, vector_store_id):
-    logging.info("MODEL: %s", model)
-    logging.info("SYSTEM PROMPT:\n%s", system_text)
-    logging.info("USER PROMPT:\n%s", user_text)
-    logging.info("FILE_SEARCH vector_store_ids: %s", [vector_store_id] if vector_store_id else None)
+    log.info("bot request", extra={
+        "model": model,
+        "system_prompt": prompt_fingerprint(system_text),
+        "user_prompt": prompt_fingerprint(user_text),
+        "vector_store_ids": [vector_store_id] if vector_store_id else None,
+    })
 
 def _log_responses_annotations(resp):
     """Logs retrieval hits (citations) if Responses+file_search ran."""
     try:
+        hits = []
         for item in getattr(resp, "output", []) or []:
             for part in getattr(item, "content", []) or []:
                 txt = getattr(part, "text", None)
@@ -44,15 +57,18 @@ def _log_responses_annotations(resp):
                 for a in anns:
                     t = getattr(a, "type", "")
                     if t == "file_citation":
-                        logging.info("VECTOR HIT: file_id=%s | quote=%s", getattr(a, "file_id", None), getattr(a, "quote", "") )
+                        hits.append({"file_id": getattr(a, "file_id", None), "quote": prompt_fingerprint(getattr(a, "quote", ""))})
                     elif t == "file_path":
-                        logging.info("VECTOR FILE PATH: file_id=%s | path=%s", getattr(a, "file_id", None), getattr(a, "path", "") )
+                        hits.append({"file_id": getattr(a, "file_id", None), "path": getattr(a, "path", "")})
+        if hits:
+            # full citation lists are verbose: sampled by the log pipeline
+            log.info("vector hits", extra={"hits": hits, "count": len(hits), "verbose": True})
         # Optional: token usage if present
         usage = getattr(resp, "usage", None)
         if usage:
-            logging.info("USAGE: %s", usage)
+            log.info("usage", extra={"usage": str(usage)})
     except Exception as e:
-        logging.warning("Failed to parse annotations: %r", e)
+        log.warning("Failed to parse annotations: %r", e)
 def responses_supported() -> bool:
     """Check if this SDK exposes Responses API (no network call)."""
     try:
@@ -60,20 +76,39 @@ def responses_supported() -> bool:
     except Exception:
         return False
 
-def ask_client_script_bot(message: str, context_type: str = "") -> str:
+def _usage(resp) -> dict | None:
+    """{"prompt_tokens", "completion_tokens", "total_tokens"} from a Chat Completions or Responses usage object."""
+    u = getattr(resp, "usage", None)
+    if u is None:
+        return None
+    prompt = getattr(u, "prompt_tokens", None) or getattr(u, "input_tokens", None) or 0
+    completion = getattr(u, "completion_tokens", None) or getattr(u, "output_tokens", None) or 0
+    return {"prompt_tokens": prompt, "completion_tokens": completion,
+            "total_tokens": getattr(u, "total_tokens", None) or prompt + completion}
+
+def _timed(create):
+    """create(**kwargs) with the HTTP timeout taken when the scheduler admits the call, not when it queues."""
+    return lambda **kwargs: create(**kwargs, timeout=deadline.timeout())
+
+def ask_client_script_bot(message: str, context_type: str = "") -> str | dict:
     if not message or not message.strip():
         return "Please enter a question."
 
     user = f"ContextType: {context_type or 'Any'}\nUser Query: {message.strip()}"
 
     try:
+        deadline.check("bot answer")
         cli = get_client()
 
+        streaming = deadline.remaining() is not None   # under a deadline: answer with what arrived by then
+
         # Try Responses API with vector store grounding (new SDKs)
         if responses_supported() and VECTOR_STORE_ID:
             try:
                 _log_prompt_and_tools(MODEL, SYSTEM, user, VECTOR_STORE_ID)
-                resp = cli.responses.create(
+                resp = scheduler.call(
+                    "openai", MODEL, estimate_text_tokens(SYSTEM, user) + 1200,
+                    _timed(cli.responses.create),
                     model=MODEL,
                     input=[
                         {"role": "system", "content": SYSTEM},
@@ -83,28 +118,112 @@ def ask_client_script_bot(message: str, context_type: str = "") -> str:
                     tool_resources={"file_search": {"vector_store_ids": [VECTOR_STORE_ID]}},
                     max_completion_tokens=1200,
                     temperature=0.2,
+                    **({"stream": True} if streaming else {}),
                 )
+                if streaming:
+                    done = {}   # response.completed carries the usage and the citations
+
+                    def delta_of(event):
+                        kind = getattr(event, "type", "")
+                        if kind == "response.completed":
+                            done["response"] = event.response
+                        return event.delta if kind == "response.output_text.delta" else ""
+                    answer = deadline.collect_stream(resp, delta_of, f"bot:{MODEL}")
+                    resp = done.get("response")
+                else:
+                    answer = getattr(resp, "output_text", "Sorry, I couldn’t format the response.")
                 _log_responses_annotations(resp)
-                return getattr(resp, "output_text", "Sorry, I couldn’t format the response.")
+                return {"answer": answer, "usage": _usage(resp),
+                        **({"partial": deadline.expired()} if streaming else {})}
             except TypeError as e:
-                logging.error("Caught TypeError in Responses.create(): %s", e)
-            logging.info("FALLBACK: Chat Completions (no file_search). Prompt below:")
-            logging.info("SYSTEM PROMPT:\n%s", SYSTEM)
-            logging.info("USER PROMPT:\n%s", user)
+                log.error("Caught TypeError in Responses.create(): %s", e)
+            log.info("fallback: chat completions (no file_search)", extra={
+                "system_prompt": prompt_fingerprint(SYSTEM), "user_prompt": prompt_fingerprint(user)})
 
-        chat = cli.chat.completions.create(
+        chat = scheduler.call(
+            "openai", MODEL, estimate_text_tokens(SYSTEM, user) + 1200,
+            _timed(cli.chat.completions.create),
             model=MODEL,
             messages=[{"role": "system", "content": SYSTEM}, {"role": "user", "content": user}],
             temperature=0.2,
-            max_tokens=1200  # older param; ignored by newer models but harmless
+            max_tokens=1200,  # older param; ignored by newer models but harmless
+            **({"stream": True, "stream_options": {"include_usage": True}} if streaming else {}),
         )
-        raw_answer = chat.choices[0].message.content
+        if streaming:
+            last = {}   # the final chunk carries the usage and no choices
+
+            def text_of(chunk):
+                last["chunk"] = chunk
+                return chunk.choices[0].delta.content if chunk.choices else ""
+            raw_answer = deadline.collect_stream(chat, text_of, f"bot:{MODEL}")
+            usage = _usage(last.get("chunk"))
+        else:
+            raw_answer = chat.choices[0].message.content
+            usage = _usage(chat)
+        import markdown  # imported on first use
         html_answer = markdown.markdown(raw_answer, extensions=["fenced_code", "tables"])
-        return {"answer": html_answer, "html": True}
+        return {"answer": html_answer, "html": True, "usage": usage,
+                **({"partial": deadline.expired()} if streaming else {})}
 
 
 
     except Exception as e:
-        print("ClientScriptBot ERROR:", repr(e))
-        traceback.print_exc()
-        return f"Error: {e}"
+        log.exception("ClientScriptBot ERROR: %r", e)
+        return {"answer": f"Error: {e}", "error": str(e)}
+
+
+def _question_key(message: str, context_type: str) -> tuple[str, str]:
+    """Identical questions: same context and same text up to whitespace."""
+    return (context_type or "").strip(), re.sub(r"\s+", " ", (message or "").strip())
+
+
+def _timed_answer(message: str, context_type: str) -> tuple[dict, float]:
+    t0 = time.perf_counter()
+    answer = ask_client_script_bot(message, context_type)
+    return (answer if isinstance(answer, dict) else {"answer": answer}), time.perf_counter() - t0
+
+
+def ask_batch(items: list[dict], concurrency: int = BATCH_CONCURRENCY):
+    """
+    Answer a checklist of {message, context_type} items; yields one dict per line of the response.
+
+    Identical questions are asked once.  The unique questions go to
+    ask_client_script_bot on up to `concurrency` threads (each with a copy of
+    the caller's contextvars: scheduler priority, deadline), and every answer
+    is yielded as soon as it completes with the input `indices` it answers,
+    its latency and token usage.  The first line ("accepted") gives the
+    counts, the last ("summary") the totals.
+    """
+    groups: dict[tuple[str, str], list[int]] = {}
+    for i, item in enumerate(items):
+        groups.setdefault(_question_key(item.get("message", ""), item.get("context_type", "")), []).append(i)
+    unique = [(key, idx) for key, idx in groups.items() if key[1]]
+    empty = [i for key, idx in groups.items() if not key[1] for i in idx]
+    workers = max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(unique) or 1))
+    yield {"type": "accepted", "items": len(items), "unique": len(unique), "concurrency": workers}
+
+    t0 = time.perf_counter()
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    errors = 0
+    if empty:
+        errors += 1
+        yield {"type": "answer", "indices": empty, "error": "message required"}
+    # contexts are copied here, in the caller's context, before the worker threads start
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bot-batch") as pool:
+        futures = {pool.submit(contextvars.copy_context().run, _timed_answer, key[1], key[0]): (key, idx)
+                   for key, idx in unique}
+        for fut in as_completed(futures):
+            (ctx, message), idx = futures[fut]
+            try:
+                answer, seconds = fut.result()
+            except Exception as e:      # ask_client_script_bot reports its own errors; this is a last resort
+                answer, seconds = {"answer": f"Error: {e}", "error": str(e)}, 0.0
+            errors += "error" in answer
+            for k, v in (answer.get("usage") or {}).items():
+                totals[k] = totals.get(k, 0) + (v or 0)
+            yield {"type": "answer", "indices": idx, "message": message, "context_type": ctx,
+                   "latency_ms": round(seconds * 1000, 1), **answer}
+    log.info("bot batch", extra={"items": len(items), "unique": len(unique), "errors": errors,
+                                 "seconds": round(time.perf_counter() - t0, 3), **totals})
+    yield {"type": "summary", "items": len(items), "unique": len(unique), "errors": errors,
+           "wall_ms": round((time.perf_counter() - t0) * 1000, 1), "usage": totals}
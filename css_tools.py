@@ -0,0 +1,351 @@
+# css_tools.py
+"""
+Small helpers for model-generated CSS: split into rules, scope selectors,
+prune rules that match nothing in the generated DOM and minify.
+
+Only `prune_css` needs BeautifulSoup (imported on first use); it matches
+every selector of the sheet in one batch against od_annotator's tree index.
+
+    python css_tools.py output/<run> [...]     # write style.min.css + report
+"""
+import json
+import re
+import sys
+from pathlib import Path
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+
+
+def split_rules(css: str) -> list[tuple[str, str]]:
+    """
+    Split a stylesheet into top-level (prelude, body) pairs.
+
+    `prelude` is the selector list or at-rule header, `body` the text between
+    its braces (nested blocks of @media etc. are kept intact).  Statement
+    at-rules such as @import/@charset come back with body None.
+    Comments are dropped; strings are respected when matching braces.
+    """
+    css = _COMMENT.sub("", css or "")
+    out, i, n = [], 0, len(css)
+    start = 0
+    while i < n:
+        ch = css[i]
+        if ch in "\"'":
+            j = css.find(ch, i + 1)
+            i = n if j < 0 else j + 1
+            continue
+        if ch == ";" and css[start:i].strip().startswith("@"):
+            out.append((css[start:i].strip(), None))
+            start = i = i + 1
+            continue
+        if ch == "{":
+            depth, j = 1, i + 1
+            while j < n and depth:
+                c = css[j]
+                if c in "\"'":
+                    k = css.find(c, j + 1)
+                    j = n if k < 0 else k + 1
+                    continue
+                depth += c == "{"
+                depth -= c == "}"
+                j += 1
+            prelude = css[start:i].strip()
+            if prelude:
+                out.append((prelude, css[i + 1:j - 1] if not depth else css[i + 1:j]))
+            start = i = j
+            continue
+        if ch == "}":                      # stray closing brace from a truncated/garbled sheet
+            start = i + 1
+        i += 1
+    return out
+
+
+def split_selectors(prelude: str) -> list[str]:
+    """Split a selector list on top-level commas (not inside :is(...)/[attr=","])."""
+    parts, depth, buf, quote = [], 0, [], None
+    for ch in prelude:
+        if quote:
+            quote = None if ch == quote else quote
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            parts.append("".join(buf).strip())
+            buf = []
+            continue
+        buf.append(ch)
+    parts.append("".join(buf).strip())
+    return [p for p in parts if p]
+
+
+_ROOTISH = re.compile(r"^(?::root|html|body)(?=$|[\s>+~.:#\[])", re.I)
+
+
+def scope_css(css: str, scope: str) -> str:
+    """Prefix every selector with `scope` (html/body/:root map onto the scope element itself)."""
+    out = []
+    for prelude, body in split_rules(css):
+        if body is None:
+            out.append(prelude + ";")
+        elif prelude.lower().startswith(("@media", "@supports", "@container", "@layer")):
+            out.append(f"{prelude}{{{scope_css(body, scope)}}}")
+        elif prelude.startswith("@"):      # @font-face, @keyframes, @page ...
+            out.append(f"{prelude}{{{body}}}")
+        else:
+            sels = []
+            for sel in split_selectors(prelude):
+                rest = _ROOTISH.sub("", sel).strip() if _ROOTISH.match(sel) else None
+                sels.append(f"{scope} {rest}".strip() if rest is not None else f"{scope} {sel}")
+            out.append(f"{', '.join(sels)}{{{body}}}")
+    return "\n".join(out)
+
+
+
+# ---- pruning + minification ----
+
+# state/pseudo-element parts that never match a static DOM; stripped before matching
+_DYNAMIC_PSEUDO = re.compile(
+    r"::?(?:hover|focus|focus-within|focus-visible|active|visited|link|any-link|target|"
+    r"before|after|first-line|first-letter|placeholder|placeholder-shown|selection|marker|"
+    r"backdrop|file-selector-button|-(?:webkit|moz|ms)-[\w-]+)(?![\w-])(?:\([^)]*\))?",
+    re.I,
+)
+_ALWAYS_KEEP = re.compile(r"^(?:\*|html|body|:root)$", re.I)
+_GROUPING = ("@media", "@supports", "@container", "@layer", "@document")
+_KEYFRAMES = re.compile(r"^@(?:-\w+-)?keyframes\s+([^\s{]+)", re.I)
+
+
+def _static_selector(sel: str) -> str:
+    """Selector with dynamic pseudo-classes/elements removed ('' when nothing is left)."""
+    s = _DYNAMIC_PSEUDO.sub("", sel).strip()
+    if s and s[-1] in ">+~":
+        s += " *"
+    return s
+
+
+def _min_ws(text: str) -> str:
+    """Collapse whitespace outside strings."""
+    out, i, n = [], 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch in "\"'":
+            j = text.find(ch, i + 1)
+            j = n if j < 0 else j + 1
+            out.append(text[i:j])
+            i = j
+            continue
+        if ch.isspace():
+            while i < n and text[i].isspace():
+                i += 1
+            out.append(" ")
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out).strip()
+
+
+def _split_decls(body: str) -> list[str]:
+    """Split a declaration block on ';' outside strings and parentheses (url(data:...;base64))."""
+    parts, depth, buf, quote = [], 0, [], None
+    for ch in body:
+        if quote:
+            quote = None if ch == quote else quote
+        elif ch in "\"'":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == ";" and depth == 0:
+            parts.append("".join(buf))
+            buf = []
+            continue
+        buf.append(ch)
+    parts.append("".join(buf))
+    return [p for p in (_min_ws(p) for p in parts) if p]
+
+
+def _min_decls(body: str) -> str:
+    decls = []
+    for d in _split_decls(body):
+        prop, sep, value = d.partition(":")
+        decls.append(f"{prop.strip()}:{value.strip()}" if sep else d)
+    return ";".join(decls)
+
+
+def _min_selector(sel: str) -> str:
+    return re.sub(r"\s*([>+~,])\s*", r"\1", _min_ws(sel))
+
+
+def _flatten(css: str) -> list[tuple[str, str | None, list]]:
+    """(prelude, body, nested) triples; nested is the flattened body of grouping at-rules."""
+    out = []
+    for prelude, body in split_rules(css):
+        nested = _flatten(body) if body is not None and prelude.lower().startswith(_GROUPING) else None
+        out.append((prelude, body, nested))
+    return out
+
+
+def _selectors_of(rules) -> list[str]:
+    sels = []
+    for prelude, body, nested in rules:
+        if nested is not None:
+            sels += _selectors_of(nested)
+        elif body is not None and not prelude.startswith("@"):
+            sels += split_selectors(prelude)
+    return sels
+
+
+def _match_selectors(html: str, selectors: list[str]) -> dict[str, bool]:
+    """selector -> matches at least one element; invalid or unmatchable selectors count as used."""
+    from bs4 import BeautifulSoup
+    import soupsieve
+    from od_annotator import _TreeIndex
+
+    soup = BeautifulSoup(html, "lxml")
+    used, probe = {}, {}
+    for sel in dict.fromkeys(selectors):
+        static = _static_selector(sel)
+        if not static or _ALWAYS_KEEP.match(static):
+            used[sel] = True
+            continue
+        try:
+            soupsieve.compile(static)
+        except Exception:
+            used[sel] = True          # unknown syntax: never drop what we cannot evaluate
+            continue
+        probe[sel] = static
+    index = _TreeIndex(soup, first_selectors=list(dict.fromkeys(probe.values())))
+    for sel, static in probe.items():
+        used[sel] = static in index.first
+    return used
+
+
+def _emit(rules, used, report) -> list[str]:
+    out = []
+    for prelude, body, nested in rules:
+        if body is None:
+            out.append(_min_ws(prelude) + ";")
+        elif nested is not None:
+            inner = _emit(nested, used, report)
+            if inner:
+                out.append(f"{_min_ws(prelude)}{{{''.join(inner)}}}")
+            else:
+                report["at_rules_dropped"] += 1
+        elif prelude.startswith("@"):
+            if _KEYFRAMES.match(prelude):
+                body = "".join(f"{_min_selector(p)}{{{_min_decls(b or '')}}}" for p, b in split_rules(body))
+            else:
+                body = _min_decls(body)
+            out.append(f"{_min_ws(prelude)}{{{body}}}")
+        else:
+            sels = split_selectors(prelude)
+            kept = [s for s in sels if used is None or used.get(s, True)]
+            report["selectors_dropped"] += [s for s in sels if s not in kept]
+            decls = _min_decls(body)
+            if not kept or not decls:
+                report["rules_dropped"] += 1
+                continue
+            out.append(f"{','.join(dict.fromkeys(_min_selector(s) for s in kept))}{{{decls}}}")
+    return _merge(out, report)
+
+
+def _merge(rules: list[str], report) -> list[str]:
+    """Drop earlier exact duplicates; join adjacent rules with the same selector or the same body."""
+    seen, dedup = set(), []
+    for r in reversed(rules):
+        if r in seen and not r.startswith("@"):
+            report["duplicates_merged"] += 1
+            continue
+        seen.add(r)
+        dedup.append(r)
+    dedup.reverse()
+    out = []
+    for r in dedup:
+        if out and not r.startswith("@") and not out[-1].startswith("@"):
+            psel, pbody = out[-1][:-1].split("{", 1)
+            sel, body = r[:-1].split("{", 1)
+            if sel == psel:
+                out[-1] = f"{sel}{{{pbody};{body}}}"
+                report["duplicates_merged"] += 1
+                continue
+            if body == pbody:
+                out[-1] = f"{psel},{sel}{{{body}}}"
+                report["duplicates_merged"] += 1
+                continue
+        out.append(r)
+    return out
+
+
+def _drop_unused_keyframes(rules: list[str], report) -> list[str]:
+    body = "".join(r for r in rules if not _KEYFRAMES.match(r))
+    out = []
+    for r in rules:
+        m = _KEYFRAMES.match(r)
+        if m and not re.search(rf"(?<![\w-]){re.escape(m.group(1))}(?![\w-])", body):
+            report["at_rules_dropped"] += 1
+            continue
+        out.append(r)
+    return out
+
+
+def prune_css(css: str, html: str | None = None) -> tuple[str, dict]:
+    """
+    Minified copy of `css` without the selectors that match nothing in `html`.
+
+    Selectors are matched in one pass against the DOM index; state and
+    pseudo-element parts (:hover, ::before ...) are ignored when matching.
+    Rules left without selectors or declarations, empty @media blocks and
+    unreferenced @keyframes are dropped, duplicate rules merged.  Without
+    html (or with an empty DOM) only merging and minification happen.
+    """
+    rules = _flatten(css or "")
+    report = {"selectors_dropped": [], "rules_dropped": 0, "at_rules_dropped": 0, "duplicates_merged": 0}
+    used = None
+    if html and re.search(r"<(?!html\b|head\b|body\b|meta\b|title\b|link\b|!)[a-z]", html, re.I):
+        used = _match_selectors(html, _selectors_of(rules))
+    out = _drop_unused_keyframes(_emit(rules, used, report), report)
+    minified = "".join(out)
+    report["selectors_dropped"] = list(dict.fromkeys(report["selectors_dropped"]))
+    report.update(pruned=used is not None,
+                  original_bytes=len((css or "").encode("utf-8")),
+                  minified_bytes=len(minified.encode("utf-8")))
+    report["saved_pct"] = round(100.0 * (1 - report["minified_bytes"] / report["original_bytes"]), 1) \
+        if report["original_bytes"] else 0.0
+    return minified, report
+
+
+def optimize_run_css(out_dir: Path) -> dict | None:
+    """Write style.min.css and css_report.json for a run folder (None when it has no style.css)."""
+    css_path = out_dir / "style.css"
+    if not css_path.exists():
+        return None
+    from artifact_store import artifact_path, read_text
+    html_path = artifact_path(out_dir, "generated.html")
+    html = read_text(html_path) if html_path else ""
+    minified, report = prune_css(css_path.read_text("utf-8", errors="ignore"), html)
+    (out_dir / "style.min.css").write_text(minified, "utf-8")
+    (out_dir / "css_report.json").write_text(json.dumps(report, indent=2), "utf-8")
+    return report
+
+
+def run_css(out_dir: Path) -> Path | None:
+    """style.min.css when it is at least as new as style.css, else style.css (None if neither)."""
+    css_path, min_path = out_dir / "style.css", out_dir / "style.min.css"
+    if min_path.exists() and (not css_path.exists() or min_path.stat().st_mtime >= css_path.stat().st_mtime):
+        return min_path
+    return css_path if css_path.exists() else None
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        rep = optimize_run_css(Path(arg))
+        if rep is None:
+            print(f"{arg}: no style.css")
+            continue
+        print(f"{arg}: {rep['original_bytes']} -> {rep['minified_bytes']} bytes ({rep['saved_pct']}% saved), "
+              f"{len(rep['selectors_dropped'])} selectors / {rep['rules_dropped']} rules dropped, "
+              f"{rep['duplicates_merged']} merged")
@@ -0,0 +1,123 @@
+# deadline.py
+"""
+Request-level deadlines ("best effort within 30 s").
+
+A request that carries a deadline (form/JSON field `deadline`, header
+X-Deadline, in seconds; REQUEST_DEADLINE sets a default) runs with an
+absolute monotonic deadline in a context variable, the same way the
+provider priority travels (see provider_scheduler).  Everything below reads
+the remaining budget from there:
+
+    provider_scheduler    waits for rate budget at most until the deadline
+    provider handlers     HTTP timeout = remaining time, streamed reads stop at the deadline
+    pipeline stages       `check(stage)` before starting; optional stages are skipped
+
+A provider that is cut off returns the text received so far and calls
+`mark_partial`; the request's `state()` then reports partial=True, which the
+API passes on to the client.  Worker threads started with a copied context
+(tiled conversion) share the same state.
+"""
+import contextvars
+import os
+import time
+
+DEFAULT = float(os.getenv("REQUEST_DEADLINE", "0")) or None
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT", "600"))   # HTTP timeout without a deadline
+MIN_TIMEOUT = 1.0          # never hand a provider a timeout shorter than this
+
+_state: contextvars.ContextVar[dict | None] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before a stage could start."""
+
+
+def start(seconds: float | None) -> None:
+    """Set (seconds > 0) or clear (None) the deadline for the current context, e.g. one request."""
+    if seconds and seconds > 0:
+        _state.set({"deadline": time.monotonic() + seconds, "budget_s": seconds,
+                    "partial": False, "skipped": [], "cut": []})
+    else:
+        _state.set(None)
+
+
+def parse(value) -> float | None:
+    """Seconds from a form/header/JSON value; None when absent or invalid."""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds > 0 else None
+
+
+def remaining() -> float | None:
+    """Seconds left (may be <= 0), or None when the request has no deadline."""
+    st = _state.get()
+    return None if st is None else st["deadline"] - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout(default: float = PROVIDER_TIMEOUT) -> float:
+    """HTTP timeout for a provider call: the remaining budget (at least MIN_TIMEOUT), else `default`."""
+    left = remaining()
+    return default if left is None else max(MIN_TIMEOUT, left)
+
+
+def check(stage: str) -> None:
+    """Raise DeadlineExceeded (and record the stage) when no budget is left to start `stage`."""
+    if expired():
+        skip(stage)
+        raise DeadlineExceeded(f"deadline exceeded before {stage}")
+
+
+def skip(stage: str) -> None:
+    """Record an optional stage that was not run because the budget was used up."""
+    st = _state.get()
+    if st is not None:
+        st["partial"] = True
+        st["skipped"].append(stage)
+
+
+def mark_partial(what: str) -> None:
+    """A stage returned a truncated result (e.g. a provider stream cut off at the deadline)."""
+    st = _state.get()
+    if st is not None:
+        st["partial"] = True
+        st["cut"].append(what)
+
+
+def collect_stream(chunks, text_of, what: str) -> str:
+    """
+    Join the text of a streamed provider response.  Stops at the deadline, or
+    on a read error/timeout once some text arrived, and marks the result partial.
+    """
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(text_of(chunk) or "")
+            if expired():
+                mark_partial(what)
+                break
+    except Exception:
+        if not "".join(parts):
+            raise
+        mark_partial(what)
+    finally:
+        close = getattr(chunks, "close", None)
+        if callable(close):
+            close()
+    return "".join(parts)
+
+
+def state() -> dict | None:
+    """{"partial", "budget_s", "elapsed_s", "skipped", "cut"} for the current request, or None."""
+    st = _state.get()
+    if st is None:
+        return None
+    elapsed = st["budget_s"] - (st["deadline"] - time.monotonic())
+    return {"partial": st["partial"], "budget_s": st["budget_s"], "elapsed_s": round(elapsed, 3),
+            "skipped": list(st["skipped"]), "cut": list(st["cut"])}
@@ -0,0 +1,161 @@
+# design_library.py
+"""
+Project-level design-system class library learned from past runs.
+
+`build_library` reads style.css of every run under output/, keeps the
+single-class rules (`.btn`, `.btn:hover`, ...) that recur in at least
+LIBRARY_MIN_RUNS runs, using the most common declaration block for each,
+and writes them to output/_library/design_system.css with an index in
+design_system.json.
+
+When a conversion runs with the library (form field design_library=1, or
+DESIGN_LIBRARY=1 for every request), the model gets the class list in its
+prompt and only has to return HTML that uses those classes plus a small CSS
+delta.  The library sheet is copied into the run as design_system.css and
+linked before style.css, so the preview, the view template and the
+webtemplate zips pick it up.
+
+    python design_library.py --build [--min-runs 2] [--max-classes 150]
+    python design_library.py             # show the current library
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from css_tools import _min_decls, split_rules, split_selectors
+
+APP_ROOT = Path(__file__).parent.resolve()
+OUTPUT_ROOT = APP_ROOT / "output"
+LIBRARY_DIR = OUTPUT_ROOT / "_library"
+LIBRARY_CSS = LIBRARY_DIR / "design_system.css"
+LIBRARY_INDEX = LIBRARY_DIR / "design_system.json"
+RUN_CSS = "design_system.css"
+
+ENABLED = os.getenv("DESIGN_LIBRARY", "0") in {"1", "true", "on"}
+MIN_RUNS = int(os.getenv("LIBRARY_MIN_RUNS", "2"))
+MAX_CLASSES = int(os.getenv("LIBRARY_MAX_CLASSES", "150"))
+
+_CLASS_RULE = re.compile(r"^\.(-?[A-Za-z_][\w-]*)((?::{1,2}[a-z-]+)?)$")
+
+
+def _class_rules(css: str) -> dict[str, str]:
+    """selector -> minified declarations for the single-class rules of one stylesheet."""
+    rules: dict[str, list[str]] = defaultdict(list)
+    for prelude, body in split_rules(css):
+        if body is None or prelude.startswith("@"):
+            continue
+        decls = _min_decls(body)
+        if not decls:
+            continue
+        for sel in split_selectors(prelude):
+            sel = " ".join(sel.split())
+            if _CLASS_RULE.match(sel):
+                rules[sel].append(decls)
+    return {sel: ";".join(parts) for sel, parts in rules.items()}
+
+
+def build_library(output_root: Path = OUTPUT_ROOT, min_runs: int = MIN_RUNS,
+                  max_classes: int = MAX_CLASSES) -> dict:
+    """Merge recurring class rules of all runs into the shared sheet; returns the index."""
+    seen: dict[str, Counter] = defaultdict(Counter)    # selector -> Counter(declarations)
+    runs = 0
+    for run in sorted(p for p in output_root.iterdir() if p.is_dir() and not p.name.startswith("_")):
+        css_path = run / "style.css"
+        if not css_path.is_file():
+            continue
+        runs += 1
+        for sel, decls in _class_rules(css_path.read_text("utf-8", errors="ignore")).items():
+            seen[sel][decls] += 1
+
+    def run_count(sel):
+        return sum(seen[sel].values())
+
+    bases = [s for s in seen if ":" not in s and run_count(s) >= min_runs]
+    bases.sort(key=lambda s: (-run_count(s), s))
+    bases = bases[:max_classes]
+    keep = set(bases)
+    keep |= {s for s in seen if ":" in s and s.split(":", 1)[0] in keep and run_count(s) >= min_runs}
+
+    classes, css = {}, []
+    for sel in sorted(keep, key=lambda s: (s.split(":", 1)[0], s)):
+        decls = seen[sel].most_common(1)[0][0]
+        css.append(f"{sel}{{{decls}}}")
+        if sel in bases:
+            classes[sel[1:]] = {"runs": run_count(sel), "variants": len(seen[sel])}
+
+    index = {"built_at": datetime.now().isoformat(timespec="seconds"), "runs_scanned": runs,
+             "min_runs": min_runs, "classes": classes, "rules": len(css)}
+    LIBRARY_DIR.mkdir(parents=True, exist_ok=True)
+    LIBRARY_CSS.write_text("\n".join(css) + "\n", "utf-8")
+    LIBRARY_INDEX.write_text(json.dumps(index, indent=2), "utf-8")
+    _cache.clear()
+    return index
+
+
+_cache: dict = {}
+
+
+def load_library() -> dict | None:
+    """The current index (cached until the file changes), or None when no library was built."""
+    try:
+        mtime = LIBRARY_INDEX.stat().st_mtime
+    except OSError:
+        return None
+    if _cache.get("mtime") != mtime:
+        _cache.update(mtime=mtime, index=json.loads(LIBRARY_INDEX.read_text("utf-8")))
+    index = _cache["index"]
+    return index if index.get("classes") else None
+
+
+def library_prompt(index: dict) -> str:
+    """User prompt for a library-backed conversion: the class list plus the CSS-delta rule."""
+    from openai_api_handler import USER_PROMPT
+
+    names = ", ".join(sorted(index["classes"]))
+    return (
+        f"{USER_PROMPT}\n\n"
+        "DESIGN SYSTEM: a shared stylesheet (design_system.css) is already loaded. It defines these classes:\n"
+        f"{names}\n"
+        "Use these classes wherever they fit the screenshot. In the css block output ONLY rules for classes "
+        "that are not in this list or layout specific to this screen. Never repeat or redefine a library class."
+    )
+
+
+def link_library(out_dir: Path, html: str) -> str:
+    """Copy the library sheet into the run and link it before style.css in `html`."""
+    shutil.copy2(LIBRARY_CSS, out_dir / RUN_CSS)
+    link = f'<link rel="stylesheet" href="{RUN_CSS}">'
+    if RUN_CSS in html:
+        return html
+    html, n = re.subn(r"(<link[^>]*href=[\"']?style\.css[\"']?[^>]*>)", link + r"\n\1", html, count=1, flags=re.I)
+    if n:
+        return html
+    html, n = re.subn(r"</head>", link + "\n</head>", html, count=1, flags=re.I)
+    return html if n else link + "\n" + html
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--build", action="store_true", help="rebuild from the runs in output/")
+    ap.add_argument("--min-runs", type=int, default=MIN_RUNS)
+    ap.add_argument("--max-classes", type=int, default=MAX_CLASSES)
+    args = ap.parse_args(argv)
+
+    index = build_library(min_runs=args.min_runs, max_classes=args.max_classes) if args.build else load_library()
+    if not index:
+        print("no design library (run with --build)")
+        return 1
+    print(f"{len(index['classes'])} classes, {index['rules']} rules from {index['runs_scanned']} runs "
+          f"-> {LIBRARY_CSS}")
+    print(", ".join(sorted(index["classes"])))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# dsl_benchmark.py
+"""
+Side-by-side benchmark of the two conversion output modes.
+
+For every image, calls the model once in the default three-fence mode and
+once in compact layout DSL mode (siebel_generator.DSL_PROMPT).  For each it
+records wall-clock time, output tokens (≈ chars / 4, the same estimate the
+provider scheduler uses) and the local parse/compile time, then checks
+whether the manifest validates against the HTML.  The summary is printed
+and written to output/_reports/dsl_bench_<ts>.json.
+
+    python dsl_benchmark.py uploads/screen.png [more.png ...] [--model gpt-4o] [--repeat 2]
+    python dsl_benchmark.py --compile layout.dsl        # local compile only, no API call
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+APP_ROOT = Path(__file__).parent.resolve()
+REPORT_DIR = APP_ROOT / "output" / "_reports"
+
+
+def _count_applets(manifest: dict) -> int:
+    def walk(containers):
+        return sum(len(c.get("applets") or []) + walk((c.get("children") or []) + (c.get("containers") or []))
+                   for c in containers or [])
+    return walk(manifest.get("page", {}).get("containers") or manifest.get("containers") or [])
+
+
+def _expand(raw: str, mode: str) -> dict:
+    """Parse (fences) or compile (dsl) one response; returns timing + validity."""
+    from siebel_generator import compile_layout_dsl, extract_block, parse_fenced_sections
+    from manifest_utils import validate_structure
+    from tolerant_json import loads
+
+    t0 = time.perf_counter()
+    try:
+        if mode == "dsl":
+            html, css, manifest = compile_layout_dsl(extract_block(raw, "layout") or raw)
+        else:
+            mtext, html, css = parse_fenced_sections(raw)
+            manifest = loads(mtext or "{}")[0]
+    except Exception as e:
+        return {"expand_ms": round((time.perf_counter() - t0) * 1000, 2), "error": f"{type(e).__name__}: {e}"}
+    expand_ms = round((time.perf_counter() - t0) * 1000, 2)
+    check = validate_structure(html, manifest.get("page", manifest))
+    return {"expand_ms": expand_ms, "html_chars": len(html), "css_chars": len(css),
+            "applets": _count_applets(manifest), "valid": check["valid"],
+            "missing_selectors": len(check["missing_selectors"])}
+
+
+def bench_image(image: Path, model: str, max_tokens: int, repeat: int) -> dict:
+    from provider_scheduler import estimate_text_tokens
+    from siebel_generator import DSL_PROMPT, _call_model
+
+    entry = {"image": str(image), "modes": {}}
+    for mode, prompt in (("fences", None), ("dsl", DSL_PROMPT)):
+        runs = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            raw, err = _call_model(image, model, max_tokens, prompt=prompt)
+            wall = time.perf_counter() - t0
+            if not raw:
+                runs.append({"seconds": round(wall, 3), "error": err or "empty response"})
+                continue
+            runs.append({"seconds": round(wall, 3), "output_tokens": estimate_text_tokens(raw),
+                         **_expand(raw, mode)})
+        ok = [r for r in runs if "output_tokens" in r]
+        entry["modes"][mode] = {
+            "runs": runs,
+            "median_seconds": round(statistics.median(r["seconds"] for r in ok), 3) if ok else None,
+            "median_output_tokens": int(statistics.median(r["output_tokens"] for r in ok)) if ok else None,
+        }
+    f, d = entry["modes"]["fences"], entry["modes"]["dsl"]
+    if f["median_seconds"] and d["median_seconds"]:
+        entry["speedup"] = round(f["median_seconds"] / d["median_seconds"], 2)
+        entry["token_ratio"] = round(d["median_output_tokens"] / max(1, f["median_output_tokens"]), 3)
+    return entry
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("images", nargs="*", type=Path)
+    ap.add_argument("--model", default="gpt-4o")
+    ap.add_argument("--max-tokens", type=int, default=6000)
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--compile", type=Path, help="only time the local compile of a DSL file")
+    args = ap.parse_args(argv)
+
+    if args.compile:
+        res = _expand(args.compile.read_text("utf-8"), "dsl")
+        print(json.dumps(res, indent=2))
+        return 0 if "error" not in res else 1
+    if not args.images:
+        ap.error("give at least one image (or --compile FILE)")
+
+    report = {"model": args.model, "max_tokens": args.max_tokens, "repeat": args.repeat,
+              "started": datetime.now().isoformat(timespec="seconds"), "images": []}
+    print(f"{'image':30} {'mode':7} {'seconds':>8} {'out tok':>8} {'expand ms':>10}  valid")
+    for image in args.images:
+        entry = bench_image(image, args.model, args.max_tokens, args.repeat)
+        report["images"].append(entry)
+        for mode, m in entry["modes"].items():
+            last = m["runs"][-1]
+            print(f"{image.name[:30]:30} {mode:7} {m['median_seconds'] or '-':>8} "
+                  f"{m['median_output_tokens'] or '-':>8} {last.get('expand_ms', '-'):>10}  "
+                  f"{last.get('valid', last.get('error'))}")
+        if "speedup" in entry:
+            print(f"{'':30} dsl is {entry['speedup']}x faster, {entry['token_ratio']:.0%} of the output tokens")
+
+    REPORT_DIR.mkdir(parents=True, exist_ok=True)
+    path = REPORT_DIR / f"dsl_bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path.write_text(json.dumps(report, indent=2), "utf-8")
+    print(f"report: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
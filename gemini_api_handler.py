@@ -2,22 +2,43 @@
 from pathlib import Path
 import os
 import mimetypes
-import google.generativeai as genai
+import time
+from provider_scheduler import is_rate_limit_error
+import deadline
+from image_handles import account_of, get_cache, is_handle_error
+
+FILE_TTL = 48 * 3600   # Gemini deletes uploaded files after 48 h
 
 def _detect_mime(p: Path) -> str:
     mt, _ = mimetypes.guess_type(str(p))
     # default to png if unknown
     return mt or "image/png"
 
-def call_gemini_api(image_path: Path, model: str, max_output_tokens: int) -> str | None:
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except ValueError:   # chunk without text parts (safety stop, finish marker)
+        return ""
+
+def _upload_image(genai, mime: str):
+    def upload(path: Path) -> dict:
+        f = genai.upload_file(path=str(path), mime_type=mime)
+        exp = getattr(f, "expiration_time", None)
+        return {"id": f.name, "uri": f.uri, "mime": mime,
+                "expires_at": exp.timestamp() if exp else time.time() + FILE_TTL}
+    return upload
+
+def call_gemini_api(image_path: Path, model: str, max_output_tokens: int, prompt: str | None = None) -> str | None:
     """
     Returns the raw text response (two fenced code blocks) or raises
     a detailed Exception that upstream can surface to the user.
+    `prompt` is sent after the shared instructions (e.g. revision/patch requests).
     """
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise RuntimeError("GOOGLE_API_KEY is not set")
 
+    import google.generativeai as genai  # imported on first use (protobuf/grpc stack)
     genai.configure(api_key=api_key)
     model_name = (model or "gemini-1.5-flash").strip()
 
@@ -33,25 +54,47 @@ def call_gemini_api(image_path: Path, model: str, max_output_tokens: int) -> str
     # Reuse your OpenAI instructions verbatim so parsing stays identical
     from openai_api_handler import instructions  # import the same prompt text
     mime = _detect_mime(image_path)
-    img_bytes = image_path.read_bytes()
+    # uploaded once per image: retries and multi-call workflows send only the file uri
+    handle = get_cache().get_or_upload("gemini", account_of(api_key), image_path, _upload_image(genai, mime))
 
-    try:
-        resp = mdl.generate_content(
-            [
-                {"text": instructions},
-                {"inline_data": {"mime_type": mime, "data": img_bytes}},
-            ],
-            generation_config={
-                "max_output_tokens": max_output_tokens,
-                # optional: raise limits a bit if needed
-                # "temperature": 0.2,
-            },
-            # optional: relax safety if you hit blocks (tune as needed)
-            # safety_settings=[{"category":"HARM_CATEGORY_HARASSMENT","threshold":"BLOCK_NONE"}, ...]
-        )
-    except Exception as e:
-        # transport / quota / auth errors
-        raise RuntimeError(f"Gemini request failed: {e}")
+    streaming = deadline.remaining() is not None
+    while True:
+        if handle:
+            image_part = {"file_data": {"mime_type": mime, "file_uri": handle[1]["uri"]}}
+        else:
+            image_part = {"inline_data": {"mime_type": mime, "data": image_path.read_bytes()}}
+        try:
+            resp = mdl.generate_content(
+                [
+                    {"text": instructions + (f"\n\n{prompt}" if prompt else "")},
+                    image_part,
+                ],
+                generation_config={
+                    "max_output_tokens": max_output_tokens,
+                    # optional: raise limits a bit if needed
+                    # "temperature": 0.2,
+                },
+                # optional: relax safety if you hit blocks (tune as needed)
+                # safety_settings=[{"category":"HARM_CATEGORY_HARASSMENT","threshold":"BLOCK_NONE"}, ...]
+                stream=streaming,   # under a deadline: keep what arrived before it
+                request_options={"timeout": deadline.timeout()},
+            )
+            if streaming:
+                text = deadline.collect_stream(resp, _chunk_text, f"gemini:{model_name}")
+                if text:
+                    return text
+                raise RuntimeError("Gemini returned no text (stream).")
+            break
+        except Exception as e:
+            # 429 / quota exhausted goes back to the scheduler (it backs off and retries)
+            if is_rate_limit_error(e):
+                raise
+            if handle and is_handle_error(e):   # file expired/deleted upstream: resend inline
+                get_cache().fallback(handle[0], e)
+                handle = None
+                continue
+            # transport / quota / auth errors
+            raise RuntimeError(f"Gemini request failed: {e}")
 
     # SDK can return finishes with filters/blocks; capture details
     if not hasattr(resp, "text") or not resp.text:
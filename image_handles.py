@@ -0,0 +1,198 @@
+# image_handles.py
+"""
+Provider-side handles for uploaded screenshots.
+
+A retry, a cascade escalation, a tiled or revision workflow sends the same
+screenshot to a provider several times: as a base64 data URI for OpenAI and
+as raw inline_data for Gemini.  Instead, the image is uploaded once per
+provider through its file API and later calls reference the returned id:
+
+    openai   client.files.create(purpose="vision")  -> input_image.file_id (Responses API)
+    gemini   genai.upload_file()                    -> file_data.file_uri
+
+Handles are keyed by (provider, account, sha256 of the image bytes) and kept in
+output/_index/image_handles.json with their expiry, so they survive restarts.
+The account is a hash of the API key, because files are only visible to the
+key/project that uploaded them.
+A handle is dropped IMAGE_HANDLE_MARGIN seconds before it expires (Gemini deletes
+files after 48 h; OpenAI keeps them, the app's TTL applies).  When a
+provider has no file API, the upload fails, or a call rejects the handle,
+the caller falls back to inline data: `fallback` forgets a rejected handle,
+and a provider whose upload failed is not tried again for IMAGE_HANDLE_RETRY
+seconds.
+
+    IMAGE_HANDLES          1 (default) / 0 to always send inline data
+    IMAGE_HANDLE_TTL       lifetime of an OpenAI handle in seconds (default 86400)
+    IMAGE_HANDLE_MARGIN    re-upload this long before expiry (default 600)
+    IMAGE_HANDLE_MIN_BYTES smaller images are always sent inline (default 65536)
+    IMAGE_HANDLE_RETRY     retry uploads this long after one failed (default 300)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+APP_ROOT = Path(__file__).parent.resolve()
+CACHE_PATH = APP_ROOT / "output" / "_index" / "image_handles.json"
+ENABLED = os.getenv("IMAGE_HANDLES", "1") in {"1", "true", "on"}
+TTL = float(os.getenv("IMAGE_HANDLE_TTL", "86400"))
+MARGIN = float(os.getenv("IMAGE_HANDLE_MARGIN", "600"))
+MIN_BYTES = int(os.getenv("IMAGE_HANDLE_MIN_BYTES", "65536"))
+RETRY_AFTER = float(os.getenv("IMAGE_HANDLE_RETRY", "300"))
+
+log = logging.getLogger("api")
+
+
+def image_digest(image_path: Path) -> str:
+    h = hashlib.sha256()
+    with open(image_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def account_of(api_key: str | None) -> str:
+    """Short, non-reversible id of the API key the handle belongs to."""
+    return hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+
+
+class HandleCache:
+    """(provider, account, image sha256) -> {"id", "uri", "mime", "expires_at"}, persisted as JSON."""
+
+    def __init__(self, path: Path = CACHE_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict] = {}
+        self._mtime = None
+        self._unsupported: dict[str, float] = {}  # provider:account -> monotonic time its upload failed
+        self._busy: dict[str, threading.Lock] = {}  # one upload per key at a time
+        self.stats = {"hits": 0, "uploads": 0, "expired": 0, "invalidated": 0, "fallbacks": 0}
+
+    def _load(self) -> None:
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            try:
+                self._entries = json.loads(self.path.read_text("utf-8"))
+            except (OSError, json.JSONDecodeError):
+                self._entries = {}
+            self._mtime = mtime
+
+    def _save(self) -> None:
+        now = time.time()
+        self._entries = {k: v for k, v in self._entries.items() if v.get("expires_at", 0) > now}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._entries, indent=1), "utf-8")
+        os.replace(tmp, self.path)
+        self._mtime = self.path.stat().st_mtime
+
+    def lookup(self, key: str) -> dict | None:
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.get("expires_at", 0) - MARGIN <= time.time():
+                self._entries.pop(key, None)
+                self.stats["expired"] += 1
+                self._save()
+                return None
+            self.stats["hits"] += 1
+            return entry
+
+    def store(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._load()
+            self._entries[key] = entry
+            self.stats["uploads"] += 1
+            self._save()
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._load()
+            if self._entries.pop(key, None) is not None:
+                self.stats["invalidated"] += 1
+                self._save()
+
+    def get_or_upload(self, provider: str, account: str, image_path: Path, upload) -> tuple[str, dict] | None:
+        """
+        (key, handle) for the image, uploading it with `upload(path) -> handle` on a
+        miss; None when inline data should be sent instead.
+        """
+        if not ENABLED or self._upload_failed_recently(f"{provider}:{account}"):
+            return None
+        try:
+            if Path(image_path).stat().st_size < MIN_BYTES:
+                return None
+        except OSError:
+            return None
+        key = f"{provider}:{account}:{image_digest(image_path)}"
+        entry = self.lookup(key)
+        if entry is not None:
+            return key, entry
+        with self._lock:
+            busy = self._busy.setdefault(key, threading.Lock())
+        with busy:        # a concurrent retry of the same image waits for this upload
+            entry = self.lookup(key)
+            if entry is not None:
+                return key, entry
+            t0 = time.monotonic()
+            try:
+                entry = upload(Path(image_path))
+            except Exception as e:
+                self._unsupported[f"{provider}:{account}"] = time.monotonic()
+                self.stats["fallbacks"] += 1
+                log.warning("image upload failed, sending inline", extra={"provider": provider, "error": str(e)})
+                return None
+            entry.setdefault("expires_at", time.time() + TTL)
+            entry["uploaded_at"] = time.time()
+            self.store(key, entry)
+            log.info("image uploaded", extra={"provider": provider, "handle": entry.get("id"),
+                                              "seconds": round(time.monotonic() - t0, 3)})
+            return key, entry
+
+    def _upload_failed_recently(self, target: str) -> bool:
+        failed_at = self._unsupported.get(target)
+        if failed_at is None:
+            return False
+        if time.monotonic() - failed_at < RETRY_AFTER:
+            return True
+        self._unsupported.pop(target, None)     # outage over or key fixed: try uploading again
+        return False
+
+    def fallback(self, key: str, error: Exception) -> None:
+        """A call rejected the handle (deleted/expired upstream): forget it, the caller goes inline."""
+        self.invalidate(key)
+        self.stats["fallbacks"] += 1
+        log.warning("image handle rejected, sending inline", extra={"key": key, "error": str(error)})
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._load()
+            return {"entries": len(self._entries), **self.stats}
+
+
+_cache: HandleCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> HandleCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HandleCache()
+    return _cache
+
+
+def is_handle_error(e: Exception) -> bool:
+    """A provider error that means "this file id/uri is unknown or expired" (not a rate limit)."""
+    status = getattr(e, "status_code", None) or getattr(e, "code", None)
+    msg = str(e).lower()
+    return status in (400, 403, 404) and ("file" in msg or "not found" in msg or "expired" in msg)
@@ -0,0 +1,154 @@
+# image_handles_check.py
+"""
+Offline check of the image-handle path (image_handles.py, openai_api_handler.py).
+
+A local HTTP stub stands in for the OpenAI /files, /responses and
+/chat/completions endpoints (OPENAI_BASE_URL points at it), and the handle
+cache is written to a temporary file.  Scenarios:
+
+    reuse          first call uploads, later calls send only the file id
+    deleted        upstream 404 on the file id: handle forgotten, call retried inline
+    responses 400  any other Responses API error: call retried inline, handle kept
+    upload fails   inline data until IMAGE_HANDLE_RETRY has passed, then uploads again
+    small image    below IMAGE_HANDLE_MIN_BYTES: always inline
+
+    python image_handles_check.py
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+class Stub:
+    """Recorded endpoint calls, uploaded file ids and the failures to inject."""
+
+    def __init__(self):
+        self.calls: list[str] = []
+        self.files: set[str] = set()
+        self.fail_upload = False
+        self.fail_responses = False
+
+
+def _handler(stub: Stub):
+    class H(BaseHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+
+        def _send(self, code: int, obj: dict) -> None:
+            body = json.dumps(obj).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            endpoint = self.path.rsplit("/", 1)[-1]
+            stub.calls.append(endpoint)
+            if endpoint == "files":
+                if stub.fail_upload:
+                    return self._send(400, {"error": {"message": "purpose vision not supported", "type": "invalid_request_error"}})
+                fid = f"file-{len(stub.files) + 1}"
+                stub.files.add(fid)
+                return self._send(200, {"id": fid, "object": "file", "bytes": len(body), "created_at": 0,
+                                        "filename": "screen.png", "purpose": "vision", "status": "processed"})
+            data = json.loads(body)
+            if endpoint == "responses":
+                if stub.fail_responses:
+                    return self._send(400, {"error": {"message": "Unsupported endpoint for this model", "type": "invalid_request_error"}})
+                fid = data["input"][0]["content"][1]["file_id"]
+                if fid not in stub.files:
+                    return self._send(404, {"error": {"message": f"No such File object: {fid}", "type": "invalid_request_error"}})
+                return self._send(200, {
+                    "id": "resp_1", "object": "response", "created_at": 0, "status": "completed", "model": data["model"],
+                    "output": [{"type": "message", "id": "m1", "role": "assistant", "status": "completed",
+                                "content": [{"type": "output_text", "text": "```html\n<p>file</p>\n```", "annotations": []}]}],
+                    "parallel_tool_calls": False, "tool_choice": "auto", "tools": []})
+            return self._send(200, {
+                "id": "c1", "object": "chat.completion", "created": 0, "model": data["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "```html\n<p>inline</p>\n```"}}]})
+    return H
+
+
+def run_checks(tmp: Path) -> list[str]:
+    """All scenarios against a fresh stub and handle cache; returns the failed checks."""
+    stub = Stub()
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _handler(stub))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{srv.server_port}/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-check"
+
+    import image_handles
+    from openai_api_handler import call_openai_api
+
+    image_handles.ENABLED = True
+    cache = image_handles._cache = image_handles.HandleCache(tmp / "image_handles.json")
+    big, small = tmp / "big.png", tmp / "small.png"
+    big.write_bytes(b"\x89PNG\r\n\x1a\n" + os.urandom(image_handles.MIN_BYTES * 2))
+    small.write_bytes(b"\x89PNG\r\n\x1a\n" + os.urandom(1024))
+    failed = []
+
+    def call(path: Path, expect: str, endpoints: list[str], what: str) -> None:
+        start = len(stub.calls)
+        try:
+            out = call_openai_api(path, "gpt-4o", 100) or ""
+        except Exception as e:
+            out = f"raised {e!r}"
+        sent = stub.calls[start:]
+        if f"<p>{expect}</p>" not in out or sent != endpoints:
+            failed.append(f"{what}: got {out.strip()[:60]!r} via {sent}, expected {expect} via {endpoints}")
+
+    try:
+        call(big, "file", ["files", "responses"], "first call")
+        call(big, "file", ["responses"], "reuse")
+        call(big, "file", ["responses"], "reuse again")
+
+        stub.files.clear()          # deleted upstream
+        call(big, "inline", ["responses", "completions"], "deleted handle")
+        if cache.snapshot()["entries"] != 0:
+            failed.append("deleted handle: still cached")
+        call(big, "file", ["files", "responses"], "re-upload")
+
+        stub.fail_responses = True
+        call(big, "inline", ["responses", "completions"], "responses 400")
+        if cache.snapshot()["entries"] != 1:
+            failed.append("responses 400: handle was dropped")
+        stub.fail_responses = False
+
+        stub.files.clear()
+        cache.invalidate(next(iter(json.loads((tmp / "image_handles.json").read_text()))))
+        stub.fail_upload = True
+        call(big, "inline", ["files", "completions"], "upload fails")
+        stub.fail_upload = False
+        call(big, "inline", ["completions"], "within retry window")
+        saved, image_handles.RETRY_AFTER = image_handles.RETRY_AFTER, 0
+        try:
+            call(big, "file", ["files", "responses"], "after retry window")
+        finally:
+            image_handles.RETRY_AFTER = saved
+
+        call(small, "inline", ["completions"], "small image")
+    finally:
+        srv.shutdown()
+    return failed
+
+
+def main(argv=None) -> int:
+    argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]).parse_args(argv)
+    with tempfile.TemporaryDirectory() as d:
+        failed = run_checks(Path(d))
+    print("image handles", "ok" if not failed else "FAILED")
+    for f in failed:
+        print(f"        - {f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
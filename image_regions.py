@@ -0,0 +1,299 @@
+# image_regions.py
+"""
+Region-level conversion with a cross-run component cache.
+
+A screenshot is cut into layout regions (application banner, screen
+tabs, toolbars, sidebar, content ...) using NumPy projection profiles of
+Pillow-decoded pixels: flat column gutters separate columns and rows
+without horizontal edge energy separate bands inside a column.  Each region is fingerprinted (dHash + a 32x32 thumbnail);
+regions seen in an earlier conversion reuse the cached HTML/CSS/manifest
+fragment and only unseen regions are sent to the model.  The fragments
+are then stitched back into generated.html, style.css and manifest.json.
+"""
+import json
+import os
+import re
+import uuid
+from pathlib import Path
+
+from css_tools import scope_css
+
+APP_ROOT = Path(__file__).parent.resolve()
+CACHE_ROOT = APP_ROOT / "output" / "_region_cache"
+
+COL_STD_THRESHOLD = float(os.getenv("REGION_COL_STD", "3.0"))   # column gutter detection
+ROW_EDGE_THRESHOLD = float(os.getenv("REGION_ROW_EDGE", "0.5"))  # mean |dI/dx| of a content row
+MIN_GAP = int(os.getenv("REGION_MIN_GAP", "6"))          # px of flat rows that separate bands
+MIN_HEIGHT = int(os.getenv("REGION_MIN_HEIGHT", "32"))   # smaller bands merge into a neighbour
+MAX_REGIONS = int(os.getenv("REGION_MAX", "8"))
+MAX_DISTANCE = int(os.getenv("REGION_MAX_DISTANCE", "3"))
+THUMB_MAD = float(os.getenv("REGION_THUMB_MAD", "6.0"))  # mean abs diff (0-255) on 32x32 thumbs
+
+
+# ---------- segmentation ----------
+
+def _bands(active, min_gap: int) -> list[list[int]]:
+    """[start, end) runs of active rows/columns, bridging inactive gaps shorter than min_gap."""
+    bands, start, gap = [], None, 0
+    for y, on in enumerate(active):
+        if on:
+            if start is None:
+                start = y
+            gap = 0
+        elif start is not None:
+            gap += 1
+            if gap >= min_gap:
+                bands.append([start, y - gap + 1])
+                start, gap = None, 0
+    if start is not None:
+        bands.append([start, len(active) - gap])
+    return bands
+
+
+def _merge_bands(bands: list[list[int]], min_size: int, max_count: int) -> list[list[int]]:
+    """Fold undersized bands into a neighbour, then merge across the narrowest gaps."""
+    merged = []
+    for b in bands:
+        if merged and merged[-1][1] - merged[-1][0] < min_size:
+            merged[-1][1] = b[1]
+        else:
+            merged.append(list(b))
+    if len(merged) > 1 and merged[-1][1] - merged[-1][0] < min_size:
+        merged[-2][1] = merged.pop()[1]
+    while len(merged) > max_count:
+        gaps = [merged[i + 1][0] - merged[i][1] for i in range(len(merged) - 1)]
+        i = gaps.index(min(gaps))
+        merged[i][1] = merged.pop(i + 1)[1]
+    return merged
+
+
+def _pad_to_gaps(bands: list[list[int]], size: int) -> list[tuple[int, int]]:
+    """Extend each band to the middle of the surrounding gaps so the bands tile [0, size)."""
+    out = []
+    for i, (lo, hi) in enumerate(bands):
+        a = 0 if i == 0 else (bands[i - 1][1] + lo) // 2
+        b = size if i == len(bands) - 1 else (hi + bands[i + 1][0]) // 2
+        out.append((a, b))
+    return out
+
+
+def segment_regions(image, min_gap: int = MIN_GAP, min_height: int = MIN_HEIGHT,
+                    max_regions: int = MAX_REGIONS) -> list[dict]:
+    """
+    Split a PIL image into layout regions using projection profiles.
+
+    Columns (e.g. a sidebar next to the main area) are separated where the
+    per-column intensity variance stays flat over a gutter; each column is
+    then cut into horizontal bands where rows carry no horizontal edge
+    energy.  Returns dicts with col/left/right/top/bottom, in reading order.
+    """
+    import numpy as np
+
+    gray = np.asarray(image.convert("L"), dtype=np.float32)
+    height, width = gray.shape
+
+    col_bands = _bands(gray.std(axis=0) > COL_STD_THRESHOLD, 2 * min_gap) or [[0, width]]
+    columns = _pad_to_gaps(_merge_bands(col_bands, width // 10, 3), width)
+
+    regions = []
+    for c, (left, right) in enumerate(columns):
+        part = gray[:, left:right]
+        energy = np.abs(np.diff(part, axis=1)).mean(axis=1) if right - left > 1 else np.zeros(height)
+        row_bands = _bands(energy > ROW_EDGE_THRESHOLD, min_gap) or [[0, height]]
+        per_col = max(1, max_regions // len(columns))
+        for top, bottom in _pad_to_gaps(_merge_bands(row_bands, min_height, per_col), height):
+            regions.append({"col": c, "left": left, "right": right, "top": top, "bottom": bottom})
+    return regions
+
+
+# ---------- fingerprints / cache ----------
+
+def _thumb(image):
+    import numpy as np
+    from PIL import Image
+
+    return np.asarray(image.convert("L").resize((32, 32), Image.BILINEAR), dtype=np.uint8)
+
+
+def _cache_index():
+    from phash_index import PHashIndex
+    return PHashIndex(CACHE_ROOT / "index.jsonl")
+
+
+def lookup_fragment(crop, index=None) -> dict | None:
+    """Cached fragment for a visually identical region of (almost) the same size, if any."""
+    import numpy as np
+    from phash_index import dhash
+
+    index = index or _cache_index()
+    w, h = crop.size
+    thumb = _thumb(crop).astype(np.int16)
+    for cand in index.nearest(dhash(crop), MAX_DISTANCE, limit=10):
+        if abs(cand.get("w", 0) - w) > 0.05 * w or abs(cand.get("h", 0) - h) > 0.05 * h:
+            continue
+        frag_dir = CACHE_ROOT / cand["workdir"]
+        try:
+            cached = np.load(frag_dir / "thumb.npy").astype(np.int16)
+            if float(np.abs(cached - thumb).mean()) > THUMB_MAD:
+                continue
+            return {
+                "id": cand["workdir"],
+                "html": (frag_dir / "fragment.html").read_text("utf-8"),
+                "css": (frag_dir / "fragment.css").read_text("utf-8"),
+                "containers": json.loads((frag_dir / "fragment.json").read_text("utf-8")),
+            }
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+def store_fragment(crop, fragment: dict, index=None) -> str:
+    import numpy as np
+    from phash_index import dhash
+
+    index = index or _cache_index()
+    frag_id = uuid.uuid4().hex[:16]
+    frag_dir = CACHE_ROOT / frag_id
+    frag_dir.mkdir(parents=True, exist_ok=True)
+    (frag_dir / "fragment.html").write_text(fragment["html"], "utf-8")
+    (frag_dir / "fragment.css").write_text(fragment["css"], "utf-8")
+    (frag_dir / "fragment.json").write_text(json.dumps(fragment["containers"], indent=2), "utf-8")
+    np.save(frag_dir / "thumb.npy", _thumb(crop))
+    w, h = crop.size
+    index.add(dhash(crop), frag_id, w=w, h=h)
+    return frag_id
+
+
+# ---------- fragments / stitching ----------
+
+def body_inner(html: str) -> str:
+    """Inner HTML of <body> (or the whole text when there is no body)."""
+    m = re.search(r"<body[^>]*>([\s\S]*?)(?:</body>|$)", html or "", re.I)
+    return (m.group(1) if m else (html or "")).strip()
+
+
+def manifest_containers(manifest_text: str) -> list[dict]:
+    try:
+        mf = json.loads(manifest_text or "{}")
+    except json.JSONDecodeError:
+        return []
+    return (mf.get("page", {}) or {}).get("containers") or mf.get("containers") or []
+
+
+def fragment_from_response(raw: str) -> dict:
+    from siebel_generator import parse_fenced_sections
+
+    manifest, html, css = parse_fenced_sections(raw or "")
+    return {"html": body_inner(html), "css": css or "", "containers": manifest_containers(manifest)}
+
+
+def _scope_containers(containers: list[dict], scope: str) -> list[dict]:
+    """Top-level container selectors are resolved against the whole page: prefix the region."""
+    scoped = []
+    for c in containers:
+        c = dict(c)
+        if c.get("selector"):
+            c["selector"] = f"{scope} {c['selector']}"
+        scoped.append(c)
+    return scoped
+
+
+def stitch_fragments(fragments: list[dict], title: str = "Generated",
+                     columns: list[float] | None = None) -> tuple[str, str, dict]:
+    """
+    Concatenate region fragments (in reading order) into page HTML, CSS and manifest.
+
+    Each fragment may carry "col" (column index); `columns` gives the column
+    widths in percent when the page was split into side-by-side columns.
+    """
+    cols: dict[int, list[str]] = {}
+    css, containers = [], []
+    for i, frag in enumerate(fragments, 1):
+        cols.setdefault(frag.get("col", 0), []).append(
+            f'<div class="region region-{i}">\n{frag["html"]}\n</div>')
+        if frag["css"].strip():
+            css.append(f"/* region {i} */\n" + scope_css(frag["css"], f".region-{i}"))
+        containers.extend(_scope_containers(frag["containers"], f".region-{i}"))
+
+    if len(cols) > 1:
+        widths = columns or [100.0 / len(cols)] * len(cols)
+        body = ['<div class="region-columns">']
+        for c in sorted(cols):
+            body.append(f'<div class="region-column region-column-{c}">\n' + "\n".join(cols[c]) + "\n</div>")
+        body.append("</div>")
+        css.insert(0, ".region-columns{display:flex;align-items:stretch}\n" + "\n".join(
+            f".region-column-{c}{{flex:0 0 {widths[c]:.2f}%;min-width:0}}" for c in sorted(cols)))
+    else:
+        body = [b for c in sorted(cols) for b in cols[c]]
+
+    html = ("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+            f"<title>{title}</title>\n<link rel=\"stylesheet\" href=\"style.css\">\n</head>\n<body>\n"
+            + "\n".join(body) + "\n</body>\n</html>\n")
+    manifest = {"page": {"title": title, "layout": "mixed", "containers": containers}}
+    return html, "\n\n".join(css), manifest
+
+
+# ---------- conversion ----------
+
+def convert_by_regions(image_path: Path, out: Path, model: str, max_tokens: int) -> dict:
+    """
+    Convert `image_path` region by region, reusing cached fragments.
+
+    Writes raw_response.txt, generated.html, style.css, manifest.json and
+    regions.json (per-region bounds, cache hit/miss, fragment id) into `out`.
+    """
+    from PIL import Image
+    from siebel_generator import _call_model
+
+    index = _cache_index()
+    crops_dir = out / "regions"
+    crops_dir.mkdir(parents=True, exist_ok=True)
+    with Image.open(image_path) as im:
+        im.load()
+        image = im.convert("RGB")
+
+    regions = segment_regions(image)
+    fragments, report, raws, errors = [], [], [], []
+    for i, reg in enumerate(regions, 1):
+        crop = image.crop((reg["left"], reg["top"], reg["right"], reg["bottom"]))
+        entry = {"region": i, **reg}
+        frag = lookup_fragment(crop, index)
+        if frag:
+            entry.update(cached=True, fragment=frag["id"])
+        else:
+            crop_path = crops_dir / f"region_{i}.png"
+            crop.save(crop_path)
+            raw, err = _call_model(crop_path, model, max_tokens)
+            raws.append(f"===== region {i} {reg} =====\n{raw or err or ''}")
+            if not raw:
+                errors.append(f"region {i}: {err or 'empty response'}")
+                entry.update(cached=False, error=err or "empty response")
+                report.append(entry)
+                continue
+            frag = fragment_from_response(raw)
+            frag["id"] = store_fragment(crop, frag, index) if frag["html"] else None
+            entry.update(cached=False, fragment=frag["id"])
+        fragments.append({**frag, "col": reg["col"]})
+        report.append(entry)
+
+    if not any(f["html"] for f in fragments):
+        # nothing to stitch: fail like a single conversion so the run is never indexed or reused
+        msg = "Conversion failed: " + ("; ".join(errors) or "no region produced HTML")
+        (out / "raw_response.txt").write_text(msg, "utf-8")
+        (out / "generated.html").write_text(
+            f"<html><body><h2>Conversion failed</h2><pre>{msg}</pre></body></html>", "utf-8")
+        (out / "style.css").write_text("", "utf-8")
+        (out / "manifest.json").write_text("{}", "utf-8")
+    else:
+        col_bounds = sorted({(r["col"], r["left"], r["right"]) for r in regions})
+        widths = [100.0 * (right - left) / image.width for _, left, right in col_bounds]
+        html, css, manifest = stitch_fragments(fragments, title=Path(image_path).stem, columns=widths)
+        (out / "raw_response.txt").write_text("\n\n".join(raws) or "(all regions served from cache)", "utf-8")
+        (out / "generated.html").write_text(html, "utf-8")
+        (out / "style.css").write_text(css, "utf-8")
+        (out / "manifest.json").write_text(json.dumps(manifest, indent=2), "utf-8")
+    stats = {"regions": report, "cached": sum(1 for r in report if r.get("cached")),
+             "converted": sum(1 for r in report if not r.get("cached")), "errors": errors,
+             "fragments": sum(1 for f in fragments if f["html"])}
+    (out / "regions.json").write_text(json.dumps(stats, indent=2), "utf-8")
+    return stats
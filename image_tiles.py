@@ -0,0 +1,262 @@
+# image_tiles.py
+"""
+Tiled conversion for very tall (or very wide) screenshots.
+
+A full-page Siebel screen of 1600x6000 px is slow as a single call and
+often runs into the output token limit.  The image is cut along its long
+axis at natural whitespace seams (rows whose pixel variance is ~0, found
+with NumPy on the Pillow-decoded image), the tiles are converted
+concurrently through siebel_generator._call_model and the fragments are
+stitched back in order with image_regions.stitch_fragments, so wall-clock
+time follows the slowest tile instead of the sum.
+
+Tiles are converted independently, so they may reuse the same class names
+or ids with different meanings.  Before stitching, a class that appears in
+several tiles keeps its name where its CSS rules match the first tile using
+it; each different set of rules becomes t<i>-<class> (i = first tile with
+that variant, later tiles with the same rules share it).  Repeated ids become
+<id>-t<i>.  The renames are applied to the HTML, the CSS selectors and the
+manifest selectors, and recorded in tiles.json.
+
+    TILE_HEIGHT    target tile length along the long axis (default 1400 px)
+    TILE_SLACK     how far before the target a seam may be chosen (default 400 px)
+    TILE_MIN       shortest tile; a shorter remainder joins the previous tile (default 200 px)
+    TILE_SEAM_VAR  max row variance (0-255 gray levels^2) of a whitespace seam (default 4)
+    TILE_WORKERS   concurrent model calls (default 4)
+"""
+import contextvars
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from css_tools import split_rules, split_selectors
+from image_regions import _bands, fragment_from_response, stitch_fragments
+
+TILE_HEIGHT = int(os.getenv("TILE_HEIGHT", "1400"))
+TILE_SLACK = int(os.getenv("TILE_SLACK", "400"))
+TILE_MIN = int(os.getenv("TILE_MIN", "200"))
+SEAM_VAR = float(os.getenv("TILE_SEAM_VAR", "4"))
+WORKERS = int(os.getenv("TILE_WORKERS", "4"))
+
+_CLASS_ATTR = re.compile(r'((?<![\w-])class\s*=\s*)(["\'])(.*?)\2', re.I | re.S)
+_ID_ATTR = re.compile(r'((?<![\w-])(?:id|for)\s*=\s*)(["\'])(.*?)\2', re.I)
+_SEL_NAME = re.compile(r"([.#])(-?[_a-zA-Z][\w-]*)")
+
+
+# ---------- seams ----------
+
+def find_seams(gray, target: int = TILE_HEIGHT, slack: int = TILE_SLACK, min_tile: int = TILE_MIN) -> list[int]:
+    """
+    Cut positions along axis 0 of a 2-D gray array.
+
+    Each cut lies in [start + target - slack, start + target]: the middle of
+    the longest run of flat rows there, or the quietest row when the window
+    has no whitespace.  The last tile is never shorter than min_tile.
+    """
+    import numpy as np
+
+    n = gray.shape[0]
+    var = gray.var(axis=1)
+    flat = var <= SEAM_VAR
+    cuts, start = [], 0
+    while n - start > target + min_tile:
+        lo = start + max(min_tile, target - slack)
+        hi = min(start + target, n - min_tile)
+        runs = _bands(flat[lo:hi], 1)
+        if runs:
+            a, b = max(runs, key=lambda r: (r[1] - r[0], r[0]))
+            cut = lo + (a + b) // 2
+        else:
+            cut = lo + int(np.argmin(var[lo:hi]))
+        cuts.append(cut)
+        start = cut
+    return cuts
+
+
+def plan_tiles(image) -> tuple[str, list[tuple[int, int]]]:
+    """("rows" | "columns", [(start, end), ...]) along the image's long axis; one tile when small."""
+    import numpy as np
+
+    gray = np.asarray(image.convert("L"), dtype=np.float32)
+    axis = "columns" if image.width > image.height else "rows"
+    if axis == "columns":
+        gray = gray.T
+    bounds = [0, *find_seams(gray), gray.shape[0]]
+    return axis, list(zip(bounds, bounds[1:]))
+
+
+# ---------- class / id namespacing ----------
+
+def _html_classes(html: str) -> set[str]:
+    return {c for m in _CLASS_ATTR.finditer(html) for c in m.group(3).split()}
+
+
+def _html_ids(html: str) -> set[str]:
+    return {m.group(3).strip() for m in _ID_ATTR.finditer(html) if m.group(1).lower().startswith("id")}
+
+
+def _class_rules(css: str, cls: str) -> tuple:
+    """Normalised (selector, declarations) of every rule that mentions .cls, for comparing tiles."""
+    pat = re.compile(rf"\.{re.escape(cls)}(?![\w-])")
+    rules = []
+    for prelude, body in split_rules(css):
+        if body is None:
+            continue
+        if prelude.startswith("@"):
+            rules.extend((prelude, *r) for r in _class_rules(body, cls))
+        elif pat.search(prelude):
+            decls = tuple(sorted("".join(d.split()) for d in body.split(";") if d.strip()))
+            rules.append((" ".join(prelude.split()), decls))
+    return tuple(sorted(rules))
+
+
+def _rename_selector(sel: str, classes: dict, ids: dict) -> str:
+    def sub(m):
+        table = classes if m.group(1) == "." else ids
+        return m.group(1) + table.get(m.group(2), m.group(2))
+    return _SEL_NAME.sub(sub, sel)
+
+
+def _rename_css(css: str, classes: dict, ids: dict) -> str:
+    out = []
+    for prelude, body in split_rules(css):
+        if body is None:
+            out.append(prelude + ";")
+        elif prelude.lower().startswith(("@media", "@supports", "@container", "@layer")):
+            out.append(f"{prelude}{{{_rename_css(body, classes, ids)}}}")
+        elif prelude.startswith("@"):
+            out.append(f"{prelude}{{{body}}}")
+        else:
+            sels = [_rename_selector(s, classes, ids) for s in split_selectors(prelude)]
+            out.append(f"{', '.join(sels)}{{{body}}}")
+    return "\n".join(out)
+
+
+def _rename_manifest(node, classes: dict, ids: dict):
+    if isinstance(node, list):
+        return [_rename_manifest(v, classes, ids) for v in node]
+    if isinstance(node, dict):
+        return {k: _rename_selector(v, classes, ids) if isinstance(v, str) and "selector" in k
+                else _rename_manifest(v, classes, ids) for k, v in node.items()}
+    return node
+
+
+def _rename_html(html: str, classes: dict, ids: dict) -> str:
+    html = _CLASS_ATTR.sub(lambda m: m.group(1) + m.group(2) + " ".join(
+        classes.get(c, c) for c in m.group(3).split()) + m.group(2), html)
+    return _ID_ATTR.sub(lambda m: m.group(1) + m.group(2) + ids.get(m.group(3).strip(), m.group(3))
+                        + m.group(2), html)
+
+
+def namespace_fragments(fragments: list[dict]) -> dict:
+    """Resolve class/id collisions between tile fragments in place; returns the rename report."""
+    variants: dict[str, dict] = {}       # class -> {rules: name}; the first variant keeps the name
+    seen_ids: set[str] = set()
+    report = {"renamed_classes": {}, "renamed_ids": {}, "shared_classes": []}
+    for i, frag in enumerate(fragments, 1):
+        classes, ids = {}, {}
+        for cls in sorted(_html_classes(frag["html"])):
+            rules = _class_rules(frag["css"], cls)
+            seen = variants.setdefault(cls, {})
+            if rules in seen:
+                report["shared_classes"].append(cls)
+            else:
+                seen[rules] = cls if not seen else f"t{i}-{cls}"
+            if seen[rules] != cls:
+                classes[cls] = seen[rules]
+        for id_ in sorted(_html_ids(frag["html"])):
+            if id_ in seen_ids:
+                ids[id_] = f"{id_}-t{i}"
+            seen_ids.add(id_)
+        if classes or ids:
+            frag["html"] = _rename_html(frag["html"], classes, ids)
+            frag["css"] = _rename_css(frag["css"], classes, ids)
+            frag["containers"] = _rename_manifest(frag["containers"], classes, ids)
+            report["renamed_classes"].update({f"tile {i}: {k}": v for k, v in classes.items()})
+            report["renamed_ids"].update({f"tile {i}: {k}": v for k, v in ids.items()})
+    report["shared_classes"] = sorted(set(report["shared_classes"]))
+    return report
+
+
+# ---------- conversion ----------
+
+def _convert_tile(crop_path: Path, model: str, max_tokens: int) -> tuple[str | None, str | None, float]:
+    from siebel_generator import _call_model
+
+    t0 = time.perf_counter()
+    raw, err = _call_model(crop_path, model, max_tokens)
+    return raw, err, time.perf_counter() - t0
+
+
+def convert_tiled(image_path: Path, out: Path, model: str, max_tokens: int) -> dict | None:
+    """
+    Convert `image_path` tile by tile, concurrently.
+
+    Writes raw_response.txt, generated.html, style.css, manifest.json and
+    tiles.json into `out`.  Returns None (nothing written) when the image
+    fits in one tile, so the caller does a normal conversion.
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as im:
+        im.load()
+        image = im.convert("RGB")
+    axis, spans = plan_tiles(image)
+    if len(spans) < 2:
+        return None
+
+    tiles_dir = out / "tiles"
+    tiles_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, (a, b) in enumerate(spans, 1):
+        box = (0, a, image.width, b) if axis == "rows" else (a, 0, b, image.height)
+        paths.append(tiles_dir / f"tile_{i}.png")
+        image.crop(box).save(paths[-1])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, min(WORKERS, len(paths))), thread_name_prefix="tile") as pool:
+        # one copied context per task: the scheduler priority and log context follow each call
+        futures = [pool.submit(contextvars.copy_context().run, _convert_tile, p, model, max_tokens)
+                   for p in paths]
+        results = [f.result() for f in futures]
+    wall = time.perf_counter() - t0
+
+    fragments, report, raws, errors = [], [], [], []
+    for i, ((a, b), (raw, err, seconds)) in enumerate(zip(spans, results), 1):
+        entry = {"tile": i, "start": a, "end": b, "seconds": round(seconds, 3)}
+        raws.append(f"===== tile {i} {axis} {a}-{b} =====\n{raw or err or ''}")
+        if not raw:
+            errors.append(f"tile {i}: {err or 'empty response'}")
+            entry["error"] = err or "empty response"
+        else:
+            frag = fragment_from_response(raw)
+            fragments.append({**frag, "col": i - 1 if axis == "columns" else 0})
+            entry["chars"] = len(raw)
+        report.append(entry)
+
+    stats = {"axis": axis, "tiles": report, "errors": errors, "wall_seconds": round(wall, 3),
+             "sum_seconds": round(sum(r[2] for r in results), 3)}
+    if not fragments:
+        msg = "Conversion failed: " + "; ".join(errors)
+        (out / "raw_response.txt").write_text(msg, "utf-8")
+        (out / "generated.html").write_text(
+            f"<html><body><h2>Conversion failed</h2><pre>{msg}</pre></body></html>", "utf-8")
+        (out / "style.css").write_text("", "utf-8")
+        (out / "manifest.json").write_text("{}", "utf-8")
+    else:
+        stats.update(namespace_fragments(fragments))
+        widths = [100.0 * (b - a) / image.width for a, b in spans] if axis == "columns" else None
+        if widths and len(fragments) < len(spans):     # failed tiles leave no column behind
+            widths = [w for w, r in zip(widths, report) if "error" not in r]
+            for c, frag in enumerate(fragments):
+                frag["col"] = c
+        html, css, manifest = stitch_fragments(fragments, title=Path(image_path).stem, columns=widths)
+        (out / "raw_response.txt").write_text("\n\n".join(raws), "utf-8")
+        (out / "generated.html").write_text(html, "utf-8")
+        (out / "style.css").write_text(css, "utf-8")
+        (out / "manifest.json").write_text(json.dumps(manifest, indent=2), "utf-8")
+    (out / "tiles.json").write_text(json.dumps(stats, indent=2), "utf-8")
+    return stats
@@ -0,0 +1,79 @@
+# importtime_report.py
+"""
+Cold-start budget check for the web app.
+
+Runs `python -X importtime -c "import main_router"` in a fresh interpreter,
+prints the slowest imports and fails (exit code 1) when the cumulative
+import time exceeds the budget or when a provider SDK / parser that must
+be loaded lazily shows up at start-up.
+
+    python importtime_report.py                 # default budget
+    python importtime_report.py --budget-ms 300 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+APP_ROOT = Path(__file__).parent.resolve()
+
+# modules that must only be imported on first use (see provider_registry.py)
+LAZY_MODULES = ("openai", "google.generativeai", "bs4", "lxml", "markdown")
+
+
+def measure_imports(target: str = "main_router") -> list[dict]:
+    """Return one entry per imported module: name, self_us, cumulative_us."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=APP_ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_part, cum_part, name = line.split("|", 2)
+            self_us = int(self_part.split(":", 1)[1])
+            cum_us = int(cum_part)
+        except ValueError:
+            continue
+        name = name[1:]  # drop the single separator space, keep nesting indent
+        rows.append({"name": name.strip(), "depth": (len(name) - len(name.lstrip())) // 2,
+                     "self_us": self_us, "cumulative_us": cum_us})
+    return rows
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--target", default="main_router")
+    ap.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "400")))
+    ap.add_argument("--top", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    rows = measure_imports(args.target)
+    top = next((r for r in rows if r["name"] == args.target), None)
+    total_ms = (top["cumulative_us"] if top else sum(r["self_us"] for r in rows)) / 1000.0
+
+    print(f"import {args.target}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print("slowest imports (cumulative):")
+    for r in sorted(rows, key=lambda r: r["cumulative_us"], reverse=True)[: args.top]:
+        print(f"  {r['cumulative_us'] / 1000.0:8.1f} ms  {r['name']}")
+
+    eager = sorted({r["name"] for r in rows
+                    if any(r["name"] == m or r["name"].startswith(m + ".") for m in LAZY_MODULES)})
+    ok = True
+    if eager:
+        ok = False
+        print("FAIL: imported at start-up but should be lazy: " + ", ".join(eager[:10]))
+    if total_ms > args.budget_ms:
+        ok = False
+        print(f"FAIL: cold start {total_ms:.1f} ms exceeds budget {args.budget_ms:.0f} ms")
+    print("OK" if ok else "BUDGET EXCEEDED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# list_rows.py
+"""
+Collapse the record rows of a List applet into one row template.
+
+The model draws every visible record of a list, but Siebel renders
+<siebel:ListRows> from data, so a single annotated row is all the .swt
+needs.  Rows are the siblings matched by the applet's item_selector.
+Without one, they are found by subtree hashing: one post-order pass
+gives every element a hash of (tag, classes without state classes such as
+odd/even/selected, child hashes), and the largest group of identical
+siblings is taken as the rows.  A looser "shape" hash (tag, classes, child
+tags) is the fallback for rows that differ in their cell contents.
+
+The first row is kept, marked data-row-template / data-row-count, and the
+others are dropped.  The report gives the detected row count, the row
+selector and the columns: header text (a <th> row or thead before the
+rows) and the manifest fields found in each cell.
+
+    LIST_MIN_ROWS   identical siblings needed when there is no item_selector (default 3)
+"""
+import os
+import re
+
+from manifest_utils import _soup
+
+MIN_ROWS = int(os.getenv("LIST_MIN_ROWS", "3"))
+LIST_ROLES = {"list", "grid"}
+_STATE_CLASSES = {"odd", "even", "alt", "active", "selected", "highlight", "hover", "striped",
+                  "first", "last", "current", "focus", "checked"}
+_IDENT = re.compile(r"^-?[A-Za-z_][A-Za-z0-9_-]*$")
+
+
+def _classes(el) -> tuple:
+    return tuple(sorted(c for c in el.get("class") or [] if c.lower() not in _STATE_CLASSES))
+
+
+def _hashes(root) -> tuple[dict, dict, dict]:
+    """id(el) -> (subtree hash, shape hash, subtree size) for every element, in one post-order pass."""
+    from bs4 import Tag
+
+    strict, shape, size = {}, {}, {}
+    stack = [(root, False)]
+    while stack:
+        el, done = stack.pop()
+        kids = [c for c in el.children if isinstance(c, Tag)]
+        if not done:
+            stack.append((el, True))
+            stack.extend((k, False) for k in kids)
+            continue
+        cls = _classes(el)
+        strict[id(el)] = hash((el.name, cls, tuple(strict[id(k)] for k in kids)))
+        shape[id(el)] = hash((el.name, cls, tuple(k.name for k in kids)))
+        size[id(el)] = 1 + sum(size[id(k)] for k in kids)
+    return strict, shape, size
+
+
+def find_rows(root, item_selector: str | None = None) -> tuple[list, str]:
+    """(rows, detected_by) — siblings matched by item_selector, else the largest identical sibling group."""
+    from bs4 import Tag
+
+    if item_selector:
+        try:
+            matches = root.select(item_selector)
+        except Exception:
+            matches = []
+        if len(matches) >= 2:
+            parent = matches[0].parent
+            return [m for m in matches if m.parent is parent], "item_selector"
+
+    strict, shape, size = _hashes(root)
+    for kind, table in (("subtree_hash", strict), ("shape", shape)):
+        best, best_key = None, None
+        for parent in [root, *root.find_all(True)]:
+            groups: dict = {}
+            for k in parent.children:
+                if isinstance(k, Tag):
+                    groups.setdefault(table[id(k)], []).append(k)
+            for els in groups.values():
+                # a record row has cells; bare <li>/<tr> lists count too
+                if len(els) < MIN_ROWS or (size[id(els[0])] < 2 and els[0].name not in ("tr", "li")):
+                    continue
+                key = (len(els) * size[id(els[0])], len(els))
+                if best_key is None or key > best_key:
+                    best, best_key = els, key
+        if best:
+            return best, kind
+    return [], ""
+
+
+def _row_selector(rows) -> str:
+    """tag.common-classes of the rows (state classes ignored)."""
+    common = set(_classes(rows[0]))
+    for r in rows[1:]:
+        common &= set(_classes(r))
+    cls = sorted(c for c in common if _IDENT.match(c))
+    return rows[0].name + "".join(f".{c}" for c in cls)
+
+
+def _header_cells(first_row) -> list:
+    """Cells of the header row preceding the rows (<th> row or <thead>), if any."""
+    prev = first_row.find_previous_sibling()
+    if prev is not None and (prev.find("th") or "head" in " ".join(prev.get("class") or []).lower()):
+        return prev.find_all(recursive=False)
+    table = first_row.find_parent("table")
+    head = table.find("thead") if table is not None else None
+    tr = head.find("tr") if head is not None else None
+    return tr.find_all(recursive=False) if tr is not None else []
+
+
+def _columns(row, header: list, fields: list[dict]) -> list[dict]:
+    cells = row.find_all(recursive=False)
+    cols = []
+    for i, cell in enumerate(cells, 1):
+        label = header[i - 1].get_text(" ", strip=True) if i <= len(header) else ""
+        cols.append({"index": i, "label": label or cell.get("data-label") or f"Column {i}", "fields": []})
+    for f in fields:
+        sel = f.get("selector")
+        try:
+            node = row.select_one(sel) if sel else None
+        except Exception:
+            node = None
+        if node is None:
+            continue
+        for i, cell in enumerate(cells):
+            if node is cell or any(p is cell for p in node.parents):
+                cols[i]["fields"].append(f.get("label") or f.get("name") or sel)
+                break
+    return cols
+
+
+def collapse_list_rows(inner_html: str, applet: dict) -> tuple[str, dict | None]:
+    """
+    Keep one row template of a List applet's markup.
+
+    Returns (html, report); report is None (html unchanged) when no repeated
+    rows were found.
+    """
+    soup = _soup(inner_html)
+    root = soup.body or soup
+    rows, detected_by = find_rows(root, applet.get("item_selector"))
+    if len(rows) < 2:
+        return inner_html, None
+
+    template = rows[0]
+    selector = applet.get("item_selector") if detected_by == "item_selector" else _row_selector(rows)
+    header = _header_cells(template)
+    for r in rows[1:]:
+        r.decompose()
+    template["data-row-template"] = "true"
+    template["data-row-count"] = str(len(rows))
+
+    html = "".join(str(c) for c in root.contents)
+    return html, {
+        "rows": len(rows),
+        "kept": 1,
+        "detected_by": detected_by,
+        "selector": selector,
+        "columns": _columns(template, header, applet.get("fields") or []),
+        "bytes_before": len(inner_html.encode("utf-8")),
+        "bytes_after": len(html.encode("utf-8")),
+    }
@@ -0,0 +1,120 @@
+# log_pipeline.py
+"""
+Non-blocking JSON logging for the request paths.
+
+Request threads only put records on an in-memory queue (QueueHandler);
+a single QueueListener thread formats them as JSON lines and writes
+logs/bot.log (logger "bot") and logs/api.log (everything else) with
+size-based rotation.  Records marked verbose (citations, payload dumps)
+are sampled, and prompts are logged as hashes + lengths, never verbatim.
+Only the main process writes the log files: child processes (bulk_regen
+workers import the app) log to the console only, so two processes never
+rotate the same file.
+
+    LOG_MAX_BYTES       rotate after this many bytes (default 5 MB)
+    LOG_BACKUPS         rotated files to keep (default 5)
+    LOG_VERBOSE_SAMPLE  share of verbose records kept, 0..1 (default 0.1)
+    LOG_LEVEL           default INFO
+    LOG_CONSOLE         also echo to stderr (default 1)
+"""
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from pathlib import Path
+
+LOG_DIR = Path(__file__).parent.resolve() / "logs"
+MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+VERBOSE_SAMPLE = float(os.getenv("LOG_VERBOSE_SAMPLE", "0.1"))
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "verbose"}
+_listener = None
+
+
+def prompt_fingerprint(text: str | None) -> dict:
+    """Stable short hash + size of a prompt, logged instead of the prompt itself."""
+    text = text or ""
+    return {"sha256": hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], "chars": len(text)}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra=` fields are kept as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in vars(record).items():
+            if k not in _RESERVED and not k.startswith("_"):
+                doc[k] = v
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str, ensure_ascii=False)
+
+
+class SampleVerbose(logging.Filter):
+    """Keep only a share of records logged with extra={"verbose": True}."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, "verbose", False) or random.random() < self.rate
+
+
+class _NameFilter(logging.Filter):
+    def __init__(self, prefix: str, include: bool):
+        super().__init__()
+        self.prefix, self.include = prefix, include
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        hit = record.name == self.prefix or record.name.startswith(self.prefix + ".")
+        return hit if self.include else not hit
+
+
+def _file_handler(name: str) -> logging.Handler:
+    LOG_DIR.mkdir(exist_ok=True)
+    h = logging.handlers.RotatingFileHandler(
+        LOG_DIR / name, maxBytes=MAX_BYTES, backupCount=BACKUPS, encoding="utf-8", delay=True)
+    h.setFormatter(JsonFormatter())
+    return h
+
+
+def configure_logging() -> None:
+    """Install the queue-based pipeline on the root logger (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+    handlers = []
+    if multiprocessing.parent_process() is None:
+        bot = _file_handler("bot.log")
+        bot.addFilter(_NameFilter("bot", include=True))
+        api = _file_handler("api.log")
+        api.addFilter(_NameFilter("bot", include=False))
+        handlers += [bot, api]
+    if os.getenv("LOG_CONSOLE", "1") == "1":
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
+        handlers.append(console)
+
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    qh = logging.handlers.QueueHandler(q)
+    qh.addFilter(SampleVerbose(VERBOSE_SAMPLE))   # drop sampled-out records before they are queued
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(qh)
+
+    _listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
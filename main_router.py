@@ -1,25 +1,46 @@
 # main_router.py
 import os
+import io
+import gzip
 import json
+import hmac
+import hashlib
+import zipfile
+import mimetypes
 import shutil
 import re
+import threading
 from pathlib import Path
 from datetime import datetime
-# add imports near the top
-from bs4 import BeautifulSoup
 from copy import deepcopy
-from client_script_bot import ask_client_script_bot
+from client_script_bot import BATCH_CONCURRENCY, BATCH_MAX_ITEMS, ask_batch, ask_client_script_bot
 from flask import (
-    Flask, request, render_template, send_file, jsonify, abort
+    Flask, request, render_template, send_file, jsonify, abort, Response
 )
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
+from log_pipeline import configure_logging
 
 load_dotenv()
+configure_logging()
 
 
 # Use your existing logic module (unchanged)
 from siebel_generator import process_siebel_conversion
+from manifest_utils import (
+    find_similar_selectors, _strip_code_fence, _load_manifest_safely, validate_structure,
+    repair_manifest, manifest_diff, _soup,
+)
+from od_annotator import apply_od_attributes, _od_safe, _derive_od_id
+from list_rows import LIST_ROLES, collapse_list_rows
+from css_tools import optimize_run_css, run_css
+from design_library import ENABLED as DESIGN_LIBRARY_DEFAULT, RUN_CSS as DESIGN_CSS
+import tolerant_json
+from run_bundles import etag_of, get_bundles, manifest_summary
+from artifact_store import (artifact_path, compress_run, materialize_run, publish_run, read_text,
+                            run_in_store, source_image)
+import request_profiler
+import deadline as request_deadline
 
 APP_ROOT = Path(__file__).parent.resolve()
 UPLOAD_ROOT = APP_ROOT / "uploads"
@@ -30,6 +51,63 @@ OUTPUT_ROOT.mkdir(exist_ok=True)
 app = Flask(__name__, static_folder="static", template_folder="templates")
 app.secret_key = os.environ.get("FLASK_SECRET", "design-to-code-secret")
 
+@app.before_request
+def _set_request_priority():
+    """Provider calls of this request queue as interactive unless the client asks for batch."""
+    from provider_scheduler import set_priority
+    data = request.get_json(silent=True) if request.is_json else None
+    prio = request.headers.get("X-Priority") or request.values.get("priority") or (data or {}).get("priority")
+    set_priority((prio or "interactive").lower())
+
+@app.before_request
+def _set_request_deadline():
+    """Optional end-to-end budget in seconds: X-Deadline, form/JSON `deadline`, else REQUEST_DEADLINE."""
+    data = request.get_json(silent=True) if request.is_json else None
+    value = request.headers.get("X-Deadline") or request.values.get("deadline") or (data or {}).get("deadline")
+    request_deadline.start(request_deadline.parse(value) or request_deadline.DEFAULT)
+
+def _deadline_payload(result: dict | None = None) -> dict:
+    """{"partial", "deadline"} for a request that ran under a deadline; empty otherwise."""
+    st = request_deadline.state()
+    if st is None:
+        return {}
+    if result and result.get("partial_sections"):
+        st["sections"] = result["partial_sections"]
+    return {"partial": st["partial"], "deadline": st}
+
+@app.get("/api/scheduler/stats")
+def scheduler_stats():
+    """Per provider/model budgets, queue depth and wait times of the provider scheduler."""
+    from provider_scheduler import scheduler
+    return jsonify(scheduler.stats())
+
+@app.get("/api/image_handles/stats")
+def image_handle_stats():
+    """Cached provider file handles plus hit/upload/expiry/fallback counters of this process."""
+    from image_handles import get_cache
+    return jsonify(get_cache().snapshot())
+
+@app.get("/api/cascade/stats")
+def cascade_stats():
+    """Tier distribution, mean score and mean latency of cascade runs (from each run's cascade.json)."""
+    runs = []
+    for fp in OUTPUT_ROOT.glob("*/cascade.json"):
+        try:
+            runs.append(json.loads(fp.read_text("utf-8")))
+        except (OSError, json.JSONDecodeError):
+            continue
+    tiers: dict = {}
+    for r in runs:
+        tiers[str(r.get("model"))] = tiers.get(str(r.get("model")), 0) + 1
+    n = len(runs) or 1
+    return jsonify({
+        "runs": len(runs),
+        "by_model": tiers,
+        "mean_score": round(sum(r.get("score", 0) for r in runs) / n, 3),
+        "mean_seconds": round(sum(r.get("seconds", 0) for r in runs) / n, 3),
+        "escalated": sum(1 for r in runs if (r.get("tier") or 0) > 0),
+    })
+
 @app.route("/OpenUICodeGen", methods=["GET"])
 def openui_codegen():  # existing PM/PR generator page
     return render_template("pmpr_generator.html", strings={"app_title": "Siebel Open UI – Code Gen"})
@@ -48,35 +126,81 @@ def client_script_bot_api():
     try:
         answer = ask_client_script_bot(msg, ctx)
         if isinstance(answer, dict):  # when returning both html + flag
-            return jsonify(answer)
+            return jsonify({**answer, **_deadline_payload()})
         else:
-            return jsonify({"answer": answer})
+            return jsonify({"answer": answer, **_deadline_payload()})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/client-script/ask_batch", methods=["POST"])
+def client_script_bot_batch_api():
+    """
+    {"items": [{"message", "context_type"}, ...], "concurrency": n} -> NDJSON stream.
+
+    Identical questions are asked once; answers are streamed as they complete
+    (see client_script_bot.ask_batch).  Runs at batch priority unless the
+    client asks otherwise.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items required"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"at most {BATCH_MAX_ITEMS} items per batch"}), 400
+    items = [i if isinstance(i, dict) else {"message": str(i)} for i in items]
+    try:
+        concurrency = int(data.get("concurrency") or BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    if not (request.headers.get("X-Priority") or data.get("priority")):
+        from provider_scheduler import set_priority
+        set_priority("batch")   # a checklist must not hold up interactive conversions
+
+    def stream():
+        for line in ask_batch(items, concurrency):
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+        st = request_deadline.state()
+        if st is not None:
+            yield json.dumps({"type": "deadline", **st}) + "\n"
+
+    return Response(stream(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
 def _ts_dir() -> Path:
     """Create timestamped output directory."""
     stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     out = OUTPUT_ROOT / stamp
-    out.mkdir(parents=True, exist_ok=True)
-    return out
+    n = 0
+    while True:  # two runs in the same second must not share a folder
+        try:
+            out.mkdir(parents=True)
+            if not run_in_store(out.name):  # taken by another node sharing the artifact store
+                return out
+            out.rmdir()
+        except FileExistsError:
+            pass
+        n += 1
+        out = OUTPUT_ROOT / f"{stamp}_{n}"
 
 
 def _inline_preview_html(out_dir: Path) -> str:
     """Return HTML with CSS inlined so the preview iframe renders correctly."""
     html_path = out_dir / "generated.html"
-    css_path = out_dir / "style.css"
+    css_path = run_css(out_dir) or out_dir / "style.css"   # pruned + minified when available
 
-    if not html_path.exists():
+    if artifact_path(out_dir, html_path.name) is None:
         return "<!doctype html><html><body><h3>No HTML generated.</h3></body></html>"
 
-    html = html_path.read_text("utf-8", errors="ignore")
+    html = read_text(html_path)
     css = css_path.read_text("utf-8", errors="ignore") if css_path.exists() else ""
+    lib_path = out_dir / DESIGN_CSS
+    if lib_path.exists():  # shared design-system sheet goes first, the run's delta overrides it
+        html = re.sub(rf"<link[^>]*href=[\"']?{re.escape(DESIGN_CSS)}[\"']?[^>]*\/?>", "", html, flags=re.I)
+        css = lib_path.read_text("utf-8", errors="ignore") + "\n" + css
 
     if css.strip():
         # 1) Replace any <link ... href="style.css" ...> (self-closing tolerated)
         html_inlined = re.sub(
-            r"<link[^>]*href=[\"']?style\.css[\"']?[^>]*\/?>",
+            r"<link[^>]*href=[\"']?style(?:\.min)?\.css[\"']?[^>]*\/?>",
     f"<style>{css}</style>",
             html,
             flags=re.IGNORECASE,
@@ -134,16 +258,20 @@ def _webtemplate_dir(out_dir: Path) -> Path:
     wt.mkdir(parents=True, exist_ok=True)
     return wt
 
-def _role_to_applet_template(name: str, role: str, inner_html: str) -> str:
+def _role_to_applet_template(name: str, role: str, inner_html: str, rows: dict | None = None) -> str:
     """Generate Siebel applet template based on component role"""
     r = (role or "").lower()
     name_safe = _safe_name(name)
     
     if r in {"list", "navigation", "grid"}:
+        note = ""
+        if rows:  # one row template stands in for the records drawn in the screenshot
+            cols = " | ".join(c["label"] for c in rows["columns"])
+            note = f"<!-- row template: {rows['rows']} rows detected, columns: {cols} -->\n    "
         return f"""<siebel:Applet name="{name_safe}" type="List">
   <siebel:ListHeader/>
   <siebel:ListRows>
-    {inner_html}
+    {note}{inner_html}
   </siebel:ListRows>
 </siebel:Applet>
 """
@@ -198,13 +326,13 @@ def _build_view_template(order, found_tags) -> str:
     return "<html>\n<body>\n" + "\n".join(shells) + "\n</body>\n</html>\n"
 
 def generate_view_and_applets(html: str, manifest: list[dict], out_dir: Path, workdir: str):
-    soup = BeautifulSoup(html, "lxml")
+    soup = _soup(html)
     found = {}
     written = []
     safe_by_name = {}
 
     # Create a copy of the original HTML for the view template
-    view_soup = BeautifulSoup(html, "lxml")
+    view_soup = _soup(html)
     
     for it in manifest:
         name, sel, role = it["name"], it["selector"], it.get("role","")
@@ -257,7 +385,7 @@ def generate_view_and_applets(html: str, manifest: list[dict], out_dir: Path, wo
 # ---- deep seek start----#
 def parse_hierarchical_structure(html: str, manifest: dict) -> dict:
     """Parse HTML with hierarchical awareness"""
-    soup = BeautifulSoup(html, "lxml")
+    soup = _soup(html)
     structure = {}
     
     for container in manifest.get("containers", []):
@@ -287,7 +415,7 @@ def parse_hierarchical_structure(html: str, manifest: dict) -> dict:
 
 def generate_siebel_templates(hierarchical_structure: dict, out_dir: Path):
     """Generate templates based on hierarchical structure"""
-    view_soup = BeautifulSoup("<html><body></body></html>", "lxml")
+    view_soup = _soup("<html><body></body></html>")
     body = view_soup.body
     
     for container_name, container_data in hierarchical_structure.items():
@@ -326,135 +454,9 @@ def detect_nested_structures(soup, parent_selector):
         for el in sections
     ]
 
-def find_similar_selectors(soup, target_selector: str) -> list:
-    """
-    Find CSS selectors that are similar to the target selector.
-    This helps when the exact selector from manifest doesn't exist in HTML.
-    """
-    try:
-        # If the target selector works, return it
-        if soup.select_one(target_selector):
-            return [target_selector]
-        
-        # Parse the target selector to understand what we're looking for
-        suggestions = []
-        
-        # Strategy 1: Try different variations of the selector
-        if '.' in target_selector:
-            # Class selector - try variations
-            parts = target_selector.split('.')
-            base_class = parts[-1]
-            
-            # Look for elements with similar class names
-            similar_elements = soup.find_all(class_=lambda x: x and base_class in str(x))
-            for element in similar_elements:
-                if element.get('class'):
-                    for cls in element['class']:
-                        if base_class in cls:
-                            suggested_selector = f".{cls}"
-                            if soup.select_one(suggested_selector):
-                                suggestions.append(suggested_selector)
-        
-        # Strategy 2: Try by element type
-        if not suggestions:
-            element_type = target_selector.split('.')[0] if '.' in target_selector else target_selector
-            if element_type and not element_type.startswith('.'):
-                # Look for elements of this type
-                elements = soup.find_all(element_type)
-                if elements:
-                    suggestions.append(element_type)
-        
-        # Strategy 3: Try by role or common patterns
-        if not suggestions:
-            # Look for common container patterns
-            common_containers = ['header', 'footer', 'main', 'section', 'div', 'nav', 'aside']
-            for container in common_containers:
-                elements = soup.find_all(container, class_=True)
-                if elements:
-                    for element in elements:
-                        if element.get('class'):
-                            suggested_selector = f"{container}.{element['class'][0]}"
-                            suggestions.append(suggested_selector)
-        
-        # Strategy 4: Try ID selectors if any element has ID
-        if not suggestions:
-            elements_with_id = soup.find_all(id=True)
-            for element in elements_with_id:
-                suggestions.append(f"#{element['id']}")
-        
-        # Remove duplicates and limit results
-        unique_suggestions = []
-        seen = set()
-        for suggestion in suggestions:
-            if suggestion not in seen and soup.select_one(suggestion):
-                seen.add(suggestion)
-                unique_suggestions.append(suggestion)
-        
-        return unique_suggestions[:5]  # Return top 5 suggestions
-        
-    except Exception as e:
-        print(f"Error finding similar selectors: {e}")
-        return []
-# --- add near the top of main_router.py ---
-def _strip_code_fence(s: str) -> str:
-    return re.sub(r'^\s*```(?:json)?\s*|\s*```\s*$', '', s, flags=re.IGNORECASE | re.M)
-
-def _json_sanitize(s: str) -> str:
-    s = _strip_code_fence(s)
-    s = re.sub(r'//.*?$', '', s, flags=re.M)         # // comments
-    s = re.sub(r'/\*.*?\*/', '', s, flags=re.S)      # /* ... */ comments
-    s = re.sub(r',\s*([}\]])', r'\1', s)             # trailing commas
-    s = s.strip()
-    m = re.search(r'\{[\s\S]*\}\s*$', s)
-    return m.group(0) if m else s
-
-def _load_manifest_safely(path: Path) -> dict:
-    raw = path.read_text("utf-8", errors="ignore")
-    try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
-        return json.loads(_json_sanitize(raw))
-    
-def validate_structure(html: str, manifest: dict) -> dict:
-    """Validate that manifest structure matches HTML"""
-    soup = BeautifulSoup(html, "lxml")
-    validation_result = {
-        "valid": True,
-        "missing_selectors": [],
-        "suggestions": [],
-        "warnings": []
-    }
-    
-    def validate_container(container, parent_selector=""):
-        full_selector = f"{parent_selector} {container['selector']}".strip() if parent_selector else container['selector']
-        
-        if not soup.select_one(full_selector):
-            validation_result["valid"] = False
-            validation_result["missing_selectors"].append(full_selector)
-            
-            # Find similar selectors
-            similar = find_similar_selectors(soup, full_selector)
-            if similar:
-                validation_result["suggestions"].append({
-                    "expected": full_selector,
-                    "similar": similar,
-                    "container": container.get("name", "unknown")
-                })
-            else:
-                validation_result["warnings"].append(f"No similar selectors found for {full_selector}")
-        
-        # Validate children recursively
-        for child in container.get("children", []):
-            validate_container(child, full_selector)
-    
-    # Validate all containers
-    for container in manifest.get("containers", []):
-        validate_container(container)
-    
-    return validation_result
 @app.get("/download/<workdir>/webtemplate/<path:name>")
 def download_wt(workdir: str, name: str):
-    out_dir = OUTPUT_ROOT / workdir / "webtemplate"
+    out_dir = _run_dir(workdir) / "webtemplate"
     if not out_dir.exists():
         abort(404)
     # Allow any file inside webtemplate folder
@@ -463,7 +465,7 @@ def download_wt(workdir: str, name: str):
         abort(404)
     return send_file(fp, as_attachment=True)
 
-def generate_applet_file(child_data: dict, target_dir: Path):
+def generate_applet_file(child_data: dict, target_dir: Path, with_content: bool = False):
     """Generate individual applet files from child component data"""
     config = child_data["config"]
     element = child_data["element"]
@@ -473,29 +475,43 @@ def generate_applet_file(child_data: dict, target_dir: Path):
     if element.contents:
         inner_html = "".join(str(child) for child in element.contents if child != "\n")
 
-    inner_html = apply_od_attributes(inner_html, config)
+    rows = None
+    od_config = config
+    if (config.get("role") or "").lower() in LIST_ROLES:
+        # Siebel renders list rows from data: keep a single row template
+        inner_html, rows = collapse_list_rows(inner_html, config)
+        if rows and not config.get("item_selector"):
+            od_config = {**config, "item_selector": rows["selector"]}
+    inner_html = apply_od_attributes(inner_html, od_config)
     # Generate the applet template based on role
     safe_name = _safe_name(config["name"])
-    tpl = _role_to_applet_template(config["name"], config.get("role", ""), inner_html)
+    tpl = _role_to_applet_template(config["name"], config.get("role", ""), inner_html, rows)
     
     # Write the applet file
     applet_file = target_dir / f"applet_{safe_name}.swt"
     applet_file.write_text(tpl, "utf-8")
     
-    return {
+    result = {
         "name": config["name"],
         "safe": safe_name,
         "file": applet_file.name,
         "status": "ok"
     }
-
-def generate_siebel_templates_from_hierarchy(html: str, manifest: dict, out_dir: Path, workdir: str):
+    if rows:
+        result["list_rows"] = rows
+    if with_content:
+        result["content"] = tpl
+    return result
+
+def generate_siebel_templates_from_hierarchy(html: str, manifest: dict, out_dir: Path, workdir: str,
+                                             with_content: bool = False):
     """Generate Siebel templates using hierarchical manifest structure.
        Handles applets directly under containers and nested containers.
+       with_content: also return the .swt text (applet "content", "view_content").
     """
     wt = _webtemplate_dir(out_dir)  # ensure <ts>/webtemplate/ exists
-    soup = BeautifulSoup(html, "lxml")       # source DOM
-    view_soup = BeautifulSoup(html, "lxml")  # copy to become the view SWT
+    soup = _soup(html)       # source DOM
+    view_soup = _soup(html)  # copy to become the view SWT
     written = []
 
     def process_container(container_cfg, src_root, view_root):
@@ -520,7 +536,7 @@ def generate_siebel_templates_from_hierarchy(html: str, manifest: dict, out_dir:
                 continue
 
             child_data = {"config": applet_cfg, "element": applet_el}
-            applet_result = generate_applet_file(child_data, wt)
+            applet_result = generate_applet_file(child_data, wt, with_content)
             applet_result["url"] = f"/download/{workdir}/webtemplate/{applet_result['file']}"
             written.append(applet_result)
 
@@ -544,163 +560,215 @@ def generate_siebel_templates_from_hierarchy(html: str, manifest: dict, out_dir:
 
     # write final view template
     view_file = _webtemplate_dir(out_dir) / "view_template.swt"
-    view_file.write_text(str(view_soup), encoding="utf-8")
+    view_html = str(view_soup)
+    view_file.write_text(view_html, encoding="utf-8")
 
-    return {
+    result = {
         "applets": written,
         "view": f"/download/{workdir}/webtemplate/view_template.swt"
     }
-def _od_safe(s: str) -> str:
-    s = (s or "").strip()
-    s = re.sub(r"[^A-Za-z0-9]+", "_", s)
-    s = re.sub(r"_+", "_", s).strip("_")
-    return s or "Field"
-
-def _derive_od_id(field_dict, node, fallback=""):
-    if isinstance(field_dict, dict):
-        for k in ("dataField", "label"):
-            v = field_dict.get(k)
-            if v:
-                return _od_safe(v)
-    if node is not None:
-        if node.has_attr("id"):
-            return _od_safe(node["id"])
-        if node.has_attr("name"):
-            return _od_safe(node["name"])
-        if node.has_attr("class"):
-            return _od_safe("_".join(node["class"]))
-    if fallback:
-        return _od_safe(fallback)
-    return "Field"
-
-def _is_buttonish(tag, el):
-    if tag == "button":
-        return True
-    if tag == "a":
-        role = (el.get("role") or "").lower()
-        classes = " ".join(el.get("class", [])).lower()
-        return "button" in role or "btn" in classes
-    return False
-
-def apply_od_attributes(inner_html: str, applet: dict) -> str:
-    """Stamp od-* attributes onto labels/controls per applet manifest."""
-    soup = BeautifulSoup(inner_html, "lxml")
-    fields = applet.get("fields") or []
-    actions = applet.get("actions") or []
-    role = (applet.get("role") or "").lower()
-    item_sel = applet.get("item_selector")
-
-    # 1) Use manifest field selectors when available
-    for f in fields:
-        sel = f.get("selector")
-        if not sel:
-            continue
-        node = soup.select_one(sel)
-        if not node:
-            continue
+    if with_content:
+        result["view_content"] = view_html
+    return result
+# ---- deep seek end----#
+# ---- near-duplicate reuse (perceptual hash index of past runs) ----
+
+def _run_dir(workdir: str) -> Path:
+    """Local folder of a run, pulled from the shared artifact store when produced on another node."""
+    wd = secure_filename(workdir or "")
+    if wd and wd == workdir:
+        materialize_run(wd)
+    return OUTPUT_ROOT / workdir
+
+def _image_phash(path: Path):
+    """dHash of an uploaded image, or None when it cannot be decoded."""
+    from phash_index import dhash
+    try:
+        return dhash(path)
+    except Exception:
+        return None
+
+def _conversion_ok(out_dir: Path) -> bool:
+    if artifact_path(out_dir, "raw_response.txt") is None or artifact_path(out_dir, "generated.html") is None:
+        return False
+    head = read_text(out_dir / "raw_response.txt")[:64]
+    if head.startswith(("Conversion failed", "ERROR:")):
+        return False
+    regions = out_dir / "regions.json"
+    if regions.exists():   # older region runs wrote region blocks even when every region failed
+        try:
+            stats = json.loads(regions.read_text("utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return False
+        if stats.get("errors") and not any(r.get("fragment") or r.get("cached") for r in stats.get("regions", [])):
+            return False
+    return True
+
+def _index_run(out_dir: Path, up_path: Path, phash) -> None:
+    """Record a successful run in the perceptual-hash index."""
+    if phash is None or not _conversion_ok(out_dir):
+        return
+    from phash_index import get_index
+    get_index().add(phash, out_dir.name, image=up_path.name)
+
+def _find_duplicate(phash) -> dict | None:
+    """Nearest indexed run (within PHASH_MAX_DISTANCE) whose artifacts still exist."""
+    if phash is None:
+        return None
+    from phash_index import get_index
+    for m in get_index().nearest(phash):
+        if _conversion_ok(_run_dir(m["workdir"])):
+            return m
+    return None
+
+def _save_upload(file) -> Path:
+    """Store an upload under a content-addressed name.
+
+    A revision is usually the same filename re-uploaded; a plain filename would
+    overwrite the base run's source image before it is diffed.
+    """
+    data = file.read()
+    name = f"{hashlib.sha256(data).hexdigest()[:12]}_{secure_filename(file.filename) or 'upload'}"
+    up_path = UPLOAD_ROOT / name
+    if not up_path.exists():
+        up_path.write_bytes(data)
+    return up_path
 
-        tag = (node.name or "").lower()
-
-        # try to find paired <label for=...> or sibling label-ish node
-        label_node = None
-        if node.has_attr("id"):
-            label_node = soup.find("label", attrs={"for": node["id"]})
-        if not label_node:
-            prev = node.find_previous_sibling()
-            if prev and (prev.name == "label" or "label" in " ".join(prev.get("class", [])).lower()):
-                label_node = prev
-        if label_node:
-            label_node["od-type"] = "label"
-            label_node["od-Html"] = "DisplayName"
-            label_node["od-id"] = _derive_od_id(f, label_node, f.get("label") or "")
-
-        od_id = _derive_od_id(f, node, f.get("label") or "")
-        if tag in ("input", "select", "textarea") or _is_buttonish(tag, node) or tag == "img":
-            node["od-type"] = "control"
-            node["od-Html"] = "FormattedHTML"
-            node["od-id"] = od_id
-        else:
-            node["od-type"] = "control"
-            node["od-Html"] = "FormattedHTML"
-            node["od-id"] = od_id
-
-    # 2) Actions
-    for act in actions:
-        sel = act.get("selector")
-        name = (act.get("name") or "").strip()
-        if not sel or not name:
-            continue
-        node = soup.select_one(sel)
-        if not node:
-            continue
-        node["od-type"] = "control"
-        node["od-Html"] = "FormattedHTML"
-        node["od-id"] = _od_safe(name)
-
-    # 3) If List without explicit fields, mark simple text nodes in each row
-    if role == "list" and item_sel and not fields:
-        for row in soup.select(item_sel):
-            for n in row.select("span, p, div"):
-                if n.has_attr("od-type"):
-                    continue
-                txt = n.get_text(strip=True)
-                if not txt or len(list(n.children)) > 3:
-                    continue
-                n["od-type"] = "control"
-                n["od-Html"] = "FormattedHTML"
-                n["od-id"] = _od_safe(txt[:24])
-
-    # 4) Heuristic fallback if no fields at all (forms/detail)
-    if not fields:
-        for lbl in soup.find_all("label"):
-            if not lbl.has_attr("od-type"):
-                lbl["od-type"] = "label"
-                lbl["od-Html"] = "DisplayName"
-                lbl["od-id"] = _derive_od_id(None, lbl, lbl.get_text(strip=True))
-        for inp in soup.find_all(["input", "select", "textarea"]):
-            if not inp.has_attr("od-type"):
-                inp["od-type"] = "control"
-                inp["od-Html"] = "FormattedHTML"
-                inp["od-id"] = _derive_od_id(None, inp)
-        for im in soup.find_all("img"):
-            if not im.has_attr("od-type"):
-                im["od-type"] = "control"
-                im["od-Html"] = "FormattedHTML"
-                im["od-id"] = _derive_od_id(None, im, im.get("alt", "Image"))
-        for n in soup.find_all(["span", "p", "div"]):
-            if n.has_attr("od-type"):
-                continue
-            txt = n.get_text(strip=True)
-            if not txt or len(list(n.children)) > 3:
-                continue
-            n["od-type"] = "control"
-            n["od-Html"] = "FormattedHTML"
-            n["od-id"] = _derive_od_id(None, n, txt)
+def _reuse_run(src_dir: Path, up_path: Path) -> Path:
+    """Copy a previous run's HTML/CSS/manifest into a new run folder (no LLM call)."""
+    out_dir = _ts_dir()
+    (out_dir / "source_image.txt").write_text(str(up_path), "utf-8")
+    for name in ("raw_response.txt", "generated.html", "style.css", DESIGN_CSS, "manifest.json"):
+        fp = artifact_path(src_dir, name)   # plain or .gz, copied as stored
+        if fp is not None:
+            shutil.copy2(fp, out_dir / fp.name)
+    (out_dir / "reused_from.txt").write_text(src_dir.name, "utf-8")
+    return out_dir
+
+def _repair_selectors(html: str, manifest: dict, out_dir: Path) -> tuple[dict, dict]:
+    """Repair stage before generation: fix manifest selectors that miss the HTML, locally.
+
+    Writes manifest.repaired.json + manifest.repaired.diff when something was rewritten;
+    manifest.json itself is left as the model returned it.
+    """
+    repaired, report = repair_manifest(html, manifest)
+    for name in ("manifest.repaired.json", "manifest.repaired.diff"):
+        (out_dir / name).unlink(missing_ok=True)
+    if report["fixed"]:
+        (out_dir / "manifest.repaired.json").write_text(json.dumps(repaired, indent=2), "utf-8")
+        (out_dir / "manifest.repaired.diff").write_text(manifest_diff(manifest, repaired), "utf-8")
+    summary = {k: report[k] for k in ("checked", "broken", "fixed")}
+    summary["unresolved"] = [u["selector"] for u in report["unresolved"]]
+    summary["changes"] = report["changes"]
+    return repaired, summary
+
+def _publish_generated(out_dir: Path) -> int:
+    """Push what a generation rewrote (webtemplates, repaired manifest) to the shared store."""
+    return publish_run(out_dir, [f"webtemplate/{fp.name}" for fp in (out_dir / "webtemplate").glob("*.swt")]
+                       + [n for n in ("manifest.repaired.json", "manifest.repaired.diff") if (out_dir / n).exists()])
+
+def _fused_generate(out_dir: Path, result: dict | None) -> dict:
+    """Generate webtemplates + zip straight from the conversion's in-memory HTML/manifest.
+
+    Returns the /api/generate_siebel payload with the .swt contents inline.
+    """
+    content = (result or {}).get("content")
+    if content is not None:
+        html, manifest_text = content["html"], content["manifest"]
+    else:  # region/revision modes only leave their output on disk
+        html = read_text(out_dir / "generated.html")
+        manifest_text = read_text(out_dir / "manifest.json")
+    manifest, json_repair = tolerant_json.loads(manifest_text or "{}")
+    manifest, repair = _repair_selectors(html, manifest, out_dir)
+    files = generate_siebel_templates_from_hierarchy(html, manifest, out_dir, out_dir.name, with_content=True)
+    _zip_webtemplate(out_dir)
+    return {"message": "Generated Siebel webtemplates.", "files": files,
+            "zip": f"/download-webtemplate/{out_dir.name}", "repair": repair, "json_repair": json_repair}
+
+def _fused_payload(out_dir: Path, result: dict | None, fused: bool) -> dict:
+    """{"siebel": ...} for a fused request on a successful run, {"siebel_error": ...} if generation failed."""
+    if not fused or not _conversion_ok(out_dir):
+        return {}
+    if request_deadline.expired():
+        request_deadline.skip("webtemplate generation")
+        return {"siebel_error": "deadline exceeded before webtemplate generation"}
+    try:
+        return {"siebel": _fused_generate(out_dir, result)}
+    except Exception as e:
+        return {"siebel_error": f"{type(e).__name__}: {e}"}
 
-    return str(soup)
+def _optimize_css(out_dir: Path) -> None:
+    """Post-processing stage: prune unused selectors + minify into style.min.css (best effort)."""
+    if request_deadline.expired():   # optional: the preview falls back to style.css
+        request_deadline.skip("css optimize")
+        return
+    try:
+        optimize_run_css(out_dir)
+    except Exception as e:
+        (out_dir / "css_report.json").write_text(json.dumps({"error": str(e)}), "utf-8")
 
-# ---- deep seek end----#
 @app.post("/api/convert")
 def api_convert():
-    """Upload image, run conversion once, save to a timestamped folder."""
+    """Upload image, run conversion once, save to a timestamped folder.
+
+    on_duplicate: convert (default) | ask | reuse — what to do when the upload is a
+    near-duplicate (perceptual hash) of a previous run.
+    revision_of: previous workdir; only the changed areas are re-converted.
+    output_mode: fences (default) | dsl — compact layout outline compiled locally.
+    tiles: 1 — cut a tall/wide screenshot at whitespace seams and convert the tiles concurrently.
+    design_library: 1 — prompt with the shared design-system classes (default DESIGN_LIBRARY).
+    generate: 1 — also build the webtemplates + zip in the same job ("siebel" in the response).
+    deadline: seconds — best effort within the budget; the response says what was cut or skipped.
+    """
     file = request.files.get("image")
     model = request.form.get("model", "gpt-4o")
     tokens = int(request.form.get("max_tokens", "6000"))
+    on_duplicate = (request.form.get("on_duplicate") or "convert").lower()
+    use_region_cache = request.form.get("region_cache") in {"1", "true", "on"}
+    use_tiles = request.form.get("tiles") in {"1", "true", "on"}
+    use_library = request.form.get("design_library", "1" if DESIGN_LIBRARY_DEFAULT else "") in {"1", "true", "on"}
+    output_mode = "dsl" if request.form.get("output_mode") == "dsl" else "fences"
+    fused = request.form.get("generate") in {"1", "true", "on"}
+    revision_of = secure_filename(request.form.get("revision_of", ""))
+    revision_dir = _run_dir(revision_of) if revision_of else None
+    if revision_dir is not None and not revision_dir.exists():
+        return jsonify({"ok": False, "error": "Run to revise not found."}), 404
 
     if not file or file.filename == "":
         return jsonify({"ok": False, "error": "No file selected."}), 400
 
-    filename = secure_filename(file.filename)
-    up_path = UPLOAD_ROOT / filename
-    file.save(up_path)
+    up_path = _save_upload(file)
+
+    phash = _image_phash(up_path)
+    if on_duplicate in {"ask", "reuse"}:
+        reuse_run = secure_filename(request.form.get("reuse_run", ""))
+        match = {"workdir": reuse_run, "distance": None} if reuse_run else _find_duplicate(phash)
+        if match and not _conversion_ok(_run_dir(match["workdir"])):
+            match = None
+        if match and on_duplicate == "ask":
+            return jsonify({"ok": True, "duplicate": match})
+        if match and on_duplicate == "reuse":
+            out_dir = _reuse_run(OUTPUT_ROOT / match["workdir"], up_path)
+            _optimize_css(out_dir)
+            _index_run(out_dir, up_path, phash)
+            payload = _fused_payload(out_dir, None, fused)
+            compress_run(out_dir)
+            publish_run(out_dir, source=up_path)
+            _prewarm_bundle(out_dir)
+            return jsonify({"ok": True, "workdir": out_dir.name, "reused_from": match["workdir"], **payload,
+                            **_deadline_payload()})
 
     out_dir = _ts_dir()
     # Save a pointer to the source image so "generate again" can reuse it
     (out_dir / "source_image.txt").write_text(str(up_path), "utf-8")
 
     # Call your logic (unchanged)
+    result = None
     try:
-        process_siebel_conversion(str(up_path), str(out_dir), model=model, max_completion_tokens=tokens)
+        result = process_siebel_conversion(str(up_path), str(out_dir), model=model, max_completion_tokens=tokens,
+                                  use_region_cache=use_region_cache,
+                                  revision_of=str(revision_dir) if revision_dir else None,
+                                  output_mode=output_mode, use_tiles=use_tiles, use_library=use_library)
     except Exception as e:
         # Ensure an error is visible in UI
         (out_dir / "raw_response.txt").write_text(f"ERROR: {e}", "utf-8")
@@ -708,7 +776,15 @@ def api_convert():
             f"<html><body><h2>Conversion failed</h2><p>{e}</p></body></html>", "utf-8"
         )
 
-    return jsonify({"ok": True, "workdir": out_dir.name})
+    _optimize_css(out_dir)
+    _index_run(out_dir, up_path, phash)
+    payload = _fused_payload(out_dir, result, fused)
+    payload.update({k: result[k] for k in ("json_repair", "design_library", "revision") if result and result.get(k)})
+    payload.update(_deadline_payload(result))
+    compress_run(out_dir)
+    publish_run(out_dir, source=up_path)
+    _prewarm_bundle(out_dir)
+    return jsonify({"ok": True, "workdir": out_dir.name, **payload})
 
 
 @app.post("/api/retry")
@@ -717,7 +793,12 @@ def api_retry():
     workdir = request.form.get("workdir", "")
     model = request.form.get("model", "gpt-4o")
     tokens = int(request.form.get("max_tokens", "6000"))
-    prev_dir = OUTPUT_ROOT / workdir
+    use_region_cache = request.form.get("region_cache") in {"1", "true", "on"}
+    use_tiles = request.form.get("tiles") in {"1", "true", "on"}
+    use_library = request.form.get("design_library", "1" if DESIGN_LIBRARY_DEFAULT else "") in {"1", "true", "on"}
+    output_mode = "dsl" if request.form.get("output_mode") == "dsl" else "fences"
+    fused = request.form.get("generate") in {"1", "true", "on"}
+    prev_dir = _run_dir(workdir)
     if not prev_dir.exists():
         return jsonify({"ok": False, "error": "Previous session expired."}), 410
 
@@ -725,31 +806,87 @@ def api_retry():
     if not src_file.exists():
         return jsonify({"ok": False, "error": "No source image found to retry."}), 400
 
-    up_path = Path(src_file.read_text("utf-8").strip())
-    if not up_path.exists():
+    up_path = source_image(prev_dir)   # also finds the image of a run produced on another node
+    if up_path is None:
         return jsonify({"ok": False, "error": "Original image missing on disk."}), 400
 
     out_dir = _ts_dir()
     (out_dir / "source_image.txt").write_text(str(up_path), "utf-8")
+    result = None
     try:
-        process_siebel_conversion(str(up_path), str(out_dir), model=model, max_completion_tokens=tokens)
+        result = process_siebel_conversion(str(up_path), str(out_dir), model=model, max_completion_tokens=tokens,
+                                           use_region_cache=use_region_cache, output_mode=output_mode,
+                                           use_tiles=use_tiles, use_library=use_library)
     except Exception as e:
         (out_dir / "raw_response.txt").write_text(f"ERROR: {e}", "utf-8")
         (out_dir / "generated.html").write_text(
             f"<html><body><h2>Conversion failed</h2><p>{e}</p></body></html>", "utf-8"
         )
 
-    return jsonify({"ok": True, "workdir": out_dir.name})
+    _optimize_css(out_dir)
+    _index_run(out_dir, up_path, _image_phash(up_path))
+    payload = _fused_payload(out_dir, result, fused)
+    payload.update({k: result[k] for k in ("json_repair", "design_library", "revision") if result and result.get(k)})
+    payload.update(_deadline_payload(result))
+    compress_run(out_dir)
+    publish_run(out_dir, source=up_path)
+    _prewarm_bundle(out_dir)
+    return jsonify({"ok": True, "workdir": out_dir.name, **payload})
 
 
+def _build_bundle(out_dir: Path) -> dict:
+    """Everything the UI shows for a run: inlined preview, .swt texts, manifest summary."""
+    html = _inline_preview_html(out_dir)
+    manifest = {}
+    for name in ("manifest.repaired.json", "manifest.json"):
+        if artifact_path(out_dir, name) is not None:
+            try:
+                manifest = tolerant_json.loads(read_text(out_dir / name) or "{}")[0]
+            except json.JSONDecodeError:
+                pass
+            break
+    swt = {fp.name: fp for fp in sorted(out_dir.glob("*.swt"))}
+    swt.update({fp.name: fp for fp in sorted(out_dir.glob("webtemplate/*.swt"))})  # current layout wins
+    view = swt.pop("view_template.swt", None)
+    return {
+        "workdir": out_dir.name,
+        "ok": _conversion_ok(out_dir),
+        "preview_html": html,
+        "etag": etag_of(html),
+        "view": view.read_text("utf-8", errors="ignore") if view else None,
+        "applets": [{"file": name, "content": fp.read_text("utf-8", errors="ignore"),
+                     "url": f"/download/{out_dir.name}/{fp.relative_to(out_dir).as_posix()}"}
+                    for name, fp in swt.items()],
+        "manifest": manifest_summary(manifest if isinstance(manifest, dict) else {}),
+        "downloads": {n: f"/download/{out_dir.name}/{n}" for n in ("raw_response.txt", "generated.html")},
+    }
+
+def _prewarm_bundle(out_dir: Path) -> None:
+    get_bundles().prewarm(out_dir, _build_bundle)
+
 @app.get("/preview/<workdir>")
 def preview(workdir: str):
-    """Return HTML (with CSS inlined) for iframe preview."""
-    out_dir = OUTPUT_ROOT / workdir
+    """Return HTML (with CSS inlined) for iframe preview, from the run's in-memory bundle."""
+    out_dir = _run_dir(workdir)
     if not out_dir.exists():
         abort(404)
-    html = _inline_preview_html(out_dir)
-    return html
+    bundle = get_bundles().get(out_dir, _build_bundle)
+    resp = Response(bundle["preview_html"], mimetype="text/html")
+    resp.set_etag(bundle["etag"])
+    return resp.make_conditional(request)
+
+@app.get("/api/run/<workdir>/bundle")
+def run_bundle(workdir: str):
+    """One request for a whole run: preview HTML, view/applet .swt contents and the manifest summary."""
+    out_dir = _run_dir(workdir)
+    if not out_dir.exists():
+        abort(404)
+    return jsonify(get_bundles().get(out_dir, _build_bundle))
+
+@app.get("/api/run_bundles/stats")
+def run_bundle_stats():
+    """Runs and bytes held by the bundle LRU, hit/miss/stale/eviction counters."""
+    return jsonify(get_bundles().snapshot())
 def _safe_name(name: str) -> str:
     """Normalize names to safe identifiers for file/include usage."""
     return re.sub(r'[^a-zA-Z0-9_-]', '_', name.strip()).lower()
@@ -761,35 +898,58 @@ def _zip_webtemplate(out_dir: Path) -> Path:
     zip_path = out_dir / f"webtemplate_{out_dir.name}.zip"
     base = str(zip_path)[:-4]  # make_archive expects no .zip
     shutil.make_archive(base_name=base, format="zip", root_dir=wt)
+    sheets = [fp for fp in (out_dir / DESIGN_CSS, out_dir / "style.min.css") if fp.exists()]
+    if sheets:  # ship the shared + pruned stylesheets alongside the templates
+        with zipfile.ZipFile(zip_path, "a", compression=zipfile.ZIP_DEFLATED) as zf:
+            for css in sheets:
+                zf.write(css, css.name)
     return zip_path
 
 @app.get("/download-webtemplate/<workdir>")
 def download_webtemplate_zip(workdir: str):
-    out_dir = OUTPUT_ROOT / workdir
+    out_dir = _run_dir(workdir)
     if not out_dir.exists():
         abort(404)
     zip_path = _zip_webtemplate(out_dir)
     return send_file(zip_path, as_attachment=True, download_name=zip_path.name)
 
+def _send_gzipped(fp: Path, name: str):
+    """Serve an artifact stored as .gz: as-is with Content-Encoding when the client accepts gzip."""
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if "gzip" in request.accept_encodings:
+        resp = send_file(fp, mimetype=mimetype, as_attachment=True, download_name=name)
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = send_file(io.BytesIO(gzip.decompress(fp.read_bytes())), mimetype=mimetype,
+                         as_attachment=True, download_name=name)
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
 @app.get("/download/<workdir>/<name>")
 def download(workdir: str, name: str):
-    out_dir = OUTPUT_ROOT / workdir
+    out_dir = _run_dir(workdir)
     if not out_dir.exists():
         abort(404)
 
-    base_allowed = {"raw_response.txt", "generated.html", "style.css", "manifest.json", "view_template.swt"}
+    base_allowed = {"raw_response.txt", "generated.html", "style.css", "style.min.css", "css_report.json", DESIGN_CSS,
+                    "manifest.json", "manifest.repaired.json", "manifest.repaired.diff", "view_template.swt"}
     is_applet = name.startswith("applet_") and name.endswith(".swt")
 
     if not (name in base_allowed or is_applet):
         abort(404)
 
-    return send_file(out_dir / name, as_attachment=True)
+    fp = artifact_path(out_dir, name)
+    if fp is None:
+        abort(404)
+    if fp.suffix == ".gz" and not name.endswith(".gz"):
+        return _send_gzipped(fp, name)
+    return send_file(fp, as_attachment=True)
 
 
 @app.post("/api/generate_siebel")
 def api_generate_siebel():
     workdir = request.form.get("workdir", "")
-    out_dir = OUTPUT_ROOT / workdir
+    out_dir = _run_dir(workdir)
     if not out_dir.exists():
         return jsonify({"ok": False, "error": "Session expired. Re-run conversion."}), 410
 
@@ -797,15 +957,16 @@ def api_generate_siebel():
     html_path = out_dir / "generated.html"
     manifest_path = out_dir / "manifest.json"
 
-    if not html_path.exists():
+    if artifact_path(out_dir, html_path.name) is None:
         return jsonify({"ok": False, "error": "generated.html not found"}), 400
-    if not manifest_path.exists():
+    if artifact_path(out_dir, manifest_path.name) is None:
         return jsonify({"ok": False, "error": "manifest.json not found"}), 400
 
-    html = html_path.read_text("utf-8", errors="ignore")
+    html = read_text(html_path)
    # manifest = json.loads(manifest_path.read_text("utf-8", errors="ignore"))
+    json_repair: dict = {}
     try:
-        manifest = _load_manifest_safely(manifest_path)
+        manifest = _load_manifest_safely(manifest_path, json_repair)
     except Exception as e:
         return jsonify({
             "ok": False,
@@ -813,15 +974,111 @@ def api_generate_siebel():
             "hint": "Remove comments/trailing commas or paste a clean JSON.",
         }), 400
 
+    manifest, repair = _repair_selectors(html, manifest, out_dir)
     result = generate_siebel_templates_from_hierarchy(html, manifest, out_dir, workdir)
+    _publish_generated(out_dir)
+    _prewarm_bundle(out_dir)
       # build zip so the client can download immediately
     zip_url = f"/download-webtemplate/{workdir}"
     return jsonify({
         "ok": True,
         "message": "Generated Siebel webtemplates.",
         "files": result,
-        "zip": zip_url
+        "zip": zip_url,
+        "repair": repair,
+        "json_repair": json_repair
     })
+# ---- Admin: bulk regeneration of stored runs ----
+
+def _admin_ok() -> bool:
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set and sent as X-Admin-Token."""
+    token = os.environ.get("ADMIN_TOKEN", "")
+    sent = request.headers.get("X-Admin-Token", "")
+    return bool(token) and hmac.compare_digest(token, sent)
+
+def _profile_run_dir(req, body) -> Path | None:
+    """Run folder a profiled request belongs to (URL, form/JSON field or the response's workdir)."""
+    data = req.get_json(silent=True) if req.is_json else None
+    workdir = ((req.view_args or {}).get("workdir") or req.form.get("workdir")
+               or (data or {}).get("workdir") or (body or {}).get("workdir") or "")
+    workdir = secure_filename(workdir)
+    return OUTPUT_ROOT / workdir if workdir and (OUTPUT_ROOT / workdir).is_dir() else None
+
+# opt-in profiling: X-Profile: 1 (or ?profile=1) together with X-Admin-Token
+request_profiler.install(app, _admin_ok, _profile_run_dir, OUTPUT_ROOT / "_profiles")
+
+@app.post("/api/admin/regenerate_all")
+def api_admin_regenerate_all():
+    """Start regenerating webtemplates for all (or the given) runs in a process pool."""
+    if not _admin_ok():
+        return jsonify({"ok": False, "error": "Admin token required."}), 403
+    import bulk_regen
+
+    data = request.get_json(silent=True) or {}
+    workdirs = data.get("workdirs") or request.form.getlist("workdir") or None
+    workers = data.get("workers") or request.form.get("workers")
+    if workdirs is not None and (not isinstance(workdirs, list)
+                                 or any(not isinstance(w, str) or secure_filename(w) != w for w in workdirs)):
+        return jsonify({"ok": False, "error": "workdirs must be a list of run folder names."}), 400
+    try:
+        workers = int(workers) if workers else None
+    except (TypeError, ValueError):
+        workers = 0
+    if workers is not None and workers < 1:
+        return jsonify({"ok": False, "error": "workers must be a positive integer."}), 400
+    report_id = f"regen_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    report_path = bulk_regen.REPORT_DIR / f"{report_id}.json"
+
+    threading.Thread(
+        target=bulk_regen.regenerate_all,
+        kwargs={"workdirs": workdirs, "workers": workers, "report_path": report_path},
+        daemon=True,
+    ).start()
+    return jsonify({"ok": True, "report_id": report_id,
+                    "status": f"/api/admin/regenerate_all/{report_id}"}), 202
+
+@app.get("/api/admin/regenerate_all/<report_id>")
+def api_admin_regenerate_report(report_id: str):
+    """Return the (possibly still running) bulk regeneration report."""
+    if not _admin_ok():
+        return jsonify({"ok": False, "error": "Admin token required."}), 403
+    import bulk_regen
+
+    fp = bulk_regen.REPORT_DIR / f"{secure_filename(report_id)}.json"
+    if not fp.exists():
+        abort(404)
+    return jsonify(json.loads(fp.read_text("utf-8")))
+
+# ---- design-system class library ----
+
+@app.get("/api/design_library")
+def api_design_library():
+    """Current shared class library (class names, how many runs use each)."""
+    import design_library
+
+    index = design_library.load_library()
+    if index is None:
+        return jsonify({"ok": True, "available": False, "default": DESIGN_LIBRARY_DEFAULT})
+    return jsonify({"ok": True, "available": True, "default": DESIGN_LIBRARY_DEFAULT, **index})
+
+@app.post("/api/admin/design_library")
+def api_admin_design_library():
+    """Rebuild the class library from the style.css of all stored runs."""
+    if not _admin_ok():
+        return jsonify({"ok": False, "error": "Admin token required."}), 403
+    import design_library
+
+    data = request.get_json(silent=True) or {}
+    min_runs = data.get("min_runs") or request.form.get("min_runs")
+    try:
+        min_runs = int(min_runs) if min_runs else design_library.MIN_RUNS
+    except (TypeError, ValueError):
+        min_runs = 0
+    if min_runs < 1:
+        return jsonify({"ok": False, "error": "min_runs must be a positive integer."}), 400
+    index = design_library.build_library(min_runs=min_runs)
+    return jsonify({"ok": True, **index})
+
 #PM/PR Generator code start# ---- PM/PR Generator (simple, no AI) ----
 
 def _pmpr_safe(name: str) -> str:
@@ -831,14 +1088,63 @@ def _pmpr_safe(name: str) -> str:
         base = f"A_{base}"
     return base
 
-def _pm_template(cls: str) -> str:
+def _select_one(root, selector: str | None):
+    if root is None or not selector:
+        return None
+    try:
+        return root.select_one(selector)
+    except Exception:          # selector soupsieve cannot parse
+        return None
+
+def _applet_bindings(applet: dict | None, root=None) -> tuple[list[tuple[str, str, str]], list[tuple[str, str]]]:
+    """
+    (od-id, label, controlType) per field and (od-id, name) per action, as stamped in the .swt.
+    `root` is the parsed applet .swt (or the applet's element in generated.html): od-ids are
+    read from the resolved nodes, so fields without dataField/label get the id/name/class
+    based od-id the annotator gave them.  Without manifest fields, the controls the
+    annotator found on its own are bound.
+    """
+    if not applet:
+        return [], []
+    fields, actions, seen = [], [], set()
+    for a in applet.get("actions") or []:
+        name = (a.get("name") or "").strip()
+        if name:
+            actions.append((_od_safe(name), name))
+    for f in applet.get("fields") or []:
+        node = _select_one(root, f.get("selector"))
+        od_id = (node.get("od-id") if node is not None else None) or _derive_od_id(f, node, f.get("label") or "")
+        if od_id not in seen:
+            seen.add(od_id)
+            fields.append((od_id, f.get("label") or od_id, f.get("controlType") or "Text"))
+    if not applet.get("fields") and root is not None:
+        action_ids = {od_id for od_id, _ in actions}
+        for node in root.select('[od-type="control"][od-id]'):
+            od_id = node["od-id"]
+            if od_id not in seen and od_id not in action_ids:
+                seen.add(od_id)
+                fields.append((od_id, od_id, "Text"))
+    return fields, actions
+
+def _pm_template(cls: str, applet: dict | None = None, root=None) -> str:
+    fields, actions = _applet_bindings(applet, root)
+    init = ["    // TODO: add PM property/command registrations here"]
+    if fields or actions:
+        init = [f'    // Applet: {applet.get("name", cls)} ({applet.get("role", "")})']
+        init += [f'    // field {od_id}: {label} [{ctype}]' for od_id, label, ctype in fields]
+        for od_id, name in actions:
+            init.append(f'    this.AddMethod("On{od_id}", function () {{')
+            init.append(f'      // TODO: handle "{name}"')
+            init.append('      return true;')
+            init.append('    }, { sequence: false, scope: this });')
+    init_body = "\n".join(init)
     return f"""define("siebel/custom/{cls}PM", ["siebel/pmodel"], function (PModel) {{
   function {cls}PM() {{}}
   {cls}PM.prototype = new PModel();
 
   {cls}PM.prototype.Init = function () {{
     PModel.prototype.Init.apply(this, arguments);
-    // TODO: add PM property/command registrations here
+{init_body}
   }};
 
   {cls}PM.prototype.Setup = function (propSet) {{
@@ -848,7 +1154,22 @@ def _pm_template(cls: str) -> str:
   return {cls}PM;
 }});"""
 
-def _pr_template(cls: str) -> str:
+def _pr_template(cls: str, applet: dict | None = None, root=None) -> str:
+    fields, actions = _applet_bindings(applet, root)
+    bind = []
+    if fields or actions:
+        bind = ['    var pm = this.GetPM();',
+                '    var $applet = $("#" + pm.Get("GetFullId"));',
+                '    var controls = pm.Get("GetControls");']
+        for od_id, label, ctype in fields:
+            bind.append(f'    var $ctl{od_id} = $applet.find(\'[od-id="{od_id}"]\'); // {label} [{ctype}]')
+            bind.append(f'    $ctl{od_id}.on("change", function () {{ /* TODO */ }});')
+        for od_id, name in actions:
+            bind.append(f'    $applet.find(\'[od-id="{od_id}"]\').on("click", function (e) {{')
+            bind.append(f'      e.preventDefault();')
+            bind.append(f'      pm.ExecuteMethod("On{od_id}"); // {name}')
+            bind.append('    });')
+    bind_body = ("\n" + "\n".join(bind)) if bind else ""
     return f"""define("siebel/custom/{cls}PR", ["siebel/physicalrenderer"], function (PR) {{
   function {cls}PR(pm) {{
     PR.call(this, pm);
@@ -870,7 +1191,7 @@ def _pr_template(cls: str) -> str:
   }};
 
   {cls}PR.prototype.BindEvents = function () {{
-    PR.prototype.BindEvents.apply(this, arguments);
+    PR.prototype.BindEvents.apply(this, arguments);{bind_body}
   }};
 
   {cls}PR.prototype.EndLife = function () {{
@@ -899,5 +1220,86 @@ def pmpr_generate():
 
     return jsonify({"ok": True, "filename": filename, "code": code})
 
+def _iter_manifest_applets(manifest: dict):
+    """Every applet config of a manifest (page.containers / containers, nested children)."""
+    def walk(containers):
+        for c in containers or []:
+            yield from c.get("applets") or []
+            yield from walk((c.get("children") or []) + (c.get("containers") or []))
+    yield from walk(manifest.get("page", {}).get("containers") or manifest.get("containers") or [])
+
+class _ZipChunks(io.RawIOBase):
+    """Write-only sink for zipfile; bytes are drained and streamed after each member."""
+    def __init__(self):
+        self._chunks = []
+    def writable(self):
+        return True
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+@app.post("/api/pmpr/generate_run")
+def pmpr_generate_run():
+    """PM + PR for every applet of a run's manifest, streamed as one zip with the webtemplates."""
+    data = request.get_json(silent=True) or {}
+    workdir = data.get("workdir") or request.form.get("workdir", "")
+    out_dir = _run_dir(secure_filename(workdir))
+    manifest_path = out_dir / "manifest.json"
+    if not workdir or not out_dir.exists():
+        return jsonify({"ok": False, "error": "Session expired. Re-run conversion."}), 410
+    if artifact_path(out_dir, manifest_path.name) is None:
+        return jsonify({"ok": False, "error": "manifest.json not found"}), 400
+    try:
+        manifest = _load_manifest_safely(manifest_path)
+    except Exception as e:
+        return jsonify({"ok": False, "error": f"manifest.json is not valid JSON ({e})."}), 400
+
+    wt = out_dir / "webtemplate"
+    swt = sorted(wt.glob("*.swt")) if wt.exists() else []
+    swt_by_name = {fp.name: fp for fp in [*out_dir.glob("applet_*.swt"), *swt]}   # current layout wins
+    page = None
+
+    files, used = [], set()
+    for applet in _iter_manifest_applets(manifest):
+        cls = _pmpr_safe(applet.get("name") or "Applet")
+        base, n = cls, 1
+        while cls in used:
+            n += 1
+            cls = f"{base}_{n}"
+        used.add(cls)
+        # bind to the od-ids of the generated template; the page HTML when it was not generated yet
+        fp = swt_by_name.get(f"applet_{_safe_name(applet.get('name') or '')}.swt")
+        if fp is not None:
+            root = _soup(fp.read_text("utf-8"))
+        else:
+            if page is None:
+                page = _soup(read_text(out_dir / "generated.html") or "")
+            root = _select_one(page, applet.get("selector"))
+        files.append((f"pmpr/{cls}PM.js", _pm_template(cls, applet, root)))
+        files.append((f"pmpr/{cls}PR.js", _pr_template(cls, applet, root)))
+    if not files:
+        return jsonify({"ok": False, "error": "No applets in manifest.json"}), 400
+
+    def stream():
+        sink = _ZipChunks()
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for name, code in files:
+                zf.writestr(name, code)
+                yield sink.drain()
+            for fp in swt:
+                zf.write(fp, f"webtemplate/{fp.name}")
+                yield sink.drain()
+            for css in (DESIGN_CSS, "style.min.css"):
+                if (out_dir / css).exists():
+                    zf.write(out_dir / css, f"webtemplate/{css}")
+        yield sink.drain()
+
+    return Response(stream(), mimetype="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="pmpr_{out_dir.name}.zip"'})
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
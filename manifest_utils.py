@@ -0,0 +1,383 @@
+# manifest_utils.py
+"""
+Manifest helpers shared by the web app and the conversion pipeline:
+lenient JSON loading and selector validation against the generated HTML.
+"""
+import json
+import re
+from pathlib import Path
+
+import tolerant_json
+
+
+def _soup(html: str):
+    """Parse HTML with BeautifulSoup/lxml (imported on first use to keep cold start light)."""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, "lxml")
+
+def find_similar_selectors(soup, target_selector: str) -> list:
+    """
+    Find CSS selectors that are similar to the target selector.
+    This helps when the exact selector from manifest doesn't exist in HTML.
+    """
+    try:
+        # If the target selector works, return it
+        if soup.select_one(target_selector):
+            return [target_selector]
+        
+        # Parse the target selector to understand what we're looking for
+        suggestions = []
+        
+        # Strategy 1: Try different variations of the selector
+        if '.' in target_selector:
+            # Class selector - try variations
+            parts = target_selector.split('.')
+            base_class = parts[-1]
+            
+            # Look for elements with similar class names
+            similar_elements = soup.find_all(class_=lambda x: x and base_class in str(x))
+            for element in similar_elements:
+                if element.get('class'):
+                    for cls in element['class']:
+                        if base_class in cls:
+                            suggested_selector = f".{cls}"
+                            if soup.select_one(suggested_selector):
+                                suggestions.append(suggested_selector)
+        
+        # Strategy 2: Try by element type
+        if not suggestions:
+            element_type = target_selector.split('.')[0] if '.' in target_selector else target_selector
+            if element_type and not element_type.startswith('.'):
+                # Look for elements of this type
+                elements = soup.find_all(element_type)
+                if elements:
+                    suggestions.append(element_type)
+        
+        # Strategy 3: Try by role or common patterns
+        if not suggestions:
+            # Look for common container patterns
+            common_containers = ['header', 'footer', 'main', 'section', 'div', 'nav', 'aside']
+            for container in common_containers:
+                elements = soup.find_all(container, class_=True)
+                if elements:
+                    for element in elements:
+                        if element.get('class'):
+                            suggested_selector = f"{container}.{element['class'][0]}"
+                            suggestions.append(suggested_selector)
+        
+        # Strategy 4: Try ID selectors if any element has ID
+        if not suggestions:
+            elements_with_id = soup.find_all(id=True)
+            for element in elements_with_id:
+                suggestions.append(f"#{element['id']}")
+        
+        # Remove duplicates and limit results
+        unique_suggestions = []
+        seen = set()
+        for suggestion in suggestions:
+            if suggestion not in seen and soup.select_one(suggestion):
+                seen.add(suggestion)
+                unique_suggestions.append(suggestion)
+        
+        return unique_suggestions[:5]  # Return top 5 suggestions
+        
+    except Exception as e:
+        print(f"Error finding similar selectors: {e}")
+        return []
+def _strip_code_fence(s: str) -> str:
+    return re.sub(r'^\s*```(?:json)?\s*|\s*```\s*$', '', s, flags=re.IGNORECASE | re.M)
+
+def _load_manifest_safely(path: Path, report: dict | None = None) -> dict:
+    """Parse a stored manifest, repairing model JSON (see tolerant_json); `report` receives what was fixed."""
+    from artifact_store import read_text   # plain or gzipped at rest
+    manifest, rep = tolerant_json.loads(read_text(path))
+    if report is not None:
+        report.update(rep)
+    return manifest
+    
+def validate_structure(html: str, manifest: dict) -> dict:
+    """Validate that manifest structure matches HTML"""
+    soup = _soup(html)
+    validation_result = {
+        "valid": True,
+        "missing_selectors": [],
+        "suggestions": [],
+        "warnings": []
+    }
+    
+    def validate_container(container, parent_selector=""):
+        full_selector = f"{parent_selector} {container['selector']}".strip() if parent_selector else container['selector']
+        
+        if not soup.select_one(full_selector):
+            validation_result["valid"] = False
+            validation_result["missing_selectors"].append(full_selector)
+            
+            # Find similar selectors
+            similar = find_similar_selectors(soup, full_selector)
+            if similar:
+                validation_result["suggestions"].append({
+                    "expected": full_selector,
+                    "similar": similar,
+                    "container": container.get("name", "unknown")
+                })
+            else:
+                validation_result["warnings"].append(f"No similar selectors found for {full_selector}")
+        
+        # Applets must resolve inside their container
+        for applet in container.get("applets", []):
+            if not applet.get("selector"):
+                continue
+            applet_selector = f"{full_selector} {applet['selector']}"
+            if not soup.select_one(applet_selector):
+                validation_result["valid"] = False
+                validation_result["missing_selectors"].append(applet_selector)
+
+        # Validate children recursively
+        for child in container.get("children", []):
+            validate_container(child, full_selector)
+    
+    # Validate all containers
+    for container in manifest.get("containers", []):
+        validate_container(container)
+    
+    return validation_result
+
+
+# ---- local selector repair ----
+
+_GENERIC_TOKENS = {"div", "span", "section", "container", "wrapper", "wrap", "inner", "item", "box", "block", "el"}
+_ROLE_TAGS = {
+    "banner": {"header"}, "nav": {"nav", "ul"}, "main": {"main"}, "list": {"ul", "ol", "table", "tbody"},
+    "form": {"form", "fieldset"}, "toolbar": {"div", "nav"}, "card": {"article", "section"},
+    "region": {"section", "aside", "div"}, "content": {"section", "article", "div"},
+}
+_CONTROL_TAGS = {"input", "select", "textarea", "img", "a", "button"}
+
+
+def _tokens(text: str) -> set[str]:
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    return {t for t in re.split(r"[^a-z0-9]+", text.lower()) if len(t) > 1} - _GENERIC_TOKENS
+
+
+def _selector_tokens(sel: str) -> tuple[str | None, set[str]]:
+    """(tag of the right-most compound, id/class tokens of the selector)."""
+    last = re.split(r"\s*[>+~]\s*|\s+", sel.strip())[-1] if sel.strip() else ""
+    m = re.match(r"[A-Za-z][A-Za-z0-9-]*", last)
+    names = re.findall(r"[.#]([A-Za-z0-9_-]+)", sel)
+    return (m.group(0).lower() if m else None), set().union(*(_tokens(n) for n in names)) if names else set()
+
+
+def _el_tokens(el) -> set[str]:
+    parts = list(el.get("class") or []) + [el.get("id") or "", el.get("name") or ""]
+    return set().union(*(_tokens(p) for p in parts))
+
+
+def _el_text(el) -> str:
+    bits = [el.get_text(" ", strip=True)]
+    for attr in ("alt", "placeholder", "aria-label", "title", "value"):
+        if isinstance(el.get(attr), str):
+            bits.append(el[attr])
+    return " ".join(bits).lower()
+
+
+def _unique_selector(el, scope) -> str | None:
+    """Shortest selector that makes scope.select_one() return exactly `el`."""
+    def ok(sel):
+        try:
+            return scope.select_one(sel) is el
+        except Exception:
+            return False
+
+    ident = re.compile(r"^-?[A-Za-z_][A-Za-z0-9_-]*$")
+    classes = [c for c in el.get("class") or [] if ident.match(c)]
+    cands = []
+    if isinstance(el.get("id"), str) and ident.match(el["id"]):
+        cands.append(f"#{el['id']}")
+    cands += [f".{c}" for c in classes] + [f"{el.name}.{c}" for c in classes]
+    if len(classes) > 1:
+        cands.append("." + ".".join(classes))
+    for sel in cands:
+        if ok(sel):
+            return sel
+    parent = el.parent
+    if parent is not None and parent is not scope:
+        for pc in [c for c in parent.get("class") or [] if ident.match(c)]:
+            for sel in [f".{pc} > {c}" for c in cands] + [f".{pc} > {el.name}"]:
+                if ok(sel):
+                    return sel
+    # positional path from the scope's direct child down to el
+    path, node = [], el
+    while node is not None and node is not scope and node.name not in (None, "[document]", "html", "body"):
+        idx = 1 + sum(1 for s in node.find_previous_siblings(node.name))
+        path.append(f"{node.name}:nth-of-type({idx})")
+        node = node.parent
+    for n in range(1, len(path) + 1):
+        sel = " > ".join(reversed(path[:n]))
+        if ok(sel):
+            return sel
+    return None
+
+
+def _row_selector(applet_el, broken: str, field_sels: list[str]) -> str | None:
+    """Class selector shared by the most repeated sibling elements of a list applet."""
+    _, want = _selector_tokens(broken)
+    groups: dict = {}
+    for el in applet_el.find_all(True):
+        for c in el.get("class") or []:
+            groups.setdefault((id(el.parent), c), []).append(el)
+    best = None
+    for (_, c), els in groups.items():
+        if len(els) < 2 or len(applet_el.select(f".{c}")) != len(els):
+            continue
+        overlap = len(want & _tokens(c)) / len(want) if want else 0.0
+        has_fields = sum(1 for fs in field_sels for e in els[:1] if _safe_select_one(e, fs))
+        key = (has_fields, overlap, len(els))
+        if best is None or key > best[0]:
+            best = (key, f".{c}")
+    return best[1] if best else None
+
+
+def _safe_select_one(el, sel: str):
+    try:
+        return el.select_one(sel)
+    except Exception:
+        return None
+
+
+def _rank(el, sel: str, hints: list[str], child_sels: list[str], role: str,
+          pos: float, order: dict, n: int, rows: tuple[str, int] | None = None) -> float:
+    tag, want = _selector_tokens(sel)
+    have = "|".join(sorted(_el_tokens(el)))
+    # "side-bar" vs "sidebar", "contact-lst" vs "contacts-list": substring match per token
+    cls = sum(1 for t in want if t in have or any(h in t for h in have.split("|") if len(h) > 2)) / len(want) \
+        if want and have else 0.0
+    contains = 0.0
+    if child_sels:
+        contains = sum(1 for cs in child_sels if _safe_select_one(el, cs) is not None) / len(child_sels)
+    text = _el_text(el)
+    txt = sum(1 for h in hints if h and h.lower() in text) / len(hints) if hints else 0.0
+    if tag:
+        tag_score = 1.0 if el.name == tag else 0.0
+    else:
+        tag_score = 0.5 if el.name in _ROLE_TAGS.get(role, ()) else 0.0
+    position = 1.0 - abs(pos - order[id(el)] / max(1, n - 1))
+    score = 0.3 * cls + 0.3 * contains + 0.15 * txt + 0.1 * tag_score + 0.15 * position
+    if rows:  # list applets: the candidate should hold (nearly) all of the rows
+        score = 0.8 * score + 0.2 * len(el.select(rows[0])) / rows[1]
+    return score
+
+
+def repair_manifest(html: str, manifest: dict, min_score: float = 0.3) -> tuple[dict, dict]:
+    """
+    Rewrite manifest selectors that do not resolve in `html` to unique working ones.
+
+    Containers resolve inside their parent container, applets inside their
+    container and fields/actions/item_selector inside their applet, the same
+    scoping generate_siebel_templates_from_hierarchy and apply_od_attributes
+    use.  Candidates are ranked by class/id token overlap with the broken
+    selector, overlap of the element text with the manifest labels, tag (or
+    role) and position among the siblings; the best one above `min_score` gets
+    a fresh selector.  Returns (repaired copy, report).
+    """
+    import copy
+
+    soup = _soup(html)
+    fixed = copy.deepcopy(manifest)
+    report = {"checked": 0, "broken": 0, "fixed": 0, "changes": [], "unresolved": []}
+
+    def resolve(cfg: dict, key: str, scope, path: str, hints: list[str], role: str,
+                pos: float, claimed: set, kinds: set | None = None, child_sels: list[str] | None = None,
+                rows_sel: str | None = None):
+        sel = (cfg.get(key) or "").strip()
+        if not sel:
+            return None
+        report["checked"] += 1
+        try:
+            el = scope.select_one(sel)
+        except Exception:
+            el = None
+        if el is not None:
+            claimed.add(id(el))
+            return el
+        report["broken"] += 1
+        cands = [t for t in scope.find_all(True)
+                 if id(t) not in claimed and (kinds is None or t.name in kinds or t.get("class") or t.get("id"))]
+        order = {id(t): i for i, t in enumerate(cands)}
+        total_rows = len(scope.select(rows_sel)) if rows_sel and _safe_select_one(scope, rows_sel) else 0
+        rows = (rows_sel, total_rows) if total_rows > 1 else None
+        ranked = sorted(((_rank(t, sel, hints, child_sels or [], role, pos, order, len(cands), rows), i, t)
+                         for i, t in enumerate(cands)),
+                        key=lambda x: (-x[0], x[1]))
+        for score, _, cand in ranked:
+            if score < min_score:
+                break
+            new = _unique_selector(cand, scope)
+            if new:
+                cfg[key] = new
+                claimed.add(id(cand))
+                report["fixed"] += 1
+                report["changes"].append({"path": f"{path}.{key}", "from": sel, "to": new, "score": round(score, 3)})
+                return cand
+        report["unresolved"].append({"path": f"{path}.{key}", "selector": sel})
+        return None
+
+    def child_selectors(a: dict) -> list[str]:
+        return [x["selector"] for x in (a.get("fields") or []) + (a.get("actions") or []) if x.get("selector")]
+
+    def applet_hints(a: dict) -> list[str]:
+        return [a.get("name") or ""] + [f.get("label") or "" for f in a.get("fields") or []] \
+            + [x.get("name") or "" for x in a.get("actions") or []]
+
+    def walk(containers: list, scope, path: str):
+        claimed: set = set()
+        for ci, c in enumerate(containers):
+            cpath = f"{path}[{ci}]"
+            hints = [c.get("name") or ""] + [h for a in c.get("applets") or [] for h in applet_hints(a)[:3]]
+            inner_sels = [a["selector"] for a in c.get("applets") or [] if a.get("selector")]
+            el = resolve(c, "selector", scope, cpath, hints, (c.get("role") or "").lower(),
+                         ci / max(1, len(containers) - 1), claimed, child_sels=inner_sels)
+            if el is None:
+                continue
+            inner: set = set()
+            applets = c.get("applets") or []
+            for ai, a in enumerate(applets):
+                apath = f"{cpath}.applets[{ai}]"
+                ael = resolve(a, "selector", el, apath, applet_hints(a), (a.get("role") or "").lower(),
+                              ai / max(1, len(applets) - 1), inner, child_sels=child_selectors(a),
+                              rows_sel=a.get("item_selector"))
+                if ael is None:
+                    continue
+                used: set = set()
+                item_sel = (a.get("item_selector") or "").strip()
+                if item_sel:
+                    report["checked"] += 1
+                    if _safe_select_one(ael, item_sel) is None:
+                        report["broken"] += 1
+                        new = _row_selector(ael, item_sel, child_selectors(a))
+                        if new:
+                            a["item_selector"] = new
+                            report["fixed"] += 1
+                            report["changes"].append({"path": f"{apath}.item_selector", "from": item_sel, "to": new})
+                        else:
+                            report["unresolved"].append({"path": f"{apath}.item_selector", "selector": item_sel})
+                for kind, items in (("fields", a.get("fields") or []), ("actions", a.get("actions") or [])):
+                    for i, f in enumerate(items):
+                        label = f.get("label") or f.get("name") or ""
+                        resolve(f, "selector", ael, f"{apath}.{kind}[{i}]", [label], "",
+                                i / max(1, len(items) - 1), used, _CONTROL_TAGS)
+            for key in ("children", "containers"):
+                if c.get(key):
+                    walk(c[key], el, f"{cpath}.{key}")
+
+    page = fixed.get("page") if isinstance(fixed.get("page"), dict) else fixed
+    walk(page.get("containers") or [], soup, "page.containers" if page is not fixed else "containers")
+    return fixed, report
+
+
+def manifest_diff(before: dict, after: dict) -> str:
+    """Unified diff of two manifests as pretty-printed JSON."""
+    import difflib
+
+    a = json.dumps(before, indent=2, ensure_ascii=False).splitlines(keepends=True)
+    b = json.dumps(after, indent=2, ensure_ascii=False).splitlines(keepends=True)
+    return "".join(difflib.unified_diff(a, b, "manifest.json", "manifest.repaired.json"))
@@ -0,0 +1,271 @@
+# od_annotator.py
+"""
+Stamp Siebel od-* attributes (od-type / od-Html / od-id) onto applet markup.
+
+`apply_od_attributes` indexes the applet DOM in a single traversal: tags
+are bucketed by id/class/name, <label for=...> pairs are collected, and
+every element gets its range in a flat list of stripped text nodes, so
+text length / text content and child counts are O(1) lookups instead of
+repeated get_text() walks over nested subtrees.  Manifest selectors are
+compiled once and matched in one batch against the index buckets.
+
+Output is byte-identical to the original per-selector implementation;
+od_annotator_check.py compares the two and times them.
+"""
+import re
+
+
+def _od_safe(s: str) -> str:
+    s = (s or "").strip()
+    s = re.sub(r"[^A-Za-z0-9]+", "_", s)
+    s = re.sub(r"_+", "_", s).strip("_")
+    return s or "Field"
+
+def _derive_od_id(field_dict, node, fallback=""):
+    if isinstance(field_dict, dict):
+        for k in ("dataField", "label"):
+            v = field_dict.get(k)
+            if v:
+                return _od_safe(v)
+    if node is not None:
+        if node.has_attr("id"):
+            return _od_safe(node["id"])
+        if node.has_attr("name"):
+            return _od_safe(node["name"])
+        if node.has_attr("class"):
+            return _od_safe("_".join(node["class"]))
+    if fallback:
+        return _od_safe(fallback)
+    return "Field"
+
+def _is_buttonish(tag, el):
+    if tag == "button":
+        return True
+    if tag == "a":
+        role = (el.get("role") or "").lower()
+        classes = " ".join(el.get("class", [])).lower()
+        return "button" in role or "btn" in classes
+    return False
+
+def _mark(node, od_type: str, od_html: str, od_id: str) -> None:
+    node["od-type"] = od_type
+    node["od-Html"] = od_html
+    node["od-id"] = od_id
+
+
+_SIMPLE_SEL = re.compile(r"^[A-Za-z0-9_\-#.:*\s>+~]+$")
+_COMBINATOR = re.compile(r"\s*[>+~]\s*|\s+")
+
+
+def _selector_key(sel: str):
+    """Index key (kind, value) of the right-most compound of a simple selector, else None."""
+    sel = sel.strip()
+    if not _SIMPLE_SEL.match(sel):
+        return None                       # selector lists, attributes, :is(...) -> full scan
+    last = _COMBINATOR.split(sel)[-1]
+    m = re.search(r"#([A-Za-z0-9_\-]+)", last)
+    if m:
+        return ("id", m.group(1))
+    m = re.search(r"\.([A-Za-z0-9_\-]+)", last)
+    if m:
+        return ("class", m.group(1))
+    m = re.match(r"[A-Za-z][A-Za-z0-9\-]*", last)
+    if m:
+        return ("name", m.group(0).lower())
+    return None
+
+
+class _TreeIndex:
+    """One pre-order walk over the soup collecting everything the annotator needs."""
+
+    def __init__(self, soup, first_selectors=(), all_selectors=()):
+        from bs4.element import Tag
+
+        main_types = Tag.MAIN_CONTENT_STRING_TYPES
+        self.tags = []            # pre-order
+        self.str_start = []       # per tag: first index into self.strings
+        self.str_end = []         # per tag: one past its last text node
+        self.last_desc = []       # per tag: pre-order index of its last descendant
+        self.strings = []         # stripped, non-empty main-content strings
+        self.label_for = {}       # for-attribute -> first <label>
+        by = {"id": {}, "class": {}, "name": {}}
+
+        stack = [iter(soup.contents)]
+        open_tags = []
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                if open_tags and len(open_tags) == len(stack):
+                    i = open_tags.pop()
+                    self.str_end[i] = len(self.strings)
+                    self.last_desc[i] = len(self.tags) - 1
+                continue
+            if isinstance(child, Tag):
+                i = len(self.tags)
+                self.tags.append(child)
+                self.str_start.append(len(self.strings))
+                self.str_end.append(len(self.strings))
+                self.last_desc.append(i)
+                by["name"].setdefault((child.name or "").lower(), []).append(i)
+                cid = child.get("id")
+                if isinstance(cid, str):
+                    by["id"].setdefault(cid, []).append(i)
+                for c in child.get("class") or []:
+                    by["class"].setdefault(c, []).append(i)
+                if child.name == "label":
+                    fv = child.get("for")
+                    if isinstance(fv, str) and fv and fv not in self.label_for:
+                        self.label_for[fv] = child
+                open_tags.append(i)
+                stack.append(iter(child.contents))
+            elif type(child) in main_types:
+                s = child.strip()
+                if s:
+                    self.strings.append(s)
+        self._main_types = main_types
+        self._pos = {id(t): i for i, t in enumerate(self.tags)}
+
+        # Batch selector matching: every selector is compiled once and only
+        # tested against the elements carrying its right-most id/class/tag.
+        self.first = {}           # selector -> first matching tag (select_one)
+        self.all = {}             # selector -> all matching tags (select)
+        for sel in dict.fromkeys([*first_selectors, *all_selectors]):
+            compiled = soup.css.compile(sel)
+            key = _selector_key(sel)
+            want_all = sel in all_selectors
+            if key is None:
+                hits = compiled.select(soup) if want_all else [t for t in [compiled.select_one(soup)] if t]
+            else:
+                hits = []
+                for i in by[key[0]].get(key[1], ()):
+                    if compiled.match(self.tags[i]):
+                        hits.append(self.tags[i])
+                        if not want_all:
+                            break
+            if sel in first_selectors and hits:
+                self.first[sel] = hits[0]
+            if want_all:
+                self.all[sel] = hits
+
+    def text(self, node, limit: int | None = None) -> str:
+        """Equivalent of node.get_text(strip=True) (optionally only the first `limit` chars)."""
+        if node.interesting_string_types != self._main_types:
+            txt = node.get_text(strip=True)
+            return txt if limit is None else txt[:limit]
+        i = self._pos[id(node)]
+        parts = self.strings[self.str_start[i]:self.str_end[i]]
+        if limit is None:
+            return "".join(parts)
+        out, n = [], 0
+        for p in parts:
+            out.append(p)
+            n += len(p)
+            if n >= limit:
+                break
+        return "".join(out)[:limit]
+
+    def has_text(self, node) -> bool:
+        if node.interesting_string_types != self._main_types:
+            return bool(node.get_text(strip=True))
+        i = self._pos[id(node)]
+        return self.str_end[i] > self.str_start[i]
+
+    def inside(self, roots) -> list[bool]:
+        """Per pre-order position: True when the tag is a strict descendant of any root."""
+        delta = [0] * (len(self.tags) + 1)
+        for r in roots:
+            i = self._pos[id(r)]
+            if self.last_desc[i] > i:
+                delta[i + 1] += 1
+                delta[self.last_desc[i] + 1] -= 1
+        covered, depth = [], 0
+        for d in delta[:-1]:
+            depth += d
+            covered.append(depth > 0)
+        return covered
+
+
+def apply_od_attributes(inner_html: str, applet: dict) -> str:
+    """Stamp od-* attributes onto labels/controls per applet manifest."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(inner_html, "lxml")
+    fields = applet.get("fields") or []
+    actions = applet.get("actions") or []
+    role = (applet.get("role") or "").lower()
+    item_sel = applet.get("item_selector")
+
+    field_sels = [f.get("selector") for f in fields if f.get("selector")]
+    action_sels = [a.get("selector") for a in actions
+                   if a.get("selector") and (a.get("name") or "").strip()]
+    row_sels = [item_sel] if (role == "list" and item_sel and not fields) else []
+    idx = _TreeIndex(soup, field_sels + action_sels, row_sels)
+
+    # 1) Use manifest field selectors when available
+    for f in fields:
+        sel = f.get("selector")
+        if not sel:
+            continue
+        node = idx.first.get(sel)
+        if not node:
+            continue
+
+        # try to find paired <label for=...> or sibling label-ish node
+        label_node = None
+        if node.has_attr("id"):
+            nid = node["id"]
+            label_node = idx.label_for.get(nid) if (isinstance(nid, str) and nid) \
+                else soup.find("label", attrs={"for": nid})
+        if not label_node:
+            prev = node.find_previous_sibling()
+            if prev and (prev.name == "label" or "label" in " ".join(prev.get("class", [])).lower()):
+                label_node = prev
+        if label_node:
+            _mark(label_node, "label", "DisplayName", _derive_od_id(f, label_node, f.get("label") or ""))
+
+        _mark(node, "control", "FormattedHTML", _derive_od_id(f, node, f.get("label") or ""))
+
+    # 2) Actions
+    for act in actions:
+        sel = act.get("selector")
+        name = (act.get("name") or "").strip()
+        if not sel or not name:
+            continue
+        node = idx.first.get(sel)
+        if not node:
+            continue
+        _mark(node, "control", "FormattedHTML", _od_safe(name))
+
+    def plain_text_candidate(n) -> bool:
+        return not n.has_attr("od-type") and idx.has_text(n) and len(n.contents) <= 3
+
+    def needs_text(n) -> bool:
+        return not (n.has_attr("id") or n.has_attr("name") or n.has_attr("class"))
+
+    # 3) If List without explicit fields, mark simple text nodes in each row
+    if row_sels:
+        covered = idx.inside(idx.all[item_sel])
+        for i, n in enumerate(idx.tags):
+            if covered[i] and n.name in ("span", "p", "div") and plain_text_candidate(n):
+                _mark(n, "control", "FormattedHTML", _od_safe(idx.text(n, 24)))
+
+    # 4) Heuristic fallback if no fields at all (forms/detail)
+    if not fields:
+        for lbl in (t for t in idx.tags if t.name == "label"):
+            if not lbl.has_attr("od-type"):
+                txt = idx.text(lbl) if needs_text(lbl) else ""
+                _mark(lbl, "label", "DisplayName", _derive_od_id(None, lbl, txt))
+        for inp in (t for t in idx.tags if t.name in ("input", "select", "textarea")):
+            if not inp.has_attr("od-type"):
+                _mark(inp, "control", "FormattedHTML", _derive_od_id(None, inp))
+        for im in (t for t in idx.tags if t.name == "img"):
+            if not im.has_attr("od-type"):
+                _mark(im, "control", "FormattedHTML", _derive_od_id(None, im, im.get("alt", "Image")))
+        for n in (t for t in idx.tags if t.name in ("span", "p", "div")):
+            if not plain_text_candidate(n):
+                continue
+            txt = idx.text(n) if needs_text(n) else ""
+            _mark(n, "control", "FormattedHTML", _derive_od_id(None, n, txt))
+
+    return str(soup)
@@ -0,0 +1,151 @@
+# od_annotator_check.py
+"""
+Regression check and timing for od_annotator.apply_od_attributes.
+
+Runs the single-pass annotator and the original per-selector implementation
+(`apply_od_attributes_reference`, kept here) on every applet of the given runs,
+with and without manifest fields, plus a synthetic 500-row list applet, and
+checks that both produce byte-identical markup.
+
+    python od_annotator_check.py [output/<run> ...]   # default: all runs
+"""
+import sys
+import time
+from pathlib import Path
+
+from od_annotator import _derive_od_id, _mark, _od_safe, apply_od_attributes
+
+
+def apply_od_attributes_reference(inner_html: str, applet: dict) -> str:
+    """Original select_one/get_text implementation, the reference output."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(inner_html, "lxml")
+    fields = applet.get("fields") or []
+    actions = applet.get("actions") or []
+    role = (applet.get("role") or "").lower()
+    item_sel = applet.get("item_selector")
+
+    for f in fields:
+        sel = f.get("selector")
+        if not sel:
+            continue
+        node = soup.select_one(sel)
+        if not node:
+            continue
+        label_node = None
+        if node.has_attr("id"):
+            label_node = soup.find("label", attrs={"for": node["id"]})
+        if not label_node:
+            prev = node.find_previous_sibling()
+            if prev and (prev.name == "label" or "label" in " ".join(prev.get("class", [])).lower()):
+                label_node = prev
+        if label_node:
+            _mark(label_node, "label", "DisplayName", _derive_od_id(f, label_node, f.get("label") or ""))
+        _mark(node, "control", "FormattedHTML", _derive_od_id(f, node, f.get("label") or ""))
+
+    for act in actions:
+        sel = act.get("selector")
+        name = (act.get("name") or "").strip()
+        if not sel or not name:
+            continue
+        node = soup.select_one(sel)
+        if not node:
+            continue
+        _mark(node, "control", "FormattedHTML", _od_safe(name))
+
+    if role == "list" and item_sel and not fields:
+        for row in soup.select(item_sel):
+            for n in row.select("span, p, div"):
+                if n.has_attr("od-type"):
+                    continue
+                txt = n.get_text(strip=True)
+                if not txt or len(list(n.children)) > 3:
+                    continue
+                _mark(n, "control", "FormattedHTML", _od_safe(txt[:24]))
+
+    if not fields:
+        for lbl in soup.find_all("label"):
+            if not lbl.has_attr("od-type"):
+                _mark(lbl, "label", "DisplayName", _derive_od_id(None, lbl, lbl.get_text(strip=True)))
+        for inp in soup.find_all(["input", "select", "textarea"]):
+            if not inp.has_attr("od-type"):
+                _mark(inp, "control", "FormattedHTML", _derive_od_id(None, inp))
+        for im in soup.find_all("img"):
+            if not im.has_attr("od-type"):
+                _mark(im, "control", "FormattedHTML", _derive_od_id(None, im, im.get("alt", "Image")))
+        for n in soup.find_all(["span", "p", "div"]):
+            if n.has_attr("od-type"):
+                continue
+            txt = n.get_text(strip=True)
+            if not txt or len(list(n.children)) > 3:
+                continue
+            _mark(n, "control", "FormattedHTML", _derive_od_id(None, n, txt))
+
+    return str(soup)
+
+
+def _synthetic_list(rows: int = 500, depth: int = 6) -> tuple[str, dict]:
+    """A wide, deeply nested List applet used for the timing comparison."""
+    row = ("<div class='row'>" + "<div>" * depth +
+           "<span class='name'>Account {i}</span><p>Owner {i}</p><label for='f{i}'>Status</label>"
+           "<input id='f{i}' value='Open'/><img src='x.png' alt='flag'/>" + "</div>" * depth + "</div>")
+    html = "<div class='list'>" + "".join(row.format(i=i) for i in range(rows)) + "</div>"
+    return html, {"name": "Synthetic List", "role": "List", "item_selector": ".row"}
+
+
+def _regression_cases(run_dirs):
+    import json
+    from artifact_store import artifact_path, read_text
+    from manifest_utils import _load_manifest_safely, _soup
+
+    for run in run_dirs:
+        run = Path(run)
+        html_p, mf_p = run / "generated.html", run / "manifest.json"
+        if artifact_path(run, html_p.name) is None or artifact_path(run, mf_p.name) is None:
+            continue
+        try:
+            manifest = _load_manifest_safely(mf_p)
+        except json.JSONDecodeError:
+            continue
+        soup = _soup(read_text(html_p))
+
+        def walk(containers):
+            for c in containers or []:
+                for a in c.get("applets", []) or []:
+                    yield a
+                yield from walk((c.get("children") or []) + (c.get("containers") or []))
+
+        for applet in walk(manifest.get("page", {}).get("containers") or manifest.get("containers")):
+            el = soup.select_one(applet.get("selector") or "") if applet.get("selector") else None
+            if el is None:
+                continue
+            inner = "".join(str(ch) for ch in el.contents if ch != "\n")
+            yield f"{run.name}:{applet.get('name')}", inner, applet
+            yield f"{run.name}:{applet.get('name')} (no fields)", inner, {**applet, "fields": []}
+
+
+def main(argv=None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    from main_router import OUTPUT_ROOT
+    runs = argv or sorted(p for p in OUTPUT_ROOT.iterdir() if p.is_dir())
+    cases = list(_regression_cases(runs))
+    cases.append(("synthetic:500 rows", *_synthetic_list()))
+
+    failures = 0
+    for label, inner, applet in cases:
+        t0 = time.perf_counter()
+        expected = apply_od_attributes_reference(inner, applet)
+        t1 = time.perf_counter()
+        got = apply_od_attributes(inner, applet)
+        t2 = time.perf_counter()
+        same = got == expected
+        failures += not same
+        print(f"{'ok  ' if same else 'DIFF'} {label}: reference {1000 * (t1 - t0):.1f} ms, "
+              f"single-pass {1000 * (t2 - t1):.1f} ms")
+    print(f"{len(cases) - failures}/{len(cases)} identical")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,14 @@
 # openai_api_handler.py
 import base64
+import logging
 import os
 from pathlib import Path
-from openai import OpenAI
 from dotenv import load_dotenv
+from provider_scheduler import is_rate_limit_error
+import deadline
+from image_handles import account_of, get_cache, is_handle_error
 load_dotenv()  # loads .env into environment variables
+log = logging.getLogger("api")
 instructions = (
     "You are an expert UI-to-HTML conversion specialist. Your PRIMARY task is to create perfect, semantic HTML5 that exactly matches the screenshot.\n\n"
     "## PHASE 1: CREATE EXCEPTIONAL HTML\n"
@@ -71,17 +75,73 @@ def encode_image_to_base64(image_path: Path) -> str:
         b64 = base64.b64encode(f.read()).decode("utf-8")
     return f"data:image/png;base64,{b64}"
 
-def call_openai_api(image_path: Path, model: str, max_completion_tokens: int) -> str:
+USER_PROMPT = (
+    "Convert this screenshot to HTML, CSS, and a Siebel manifest.\n"
+    "Return exactly THREE fenced code blocks in this order and NOTHING ELSE:\n"
+    "1) ```html ...```\n2) ```css ...```\n3) ```json ...```"
+)
+
+def _upload_image(client):
+    def upload(path: Path) -> dict:
+        with open(path, "rb") as f:
+            fo = client.files.create(file=f, purpose="vision")
+        return {"id": fo.id}
+    return upload
+
+def _call_with_file(client, model: str, max_completion_tokens: int, prompt: str | None, file_id: str) -> str:
+    """Responses API call referencing an uploaded image instead of a base64 data URI."""
+    kwargs = dict(
+        model=model,
+        instructions=instructions,
+        input=[{"role": "user", "content": [
+            {"type": "input_text", "text": prompt or USER_PROMPT},
+            {"type": "input_image", "file_id": file_id},
+        ]}],
+        max_output_tokens=max_completion_tokens,
+        temperature=0.2,
+    )
+    if deadline.remaining() is not None:
+        stream = client.responses.create(**kwargs, stream=True)
+        return deadline.collect_stream(
+            stream, lambda ev: ev.delta if getattr(ev, "type", "") == "response.output_text.delta" else "",
+            f"openai:{model}")
+    return client.responses.create(**kwargs).output_text or ""
+
+def call_openai_api(image_path: Path, model: str, max_completion_tokens: int, prompt: str | None = None) -> str:
     """
     Attempt to call the OpenAI API. If the call fails (e.g. network off),
     return None so the caller can handle fallback.
+    `prompt` replaces the default user message (e.g. revision/patch requests).
     """
+    from openai import OpenAI  # imported on first use (heavy SDK)
+    api_key = os.getenv("OPENAI_API_KEY")
     client = OpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
+        api_key=api_key,
         organization=os.getenv("OPENAI_ORGANIZATION") or os.getenv("OPENAI_ORG"),
         project=os.getenv("OPENAI_PROJECT"),
+        timeout=deadline.timeout(),   # remaining request budget, PROVIDER_TIMEOUT otherwise
+        **({"max_retries": 0} if deadline.remaining() is not None else {}),
     )
 
+    # uploaded once per image: retries and multi-call workflows send only the file id
+    handle = None
+    if hasattr(client, "responses"):
+        handle = get_cache().get_or_upload("openai", account_of(api_key), image_path, _upload_image(client))
+    if handle:
+        key, entry = handle
+        try:
+            return _call_with_file(client, model, max_completion_tokens, prompt, entry["id"])
+        except Exception as e:
+            if is_rate_limit_error(e):
+                raise
+            if is_handle_error(e):
+                get_cache().fallback(key, e)
+            else:
+                # e.g. a proxy/endpoint without the Responses API: the handle stays valid
+                log.warning("file-handle call failed, sending inline", extra={"model": model, "error": str(e)})
+                if deadline.expired():
+                    return None
+
     data_uri = encode_image_to_base64(image_path)
     
     
@@ -94,27 +154,35 @@ def call_openai_api(image_path: Path, model: str, max_completion_tokens: int) ->
         "Do not include any prose outside these code blocks."
     )'''
 
+    messages = [
+        {"role": "system", "content": instructions},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt or USER_PROMPT},
+                {"type": "image_url", "image_url": {"url": data_uri}},
+            ],
+        },
+    ]
     try:
+        if deadline.remaining() is not None:
+            # under a deadline: stream, so the fences received before it can still be used
+            stream = client.chat.completions.create(
+                model=model, max_completion_tokens=max_completion_tokens, temperature=0.2,
+                messages=messages, stream=True,
+            )
+            return deadline.collect_stream(
+                stream, lambda c: c.choices[0].delta.content if c.choices else "", f"openai:{model}")
         response = client.chat.completions.create(
             model=model,
             max_completion_tokens=max_completion_tokens,
             temperature=0.2,
-            messages=[
-                {"role": "system", "content": instructions},
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": (
-                            "Convert this screenshot to HTML, CSS, and a Siebel manifest.\n"
-                            "Return exactly THREE fenced code blocks in this order and NOTHING ELSE:\n"
-                            "1) ```html ...```\n2) ```css ...```\n3) ```json ...```"
-                        )},
-                        {"type": "image_url", "image_url": {"url": data_uri}},
-                    ],
-                },
-            ],
+            messages=messages,
         )
     except Exception as e:
+        # rate limits go back to the scheduler (it backs off and retries)
+        if is_rate_limit_error(e):
+            raise
         # When offline or quota issues, return None to trigger fallback
         return None
 
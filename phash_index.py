@@ -0,0 +1,152 @@
+# phash_index.py
+"""
+Perceptual-hash index of past conversions.
+
+Every converted upload gets a 64-bit dHash (Pillow + NumPy).  Hashes are
+appended to output/_index/phash.jsonl and held in memory as a NumPy
+uint64 array, so a lookup is one vectorised XOR + popcount over all
+stored runs (tens of thousands of rows in well under a millisecond).
+A match within PHASH_MAX_DISTANCE bits means "same Siebel screen, maybe
+another record loaded or a slightly different crop" and lets the caller
+reuse that run instead of paying for a new LLM conversion.
+
+    python phash_index.py --rebuild     # index all existing runs
+"""
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+from artifact_store import artifact_path, source_image
+
+APP_ROOT = Path(__file__).parent.resolve()
+INDEX_PATH = APP_ROOT / "output" / "_index" / "phash.jsonl"
+MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "6"))
+
+
+def dhash(image, size: int = 8) -> int:
+    """Difference hash: compare neighbouring pixels of a (size+1)x size grayscale thumbnail.
+
+    `image` is a path or an already-decoded PIL image (e.g. a region crop).
+    """
+    import numpy as np
+    from PIL import Image
+
+    if isinstance(image, Image.Image):
+        small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    else:
+        with Image.open(image) as im:
+            small = im.convert("L").resize((size + 1, size), Image.LANCZOS)
+    px = np.asarray(small, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _popcount(a):
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):          # NumPy >= 2.0
+        return np.bitwise_count(a)
+    return np.unpackbits(a.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class PHashIndex:
+    """Append-only on-disk index with an in-memory NumPy view (reloaded when the file changes)."""
+
+    def __init__(self, path: Path = INDEX_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._offset = 0             # bytes of the file already loaded
+        self._hashes = None          # np.ndarray[uint64]
+        self._entries: list[dict] = []
+
+    def _load(self) -> None:
+        """Load lines appended since the last call (by this or any other process)."""
+        import numpy as np
+
+        size = self.path.stat().st_size if self.path.exists() else 0
+        if size < self._offset or self._hashes is None:      # first load, or index was rebuilt
+            self._offset, self._entries, self._hashes = 0, [], np.zeros(0, dtype=np.uint64)
+        if size == self._offset:
+            return
+        with self.path.open("rb") as fh:
+            fh.seek(self._offset)
+            chunk = fh.read(size - self._offset)
+        end = chunk.rfind(b"\n") + 1          # leave a torn last line for the next call
+        new = []
+        for line in chunk[:end].decode("utf-8", errors="ignore").splitlines():
+            try:
+                new.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        self._offset += end
+        if new:
+            self._entries.extend(new)
+            self._hashes = np.concatenate(
+                [self._hashes, np.array([int(e["hash"], 16) for e in new], dtype=np.uint64)])
+
+    def add(self, phash: int, workdir: str, **extra) -> None:
+        entry = {"hash": f"{phash:016x}", "workdir": workdir, **extra}
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as fh:
+                fh.write(json.dumps(entry) + "\n")
+
+    def nearest(self, phash: int, max_distance: int = MAX_DISTANCE, limit: int = 5) -> list[dict]:
+        """Closest stored runs within `max_distance` bits, nearest (then newest) first."""
+        import numpy as np
+
+        with self._lock:
+            self._load()
+            if not len(self._hashes):
+                return []
+            dist = _popcount(self._hashes ^ np.uint64(phash))
+            idx = np.nonzero(dist <= max_distance)[0]
+            if not len(idx):
+                return []
+            order = idx[np.lexsort((-idx, dist[idx]))][:limit]
+            return [{**self._entries[i], "distance": int(dist[i])} for i in order]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+
+_index = None
+
+def get_index() -> PHashIndex:
+    global _index
+    if _index is None:
+        _index = PHashIndex()
+    return _index
+
+
+def rebuild(output_root: Path = APP_ROOT / "output") -> int:
+    """Re-index every run whose source image is still on disk."""
+    idx = PHashIndex(INDEX_PATH)
+    if INDEX_PATH.exists():
+        INDEX_PATH.unlink()
+    n = 0
+    for run in sorted(p for p in output_root.iterdir() if p.is_dir()):
+        if artifact_path(run, "generated.html") is None:
+            continue
+        img = source_image(run)
+        if img is None:
+            continue
+        try:
+            idx.add(dhash(img), run.name, image=img.name)
+            n += 1
+        except OSError:
+            continue
+    return n
+
+
+if __name__ == "__main__":
+    if "--rebuild" in sys.argv[1:]:
+        print(f"indexed {rebuild()} runs -> {INDEX_PATH}")
+    else:
+        for arg in sys.argv[1:]:
+            h = dhash(Path(arg))
+            print(f"{arg}: {h:016x}", get_index().nearest(h))
@@ -0,0 +1,56 @@
+# provider_registry.py
+"""
+Registry of model providers for the design-to-code conversion.
+
+Each provider is registered by module/function *name* only, so its SDK
+(openai, google.generativeai + protobuf/grpc, ...) is imported the first
+time a model of that provider is actually used, not at app start-up.
+"""
+import importlib
+import threading
+
+_PROVIDERS: dict[str, dict] = {}
+_LOADED: dict[str, object] = {}
+_LOCK = threading.Lock()
+
+DEFAULT_PROVIDER = "openai"
+
+
+def register_provider(name: str, module: str, func: str, prefixes: tuple[str, ...] = ()) -> None:
+    """Register a provider; `prefixes` are lower-case model-name prefixes it serves."""
+    _PROVIDERS[name] = {"module": module, "func": func, "prefixes": tuple(p.lower() for p in prefixes)}
+    _LOADED.pop(name, None)
+
+
+def provider_for_model(model: str) -> str:
+    """Return the provider name that serves `model` (falls back to DEFAULT_PROVIDER)."""
+    m = (model or "").lower()
+    for name, spec in _PROVIDERS.items():
+        if any(m.startswith(p) for p in spec["prefixes"]):
+            return name
+    return DEFAULT_PROVIDER
+
+
+def get_provider(name: str):
+    """Return the provider's call function, importing its module on first use."""
+    fn = _LOADED.get(name)
+    if fn is not None:
+        return fn
+    spec = _PROVIDERS.get(name)
+    if not spec:
+        raise RuntimeError(f"Unknown provider '{name}'")
+    with _LOCK:
+        fn = _LOADED.get(name)
+        if fn is None:
+            fn = getattr(importlib.import_module(spec["module"]), spec["func"])
+            _LOADED[name] = fn
+    return fn
+
+
+def loaded_providers() -> list[str]:
+    """Names of providers whose SDK has been imported in this process."""
+    return sorted(_LOADED)
+
+
+register_provider("openai", "openai_api_handler", "call_openai_api", prefixes=("gpt", "o1", "o3", "o4", "chatgpt"))
+register_provider("gemini", "gemini_api_handler", "call_gemini_api", prefixes=("gemini",))
@@ -0,0 +1,219 @@
+# provider_scheduler.py
+"""
+Rate-limit-aware admission control in front of every provider call.
+
+Each (provider, model) has a requests-per-minute and tokens-per-minute
+budget tracked over a sliding 60 s window.  A call is admitted only when
+its estimated tokens fit; otherwise it waits in a priority queue where
+interactive work is always served before batch work.  Provider 429s put
+the key into back-off and the call is retried instead of surfacing
+"Conversion failed".  A request deadline (deadline.py) caps the time spent
+waiting in the queue.  Queue depth, wait times and admissions are exposed
+through `stats()`.
+
+Limits come from RATE_LIMITS (JSON), e.g.
+    {"openai": {"rpm": 500, "tpm": 300000}, "openai:gpt-4o": {"rpm": 100, "tpm": 80000}}
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import deadline as request_deadline
+
+WINDOW = 60.0
+PRIORITIES = {"interactive": 0, "batch": 1}
+MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "120"))
+MAX_RETRIES = int(os.getenv("SCHEDULER_MAX_RETRIES", "3"))
+
+DEFAULT_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 300000},
+    "gemini": {"rpm": 60, "tpm": 1000000},
+}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("provider_priority", default="interactive")
+
+
+class SchedulerTimeout(RuntimeError):
+    """No budget became available within the allowed wait."""
+
+
+@contextlib.contextmanager
+def priority_scope(priority: str):
+    """Run provider calls made inside the block with the given priority (interactive|batch)."""
+    token = _priority.set(priority if priority in PRIORITIES else "interactive")
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_priority(priority: str) -> None:
+    """Set the priority for provider calls made later in the current context (e.g. one request)."""
+    _priority.set(priority if priority in PRIORITIES else "interactive")
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """True for provider 429 / quota-exhausted errors (OpenAI, Gemini, plain HTTP)."""
+    if getattr(exc, "status_code", None) == 429 or getattr(exc, "code", None) == 429:
+        return True
+    return type(exc).__name__ in {"RateLimitError", "ResourceExhausted", "TooManyRequests"}
+
+
+def estimate_image_tokens(image_path, provider: str) -> int:
+    """Approximate prompt tokens for one image (OpenAI high-detail tiling; Gemini per-tile)."""
+    try:
+        from PIL import Image
+        with Image.open(image_path) as im:
+            w, h = im.size
+    except Exception:
+        return 1105                               # ~ a 1024x1024 image
+    if provider == "gemini":
+        return 258 * max(1, math.ceil(w / 768) * math.ceil(h / 768))
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def estimate_text_tokens(*texts: str) -> int:
+    return sum(len(t or "") for t in texts) // 4
+
+
+class _Budget:
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm, self.tpm = rpm, tpm
+        self.events: deque = deque()              # (timestamp, tokens, ticket_id)
+        self.backoff_until = 0.0
+        self.waiting: list = []                    # heap of (priority, seq)
+        self.admitted = 0
+
+    def _trim(self, now: float) -> None:
+        while self.events and now - self.events[0][0] >= WINDOW:
+            self.events.popleft()
+
+    def used_tokens(self) -> int:
+        return sum(e[1] for e in self.events)
+
+    def fits(self, tokens: int, now: float) -> bool:
+        self._trim(now)
+        if now < self.backoff_until or len(self.events) >= self.rpm:
+            return False
+        # an oversized request is admitted alone rather than never
+        return not self.events or self.used_tokens() + tokens <= self.tpm
+
+    def next_change(self, now: float) -> float:
+        """Seconds until admission could become possible again."""
+        waits = [self.backoff_until - now] if now < self.backoff_until else []
+        if self.events:
+            waits.append(self.events[0][0] + WINDOW - now)
+        return max(0.05, min(waits) if waits else 0.5)
+
+
+class ProviderScheduler:
+    def __init__(self, limits: dict | None = None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._cond = threading.Condition()
+        self._budgets: dict[tuple[str, str], _Budget] = {}
+        self._seq = itertools.count()
+        self._waits: deque = deque(maxlen=500)    # (priority, seconds)
+        self._timeouts = 0
+
+    def _budget(self, provider: str, model: str) -> _Budget:
+        key = (provider, model or "")
+        b = self._budgets.get(key)
+        if b is None:
+            lim = self.limits.get(f"{provider}:{model}") or self.limits.get(provider) or {}
+            b = self._budgets[key] = _Budget(int(lim.get("rpm", 60)), int(lim.get("tpm", 100000)))
+        return b
+
+    @contextlib.contextmanager
+    def acquire(self, provider: str, model: str, est_tokens: int, priority: str | None = None,
+                timeout: float | None = None):
+        """Block until the call fits the budget (interactive before batch), then run the block."""
+        prio = PRIORITIES.get(priority or _priority.get(), 0)
+        wait = MAX_WAIT if timeout is None else timeout
+        left = request_deadline.remaining()   # never queue past the request's own deadline
+        if left is not None:
+            wait = min(wait, max(0.0, left))
+        deadline = time.monotonic() + wait
+        entry = (prio, next(self._seq))
+        t0 = time.monotonic()
+        with self._cond:
+            b = self._budget(provider, model)
+            heapq.heappush(b.waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if b.waiting[0] == entry and b.fits(est_tokens, now):
+                        break
+                    if now >= deadline:
+                        self._timeouts += 1
+                        raise SchedulerTimeout(
+                            f"{provider}:{model} rate budget unavailable after {now - t0:.1f}s")
+                    self._cond.wait(min(b.next_change(now), deadline - now))
+            finally:
+                b.waiting.remove(entry)
+                heapq.heapify(b.waiting)
+                self._cond.notify_all()
+            b.events.append((time.monotonic(), est_tokens, entry[1]))
+            b.admitted += 1
+            self._waits.append((prio, time.monotonic() - t0))
+        yield
+
+    def backoff(self, provider: str, model: str, seconds: float) -> None:
+        """Pause admissions for a key after the provider answered 429."""
+        with self._cond:
+            b = self._budget(provider, model)
+            b.backoff_until = max(b.backoff_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def call(self, provider: str, model: str, est_tokens: int, fn, /, *args, **kwargs):
+        """acquire() + fn(), retrying with exponential back-off while the provider returns 429."""
+        for attempt in range(MAX_RETRIES + 1):
+            with self.acquire(provider, model, est_tokens):
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt == MAX_RETRIES:
+                        raise
+            self.backoff(provider, model, min(60.0, 2.0 * 2 ** attempt))
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            keys = {}
+            for (provider, model), b in self._budgets.items():
+                b._trim(now)
+                keys[f"{provider}:{model}"] = {
+                    "rpm_limit": b.rpm, "tpm_limit": b.tpm,
+                    "requests_last_min": len(b.events), "tokens_last_min": b.used_tokens(),
+                    "queue_interactive": sum(1 for p, _ in b.waiting if p == 0),
+                    "queue_batch": sum(1 for p, _ in b.waiting if p == 1),
+                    "admitted": b.admitted,
+                    "backoff_s": round(max(0.0, b.backoff_until - now), 1),
+                }
+            waits = {}
+            for name, p in PRIORITIES.items():
+                w = sorted(s for q, s in self._waits if q == p)
+                if w:
+                    waits[name] = {"count": len(w), "avg_s": round(sum(w) / len(w), 3),
+                                   "p95_s": round(w[int(0.95 * (len(w) - 1))], 3), "max_s": round(w[-1], 3)}
+            return {"providers": keys, "wait": waits, "timeouts": self._timeouts}
+
+
+def _limits_from_env() -> dict:
+    try:
+        return json.loads(os.getenv("RATE_LIMITS", "") or "{}")
+    except json.JSONDecodeError:
+        return {}
+
+
+scheduler = ProviderScheduler(_limits_from_env())
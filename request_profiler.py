@@ -0,0 +1,122 @@
+# request_profiler.py
+"""
+Opt-in per-request profiling.
+
+A request carrying `X-Profile: 1` (or `?profile=1`) *and* a valid admin token
+runs under cProfile plus a wall-clock stack sampler.  After the request the
+profile (`.prof`, loadable with pstats/snakeviz) and a collapsed-stack file
+(`.collapsed.txt`, one `frame;frame;frame count` line per stack, the input
+format of flamegraph.pl / speedscope) are saved to `<run>/profiles/`, or
+output/_profiles/ when the request has no run.  JSON responses get a
+"profile" entry with the hottest functions; other responses an
+X-Profile-Path header.
+
+When the header/param is absent the only cost is that check.
+
+    PROFILE_SAMPLE_MS   sampler interval (default 5)
+    PROFILE_TOP         functions listed in the response (default 15)
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+TOP_N = int(os.getenv("PROFILE_TOP", "15"))
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.thread_id, self.interval = thread_id, interval
+        self.counts: Counter = Counter()
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._halt.set()
+        self.join()
+        return self.counts
+
+
+def top_functions(prof: cProfile.Profile, n: int = TOP_N) -> list[dict]:
+    """Hottest functions by own time, with cumulative time and call counts."""
+    stats = pstats.Stats(prof, stream=io.StringIO())
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({"function": f"{Path(filename).name}:{line}({func})", "calls": nc,
+                     "own_ms": round(tt * 1000, 3), "cumulative_ms": round(ct * 1000, 3)})
+    rows.sort(key=lambda r: r["own_ms"], reverse=True)
+    return rows[:n]
+
+
+def install(app, allowed, run_dir_for, fallback_dir: Path) -> None:
+    """
+    Register the before/after hooks on a Flask app.
+
+    allowed()            -> bool, admin gate evaluated only for profiling requests
+    run_dir_for(request, response_json) -> Path | None, where to store the profile
+    fallback_dir         output/_profiles; paths in the response are relative to its parent
+    """
+    from flask import g, request
+
+    def wants_profile() -> bool:
+        return request.headers.get("X-Profile") == "1" or request.args.get("profile") == "1"
+
+    @app.before_request
+    def _profile_start():
+        if not wants_profile() or not allowed():
+            return
+        g._profile = (cProfile.Profile(), StackSampler(threading.get_ident(), SAMPLE_MS / 1000.0),
+                      time.perf_counter())
+        g._profile[1].start()
+        g._profile[0].enable()
+
+    @app.after_request
+    def _profile_stop(response):
+        state = g.pop("_profile", None)
+        if state is None:
+            return response
+        prof, sampler, t0 = state
+        prof.disable()
+        counts = sampler.stop()
+        wall_ms = round((time.perf_counter() - t0) * 1000, 3)
+
+        body = response.get_json(silent=True) if response.is_json else None
+        run_dir = run_dir_for(request, body)
+        prof_dir = run_dir / "profiles" if run_dir else fallback_dir
+        prof_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{request.endpoint or 'request'}"
+        prof.dump_stats(str(prof_dir / f"{stem}.prof"))
+        (prof_dir / f"{stem}.collapsed.txt").write_text(
+            "".join(f"{stack} {n}\n" for stack, n in counts.most_common()), "utf-8")
+
+        rel = prof_dir.relative_to(fallback_dir.parent).as_posix()   # relative to output/
+        summary = {"wall_ms": wall_ms, "samples": sum(counts.values()),
+                   "profile": f"{rel}/{stem}.prof",
+                   "flamegraph": f"{rel}/{stem}.collapsed.txt",
+                   "top": top_functions(prof)}
+        if isinstance(body, dict):
+            body["profile"] = summary
+            response.set_data(json.dumps(body))
+        response.headers["X-Profile-Path"] = summary["profile"]
+        return response
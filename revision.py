@@ -0,0 +1,258 @@
+# revision.py
+"""
+Differential re-conversion: "convert as revision of run X".
+
+The new screenshot is diffed against run X's stored source image in
+NumPy.  Changed pixels are grouped into padded bounding boxes; only
+those crops, together with the matching slice of the previous
+generated.html / manifest.json, go to the model, which answers with
+replacement elements (marked data-replaces="<selector>"), a CSS delta
+and the updated applet entries.  The patches are merged into copies of
+the previous artifacts.  When too much of the screen changed, the
+images are not comparable, or no patch applies, it falls back to a full
+conversion.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+
+PIXEL_THRESHOLD = int(os.getenv("REVISION_PIXEL_THRESHOLD", "24"))   # max channel delta (0-255)
+MAX_CHANGED = float(os.getenv("REVISION_MAX_CHANGED", "0.35"))       # changed-area share -> full run
+MAX_BOXES = int(os.getenv("REVISION_MAX_BOXES", "4"))
+PAD = 12
+CONTEXT_CHARS = int(os.getenv("REVISION_CONTEXT_CHARS", "12000"))
+
+PATCH_MARKER = "REVISION MODE."   # patch prompts start with it (scored as patches, not pages)
+PATCH_PROMPT = (
+    PATCH_MARKER + " The image is a crop of the changed area {box} of a {width}x{height} screenshot "
+    "that was converted before. The previous manifest outline and the previous HTML of the affected "
+    "part are below. Do NOT regenerate the page. Return exactly THREE fenced code blocks:\n"
+    "1) ```html``` — only the replacement elements. Each top-level element MUST carry "
+    "data-replaces=\"<selector from the previous manifest or an existing class selector>\" naming the "
+    "element it replaces; keep existing class names for unchanged parts.\n"
+    "2) ```css``` — only new or changed rules.\n"
+    "3) ```json``` — {{\"applets\": [ ...updated applet objects (same schema, same name) ... ]}}\n\n"
+    "PREVIOUS MANIFEST OUTLINE:\n{outline}\n\nPREVIOUS HTML:\n{html}\n"
+)
+
+
+# ---------- image diff ----------
+
+def _runs(flags, bridge: int) -> list[list[int]]:
+    runs, start, gap = [], None, 0
+    for i, on in enumerate(flags):
+        if on:
+            start = i if start is None else start
+            gap = 0
+        elif start is not None:
+            gap += 1
+            if gap > bridge:
+                runs.append([start, i - gap + 1])
+                start, gap = None, 0
+    if start is not None:
+        runs.append([start, len(flags) - gap])
+    return runs
+
+
+def diff_images(prev_path: Path, new_path: Path) -> dict:
+    """
+    Compare two screenshots.  Returns {"comparable", "changed", "boxes": [(l, t, r, b)], "size"}.
+
+    Images of different size are compared after resizing the previous one,
+    but only when the aspect ratio is (almost) the same.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(new_path) as im:
+        new = im.convert("RGB")
+    with Image.open(prev_path) as im:
+        prev = im.convert("RGB")
+    w, h = new.size
+    if prev.size != new.size:
+        pw, ph = prev.size
+        if abs(pw / ph - w / h) > 0.02 * (w / h):
+            return {"comparable": False, "changed": 1.0, "boxes": [], "size": (w, h)}
+        prev = prev.resize((w, h), Image.BILINEAR)
+
+    delta = np.abs(np.asarray(new, dtype=np.int16) - np.asarray(prev, dtype=np.int16)).max(axis=2)
+    mask = delta > PIXEL_THRESHOLD
+    changed = float(mask.mean())
+    boxes = []
+    for top, bottom in _runs(mask.any(axis=1), bridge=16):
+        for left, right in _runs(mask[top:bottom].any(axis=0), bridge=16):
+            boxes.append([max(0, left - PAD), max(0, top - PAD), min(w, right + PAD), min(h, bottom + PAD)])
+
+    # keep the request count bounded: merge the two closest boxes until few enough remain
+    while len(boxes) > MAX_BOXES:
+        best = None
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                a, b = boxes[i], boxes[j]
+                u = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                cost = (u[2] - u[0]) * (u[3] - u[1]) - (a[2] - a[0]) * (a[3] - a[1]) - (b[2] - b[0]) * (b[3] - b[1])
+                if best is None or cost < best[0]:
+                    best = (cost, i, j, u)
+        _, i, j, u = best
+        boxes[i] = u
+        del boxes[j]
+    return {"comparable": True, "changed": changed, "boxes": [tuple(b) for b in boxes], "size": (w, h)}
+
+
+# ---------- previous-run slices ----------
+
+def _iter_applets(containers):
+    for c in containers or []:
+        for a in c.get("applets") or []:
+            yield c, a
+        yield from _iter_applets((c.get("children") or []) + (c.get("containers") or []))
+
+
+def _containers(manifest: dict) -> list[dict]:
+    return (manifest.get("page", {}) or {}).get("containers") or manifest.get("containers") or []
+
+
+def _outline(containers, depth: int = 0) -> list[str]:
+    lines = []
+    for c in containers or []:
+        lines.append(f"{'  ' * depth}container {c.get('name')} [{c.get('role', '')}] {c.get('selector', '')}")
+        for a in c.get("applets") or []:
+            lines.append(f"{'  ' * depth}  applet {a.get('name')} [{a.get('role', '')}] {a.get('selector', '')}")
+        lines.extend(_outline((c.get("children") or []) + (c.get("containers") or []), depth + 1))
+    return lines
+
+
+def _relevant_slice(prev_dir: Path, box, html: str, manifest: dict) -> tuple[str, list]:
+    """
+    HTML + containers of the previous run that cover `box`.
+
+    Runs converted with the region cache know where every .region-N sits on
+    the screenshot, so only overlapping regions are sent; otherwise the
+    whole (truncated) document is the slice.
+    """
+    containers = _containers(manifest)
+    regions_file = prev_dir / "regions.json"
+    if regions_file.exists():
+        from bs4 import BeautifulSoup
+        regions = json.loads(regions_file.read_text("utf-8")).get("regions", [])
+        hit = [r["region"] for r in regions
+               if r.get("left", 0) < box[2] and r.get("right", 1 << 30) > box[0]
+               and r["top"] < box[3] and r["bottom"] > box[1]]
+        if hit:
+            soup = BeautifulSoup(html, "lxml")
+            parts = [str(el) for n in hit for el in soup.select(f".region-{n}")]
+            scopes = tuple(f".region-{n} " for n in hit)
+            sliced = [c for c in containers if (c.get("selector") or "").startswith(scopes)]
+            return "\n".join(parts)[:CONTEXT_CHARS], sliced or containers
+    return html[:CONTEXT_CHARS], containers
+
+
+# ---------- merge ----------
+
+def merge_patch(html: str, css: str, manifest: dict, raw: str) -> tuple[str, str, dict, dict]:
+    """Apply one patch response to the previous artifacts. Returns html, css, manifest, stats."""
+    from bs4 import BeautifulSoup
+    from siebel_generator import parse_fenced_sections
+
+    p_json, p_html, p_css = parse_fenced_sections(raw or "")
+    soup = BeautifulSoup(html, "lxml")
+    patch = BeautifulSoup(p_html or "", "lxml")
+    applied, unmatched = [], []
+    # outermost markers only, collected before anything moves: a nested marker is part of its
+    # ancestor's replacement and must not be applied to the page on its own
+    markers = [el for el in patch.select("[data-replaces]") if el.find_parent(attrs={"data-replaces": True}) is None]
+    for el in markers:
+        sel = el["data-replaces"]
+        for inner in el.select("[data-replaces]"):
+            del inner["data-replaces"]
+        del el["data-replaces"]
+        try:
+            target = soup.select_one(sel)
+        except Exception:
+            target = None
+        if target is None:
+            unmatched.append(sel)
+            continue
+        target.replace_with(el.extract())
+        applied.append(sel)
+
+    if applied and (p_css or "").strip():
+        css = f"{css}\n\n/* revision */\n{p_css.strip()}\n"
+
+    updated, known = 0, set()
+    try:
+        new_applets = {a.get("name"): a for a in json.loads(p_json or "{}").get("applets", []) if a.get("name")}
+    except (json.JSONDecodeError, AttributeError):
+        new_applets = {}
+    if applied and new_applets:
+        for _, applet in _iter_applets(_containers(manifest)):
+            known.add(applet.get("name"))
+            if applet.get("name") in new_applets:
+                applet.update(new_applets[applet["name"]])
+                updated += 1
+    unknown = sorted(n for n in new_applets if n not in known) if applied else []
+    return str(soup), css, manifest, {"applied": applied, "unmatched": unmatched, "applets_updated": updated,
+                                      "unknown_applets": unknown}
+
+
+# ---------- entry point ----------
+
+def convert_revision(image_path: Path, prev_dir: Path, out: Path, model: str, max_tokens: int) -> dict | None:
+    """
+    Patch `prev_dir`'s artifacts for the changed areas of `image_path` into `out`.
+
+    Returns the revision report, or None when the caller should run a full
+    conversion instead (not comparable / too much changed / nothing applied).
+    """
+    from PIL import Image
+    from artifact_store import artifact_path, read_text, source_image
+    from siebel_generator import _call_model
+
+    prev_img = source_image(prev_dir)
+    needed = ("generated.html", "style.css", "manifest.json")
+    if prev_img is None or not all(artifact_path(prev_dir, n) for n in needed):
+        return None
+    diff = diff_images(prev_img, image_path)
+    report = {"base": prev_dir.name, "changed": round(diff["changed"], 4), "boxes": diff["boxes"]}
+    if not diff["comparable"] or diff["changed"] > MAX_CHANGED:
+        return None
+
+    html = read_text(prev_dir / "generated.html")
+    css = read_text(prev_dir / "style.css")
+    try:
+        manifest = json.loads(read_text(prev_dir / "manifest.json") or "{}")
+    except json.JSONDecodeError:
+        return None
+
+    raws, patches = [], []
+    if diff["boxes"]:
+        crops = out / "revision"
+        crops.mkdir(parents=True, exist_ok=True)
+        with Image.open(image_path) as im:
+            image = im.convert("RGB")
+        w, h = diff["size"]
+        for i, box in enumerate(diff["boxes"], 1):
+            crop_path = crops / f"changed_{i}.png"
+            image.crop(box).save(crop_path)
+            slice_html, slice_containers = _relevant_slice(prev_dir, box, html, manifest)
+            prompt = PATCH_PROMPT.format(box=list(box), width=w, height=h,
+                                         outline="\n".join(_outline(slice_containers)), html=slice_html)
+            raw, err = _call_model(crop_path, model, max_tokens, prompt=prompt)
+            raws.append(f"===== change {i} {list(box)} =====\n{raw or err or ''}")
+            if not raw:
+                return None
+            html, css, manifest, stats = merge_patch(html, css, manifest, raw)
+            patches.append({"box": list(box), **stats})
+        if not any(p["applied"] for p in patches):
+            return None
+
+    report.update(mode="patch" if diff["boxes"] else "unchanged", patches=patches)
+    (out / "raw_response.txt").write_text("\n\n".join(raws) or f"(unchanged from {prev_dir.name})", "utf-8")
+    (out / "generated.html").write_text(html, "utf-8")
+    (out / "style.css").write_text(css, "utf-8")
+    (out / "manifest.json").write_text(json.dumps(manifest, indent=2), "utf-8")
+    if (prev_dir / "regions.json").exists():
+        shutil.copy2(prev_dir / "regions.json", out / "regions.json")
+    (out / "revision.json").write_text(json.dumps(report, indent=2), "utf-8")
+    return report
@@ -0,0 +1,146 @@
+# run_bundles.py
+"""
+In-memory bundles of ready-to-serve run output.
+
+Reviewers flip between runs all the time.  Without a cache every /preview
+re-reads generated.html(.gz) and the stylesheets and re-inlines them, and the
+.swt files are fetched one by one after that.  A bundle holds all of it for
+one run:
+
+    preview_html   the iframe document (CSS inlined), with its etag
+    view           view_template.swt text
+    applets        [{"file", "content"}] of the applet .swt files
+    manifest       summary: containers, applets (name, role, field/action counts)
+
+Bundles live in a size-bounded LRU (RUN_BUNDLE_CACHE_MB, default 64).  Each
+entry carries the signature (name, mtime_ns, size) of the files it was built
+from; a lookup stats those files, so a retry, a regenerate or a bulk rewrite of
+the run invalidates it without any explicit hook.  `prewarm` builds the
+bundle on a background thread right after a conversion or generation.
+
+The builder is supplied by the app (it knows how previews are inlined):
+`get_bundles().get(out_dir, build)` with build(out_dir) -> dict.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+MAX_BYTES = int(float(os.getenv("RUN_BUNDLE_CACHE_MB", "64")) * 1024 * 1024)
+
+# files a bundle depends on (plain or .gz), relative to the run folder
+SOURCES = ("generated.html", "style.css", "style.min.css", "design_system.css",
+           "manifest.json", "manifest.repaired.json")
+
+log = logging.getLogger("api")
+
+
+def signature(out_dir: Path) -> tuple:
+    """(name, mtime_ns, size) of every file the bundle is built from; cheap stat calls only."""
+    sig = []
+    for name in SOURCES:
+        for cand in (name, name + ".gz"):
+            try:
+                st = (out_dir / cand).stat()
+            except OSError:
+                continue
+            sig.append((cand, st.st_mtime_ns, st.st_size))
+    for fp in sorted([*out_dir.glob("*.swt"), *out_dir.glob("webtemplate/*.swt")]):
+        st = fp.stat()
+        sig.append((fp.relative_to(out_dir).as_posix(), st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def manifest_summary(manifest: dict) -> dict:
+    """Containers and applets of a manifest, without the selectors."""
+    containers, applets = 0, []
+
+    def walk(nodes):
+        nonlocal containers
+        for c in nodes or []:
+            containers += 1
+            for a in c.get("applets") or []:
+                applets.append({"name": a.get("name"), "role": a.get("role"),
+                                "fields": len(a.get("fields") or []), "actions": len(a.get("actions") or [])})
+            walk((c.get("children") or []) + (c.get("containers") or []))
+
+    walk((manifest.get("page") or {}).get("containers") or manifest.get("containers"))
+    return {"containers": containers, "applets": applets}
+
+
+def _size(bundle: dict) -> int:
+    return len(json.dumps(bundle, ensure_ascii=False).encode("utf-8"))
+
+
+def etag_of(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+
+
+class BundleCache:
+    """workdir -> (signature, bundle, bytes), least recently used evicted first."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "prewarmed": 0}
+
+    def get(self, out_dir: Path, build) -> dict:
+        key = out_dir.name
+        sig = signature(out_dir)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            self.stats["stale" if entry is not None else "misses"] += 1
+        bundle = build(out_dir)
+        self._put(key, sig, bundle)
+        return bundle
+
+    def _put(self, key: str, sig: tuple, bundle: dict) -> None:
+        size = _size(bundle)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            if size > self.max_bytes:       # larger than the whole cache: serve it, don't keep it
+                return
+            self._entries[key] = (sig, bundle, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, dropped) = self._entries.popitem(last=False)
+                self._bytes -= dropped
+                self.stats["evictions"] += 1
+
+    def prewarm(self, out_dir: Path, build) -> None:
+        """Build the run's bundle in the background (after convert/retry/generate)."""
+        def run():
+            try:
+                self.get(out_dir, build)
+                self.stats["prewarmed"] += 1
+            except Exception as e:
+                log.warning("bundle prewarm failed", extra={"workdir": out_dir.name, "error": str(e)})
+        threading.Thread(target=run, name="bundle-prewarm", daemon=True).start()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"runs": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes, **self.stats}
+
+
+_bundles: BundleCache | None = None
+_bundles_lock = threading.Lock()
+
+
+def get_bundles() -> BundleCache:
+    global _bundles
+    if _bundles is None:
+        with _bundles_lock:
+            if _bundles is None:
+                _bundles = BundleCache()
+    return _bundles
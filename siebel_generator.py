@@ -1,11 +1,20 @@
 # siebel_generator.py
 import os
 import re
+import html as _html
+import json
+import shlex
+import time
+import logging
 from pathlib import Path
-from openai_api_handler import call_openai_api
-from gemini_api_handler import call_gemini_api 
+from provider_registry import get_provider, provider_for_model
+from provider_scheduler import scheduler, estimate_image_tokens, estimate_text_tokens
+import tolerant_json
+import deadline as request_deadline
 #from .main_router import _webtemplate_dir
 
+log = logging.getLogger("api")
+
 def _webtemplate_dir(out: Path) -> Path:
     """Create/return the webtemplate subfolder under the run folder."""
     wt = out / "webtemplate"
@@ -19,25 +28,403 @@ def extract_block(text: str, lang: str) -> str:
 
 def parse_fenced_sections(raw: str) -> tuple[str, str, str]:
     return extract_block(raw, "json"), extract_block(raw, "html"), extract_block(raw, "css")
-def _call_model(image_path: Path, model: str, max_tokens: int) -> tuple[str|None, str|None]:
-    from openai_api_handler import call_openai_api
+# ---- model cascade ----
+# model="cascade": try CASCADE_MODELS in order (cheap/fast first) and stop at the
+# first response whose automatic score reaches CASCADE_MIN_SCORE.
+
+CASCADE = "cascade"
+CASCADE_MODELS = [m.strip() for m in os.getenv("CASCADE_MODELS", "gpt-4o-mini,gpt-4o").split(",") if m.strip()]
+CASCADE_MIN_SCORE = float(os.getenv("CASCADE_MIN_SCORE", "0.9"))
+
+
+def _count_selectors(containers) -> int:
+    """Container + applet selectors that validate_structure checks."""
+    return sum(1 + sum(1 for a in c.get("applets") or [] if a.get("selector"))
+               + _count_selectors(c.get("children") or []) for c in containers or [])
+
+
+def score_response(raw: str | None, prompt: str | None = None) -> tuple[float, dict]:
+    """
+    Score a model response in [0, 1] without another model call.
+
+    Default (three-fence) responses: 0.25 for the fences present, 0.25 when the
+    manifest JSON parses, 0.5 for the share of container/applet selectors
+    that validate_structure finds in the HTML; this includes custom prompts such as
+    the design-library one.  DSL responses score by whether the outline compiles;
+    revision patches (partial HTML) by fences + JSON only.
+    """
+    from manifest_utils import validate_structure
+    from revision import PATCH_MARKER
+
+    if not raw:
+        return 0.0, {"error": "empty response"}
+    if prompt == DSL_PROMPT:
+        try:
+            compile_layout_dsl(extract_block(raw, "layout") or raw)
+            return 1.0, {"compiled": True}
+        except LayoutDSLError as e:
+            return 0.0, {"compiled": False, "error": str(e)}
+    mtext, html, css = parse_fenced_sections(raw)
+    fences = sum(bool(x) for x in (mtext, html, css))
+    try:
+        manifest = tolerant_json.loads(mtext)[0] if mtext else None
+    except json.JSONDecodeError:
+        manifest = None
+    detail = {"fences": fences, "json": isinstance(manifest, dict)}
+    if prompt is not None and prompt.startswith(PATCH_MARKER):
+        return round(0.5 * fences / 3 + 0.5 * detail["json"], 3), detail
+    score = 0.25 * fences / 3 + 0.25 * detail["json"]
+    if detail["json"] and html:
+        page = manifest.get("page", manifest)
+        total = _count_selectors(page.get("containers"))
+        if total:
+            missing = len(validate_structure(html, page)["missing_selectors"])
+            detail.update(selectors=total, missing_selectors=missing)
+            score += 0.5 * (total - missing) / total
+    return round(score, 3), detail
+
+
+def _call_cascade(image_path: Path, max_tokens: int, prompt: str | None, report: dict | None):
+    tiers, best = [], (None, None, -1.0)
+    for tier, model in enumerate(CASCADE_MODELS):
+        if tier and request_deadline.expired():
+            request_deadline.skip(f"cascade tier {tier}")   # keep the best answer so far
+            break
+        t0 = time.monotonic()
+        raw, err = _call_single(image_path, model, max_tokens, prompt)
+        score, detail = score_response(raw, prompt)
+        tiers.append({"tier": tier, "model": model, "score": score, "seconds": round(time.monotonic() - t0, 3),
+                      **({"error": err} if err else {}), **detail})
+        if raw and score > best[2]:
+            best = (raw, tier, score)
+        if score >= CASCADE_MIN_SCORE:
+            break
+    raw, tier, score = best
+    info = {"models": CASCADE_MODELS, "min_score": CASCADE_MIN_SCORE, "tier": tier,
+            "model": CASCADE_MODELS[tier] if tier is not None else None, "score": max(score, 0.0),
+            "seconds": round(sum(t["seconds"] for t in tiers), 3), "attempts": tiers}
+    log.info("cascade", extra={k: info[k] for k in ("tier", "model", "score", "seconds")})
+    if report is not None:
+        report.update(info)
+    if raw is None:
+        return None, next((t["error"] for t in reversed(tiers) if "error" in t), "all cascade tiers failed")
+    return raw, None
+
+
+def _call_model(image_path: Path, model: str, max_tokens: int, prompt: str | None = None,
+                report: dict | None = None) -> tuple[str|None, str|None]:
+    """One model call; model="cascade" escalates through CASCADE_MODELS (details go to `report`)."""
+    if model == CASCADE:
+        return _call_cascade(image_path, max_tokens, prompt, report)
+    return _call_single(image_path, model, max_tokens, prompt)
+
+
+def _call_single(image_path: Path, model: str, max_tokens: int, prompt: str | None = None) -> tuple[str|None, str|None]:
     try:
-        if (model or "").lower().startswith("gemini"):
-            from gemini_api_handler import call_gemini_api
-            return call_gemini_api(image_path, model, max_tokens), None
-        else:
-            return call_openai_api(image_path, model, max_tokens), None
+        # provider SDKs are imported lazily on the first call for that provider
+        provider = provider_for_model(model)
+        call = get_provider(provider)
+        from openai_api_handler import instructions
+        est = estimate_image_tokens(image_path, provider) + estimate_text_tokens(instructions, prompt) + max_tokens
+        kwargs = {"prompt": prompt} if prompt else {}
+        request_deadline.check(f"model call ({model})")
+        # admitted only when the provider/model RPM+TPM budget allows; 429s back off and retry
+        t0 = time.monotonic()
+        raw = scheduler.call(provider, model, est, call, image_path, model, max_tokens, **kwargs)
+        log.info("model call", extra={"provider": provider, "model": model, "est_tokens": est,
+                                      "seconds": round(time.monotonic() - t0, 3), "chars": len(raw or "")})
+        return raw, None
     except Exception as e:
+        log.warning("model call failed", extra={"model": model, "error": str(e)})
         return None, str(e)
     
-def process_siebel_conversion(image_path: str, out_dir: str, model: str = "gpt-5", max_completion_tokens: int = 6000) -> dict:
+# ---- compact layout DSL mode ----
+# The model returns one small indentation-based outline instead of three verbose
+# fences; compile_layout_dsl expands it locally into HTML, CSS and the manifest.
+
+DSL_PROMPT = (
+    "LAYOUT DSL MODE. Ignore the three-block output format above. Return exactly ONE fenced "
+    "```layout``` block and NOTHING ELSE. One element per line, children indented by two spaces, "
+    "values with spaces in double quotes:\n"
+    "page \"<title>\" layout=grid|cards|form|list|mixed [style tokens for body]\n"
+    "container \"<name>\" role=Region|Banner|Main|Nav|Content|Card|Grid [tag=header|nav|main|aside|section|footer] [style tokens]\n"
+    "  applet \"<name>\" role=List|Form|Toolbar|Nav|Card|Region|Grid|Content [entity=<hint>] [bc=\"<BC>\"] [style tokens]\n"
+    "    field \"<label>\" [data=<dataField>] [type=Text|Pick|Date|Number|Checkbox|Button|Link|Image] [value=\"<shown text>\"] [required] [readonly]\n"
+    "    action \"<name>\" [type=Command|Nav|Popup]\n"
+    "    row \"<cell 1>\" \"<cell 2>\" ...   (List applets only: one line per visible row, cells in field order)\n"
+    "Containers may nest. Style tokens: bg=<color> fg=<color> dir=row|column cols=<n> gap=<px> pad=<px> "
+    "w=<css width> h=<css height> radius=<px> border=<color> font=\"<family>\" size=<px> bold align=left|center|right.\n"
+    "Capture every visible module as an applet, every label/value as a field and every button/link as an action."
+)
+
+_DSL_STYLE = {
+    "bg": "background-color", "fg": "color", "w": "width", "h": "height", "pad": "padding",
+    "gap": "gap", "radius": "border-radius", "font": "font-family", "size": "font-size",
+    "align": "text-align",
+}
+_DSL_TAGS = {"header", "nav", "main", "aside", "section", "footer", "div", "article"}
+_ROLE_TAG = {"banner": "header", "nav": "nav", "main": "main"}
+_INPUT_TYPE = {"text": "text", "date": "date", "number": "number", "checkbox": "checkbox"}
+
+
+class LayoutDSLError(ValueError):
+    pass
+
+
+def _dsl_px(v: str) -> str:
+    return f"{v}px" if re.fullmatch(r"-?\d+(?:\.\d+)?", v) else v
+
+
+def _dsl_parse(text: str) -> dict:
+    """Indentation outline -> node tree {kind, name, attrs, flags, values, children}."""
+    root = {"kind": "root", "name": "", "attrs": {}, "flags": set(), "values": [], "children": []}
+    stack = [(-1, root)]
+    for lineno, line in enumerate(text.splitlines(), 1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        indent = len(line) - len(line.lstrip(" \t"))
+        try:
+            tokens = shlex.split(line.strip(), posix=True)
+        except ValueError as e:
+            raise LayoutDSLError(f"line {lineno}: {e}")
+        if "#" in tokens:                       # trailing "# comment"
+            tokens = tokens[:tokens.index("#")]
+        if not tokens:
+            continue
+        kind, rest = tokens[0].lower(), tokens[1:]
+        node = {"kind": kind, "name": "", "attrs": {}, "flags": set(), "values": [], "children": []}
+        for t in rest:
+            if "=" in t and re.match(r"^[A-Za-z][\w-]*=", t):
+                k, v = t.split("=", 1)
+                node["attrs"][k.lower()] = v
+            elif kind == "row":
+                node["values"].append(t)
+            elif not node["name"]:
+                node["name"] = t
+            else:
+                node["flags"].add(t.lower())
+        while stack[-1][0] >= indent:
+            stack.pop()
+        stack[-1][1]["children"].append(node)
+        stack.append((indent, node))
+    return root
+
+
+def compile_layout_dsl(text: str) -> tuple[str, str, dict]:
+    """
+    Deterministically expand a layout DSL outline into (html, css, manifest).
+
+    Class names are derived from the outline names (c-<container>, a-<applet>)
+    and every manifest selector points at markup emitted here, so the manifest
+    always validates against the HTML.
+    """
+    root = _dsl_parse(text)
+    page = next((n for n in root["children"] if n["kind"] == "page"), None)
+    tops = [n for n in (page["children"] if page else []) + root["children"] if n["kind"] == "container"]
+    loose = [n for n in (page["children"] if page else []) + root["children"] if n["kind"] == "applet"]
+    if loose:
+        tops.append({"kind": "container", "name": "Main", "attrs": {"role": "Main"}, "flags": set(),
+                     "values": [], "children": loose})
+    if not tops:
+        raise LayoutDSLError("no container or applet lines")
+
+    used: dict[str, int] = {}
+
+    def slug(prefix: str, name: str) -> str:
+        base = f"{prefix}-" + (re.sub(r"[^a-z0-9]+", "-", (name or prefix).lower()).strip("-") or prefix)
+        used[base] = used.get(base, 0) + 1
+        return base if used[base] == 1 else f"{base}-{used[base]}"
+
+    esc = lambda v: _html.escape(v or "", quote=True)
+    css: list[str] = [
+        "*{box-sizing:border-box}",
+        ".applet{display:flex;flex-direction:column;gap:8px}",
+        ".applet__title{margin:0 0 4px;font-size:1.1em}",
+        ".applet__fields{display:flex;flex-direction:column;gap:6px}",
+        ".field{display:flex;gap:8px;align-items:center}",
+        ".field label{min-width:120px;opacity:.8}",
+        ".applet__items{display:flex;flex-direction:column;gap:4px}",
+        ".applet__row{display:grid;grid-auto-flow:column;grid-auto-columns:1fr;gap:8px;padding:4px 0}",
+        ".applet__actions{display:flex;flex-wrap:wrap;gap:6px}",
+        ".btn{cursor:pointer;padding:4px 10px}",
+    ]
+
+    def style_rule(sel: str, node: dict, base: dict | None = None) -> None:
+        decl = dict(base or {})
+        a = node["attrs"]
+        for k, prop in _DSL_STYLE.items():
+            if k in a:
+                decl[prop] = _dsl_px(a[k]) if k in {"w", "h", "pad", "gap", "radius", "size"} else a[k]
+        if "dir" in a:
+            decl.update({"display": "flex", "flex-direction": "column" if a["dir"].startswith("col") else "row"})
+        if "cols" in a and a["cols"].isdigit():
+            decl.update({"display": "grid", "grid-template-columns": f"repeat({a['cols']},1fr)"})
+        if "border" in a:
+            decl["border"] = f"1px solid {a['border']}"
+        if "bold" in node["flags"]:
+            decl["font-weight"] = "bold"
+        if decl:
+            css.append(sel + "{" + ";".join(f"{k}:{v}" for k, v in decl.items()) + "}")
+
+    def field_html(f: dict, fid: str, value: str) -> str:
+        ctype = (f["attrs"].get("type") or "Text").lower()
+        label = f["name"] or f["attrs"].get("data", "")
+        if ctype == "image":
+            return f'<img id="{fid}" src="" alt="{esc(label)}">'
+        if ctype == "link":
+            return f'<a id="{fid}" href="#">{esc(value or label)}</a>'
+        if ctype == "button":
+            return f'<button id="{fid}" type="button" class="btn">{esc(value or label)}</button>'
+        if ctype == "pick":
+            return f'<select id="{fid}" name="{esc(fid)}"><option>{esc(value)}</option></select>'
+        req = " required" if "required" in f["flags"] else ""
+        ro = " readonly" if "readonly" in f["flags"] else ""
+        itype = _INPUT_TYPE.get(ctype, "text")
+        val = "" if itype == "checkbox" else f' value="{esc(value)}"'
+        return f'<input id="{fid}" name="{esc(fid)}" type="{itype}"{val}{req}{ro}>'
+
+    def compile_applet(node: dict, out: list[str], pad: str) -> dict:
+        cls = slug("a", node["name"])
+        role = node["attrs"].get("role") or "Content"
+        fields = [c for c in node["children"] if c["kind"] == "field"]
+        actions = [c for c in node["children"] if c["kind"] == "action"]
+        rows = [c["values"] for c in node["children"] if c["kind"] == "row"]
+        is_list = role.lower() in {"list", "grid"} and bool(fields)
+        if is_list and "cols" in node["attrs"]:  # columns lay out the cells of each row, not the title
+            style_rule(f".{cls}__row", {"attrs": {"cols": node["attrs"]["cols"]}, "flags": set()},
+                       {"grid-auto-flow": "row"})
+            node = {**node, "attrs": {k: v for k, v in node["attrs"].items() if k != "cols"}}
+        style_rule(f".{cls}", node)
+        cfg = {"name": node["name"] or cls, "role": role, "selector": f".{cls}"}
+        if node["attrs"].get("entity"):
+            cfg["entityHint"] = node["attrs"]["entity"]
+        if node["attrs"].get("bc"):
+            cfg["businessComponent"] = node["attrs"]["bc"]
+        out.append(f'{pad}<section class="applet applet--{role.lower()} {cls}" aria-label="{esc(cfg["name"])}">')
+        out.append(f'{pad}  <h2 class="applet__title">{esc(cfg["name"])}</h2>')
+        mfields = []
+        if is_list:
+            cells = [slug(f"{cls}__cell", f["name"] or f["attrs"].get("data", "")) for f in fields]
+            cfg["item_selector"] = f".{cls}__row"
+            out.append(f'{pad}  <div class="applet__items {cls}__items">')
+            for values in rows or [[f["attrs"].get("value", "") for f in fields]]:
+                out.append(f'{pad}    <div class="applet__row {cls}__row">')
+                for i, cell in enumerate(cells):
+                    v = values[i] if i < len(values) else ""
+                    out.append(f'{pad}      <span class="{cell}">{esc(v)}</span>')
+                out.append(f"{pad}    </div>")
+            out.append(f"{pad}  </div>")
+            for f, cell in zip(fields, cells):
+                mfields.append((f, f".{cell}"))
+        elif fields:
+            out.append(f'{pad}  <div class="applet__fields">')
+            for f in fields:
+                fid = slug(f"{cls[2:]}", f["attrs"].get("data") or f["name"])
+                ctl = field_html(f, fid, f["attrs"].get("value", ""))
+                if (f["attrs"].get("type") or "Text").lower() in {"button", "image"}:
+                    out.append(f'{pad}    <div class="field">{ctl}</div>')
+                else:
+                    out.append(f'{pad}    <div class="field"><label for="{fid}">{esc(f["name"])}</label>{ctl}</div>')
+                mfields.append((f, f"#{fid}"))
+            out.append(f"{pad}  </div>")
+        cfg["fields"] = [{
+            "label": f["name"] or f["attrs"].get("data", ""),
+            "dataField": f["attrs"].get("data") or re.sub(r"\W+", "", (f["name"] or "").title()) or "Field",
+            "selector": sel,
+            "controlType": (f["attrs"].get("type") or "Text").capitalize(),
+            "required": "required" in f["flags"],
+            "readonly": "readonly" in f["flags"],
+        } for f, sel in mfields]
+        cfg["actions"] = []
+        if actions:
+            out.append(f'{pad}  <div class="applet__actions">')
+            for a in actions:
+                acls = slug(f"{cls}__action", a["name"])
+                out.append(f'{pad}    <button type="button" class="btn {acls}">{esc(a["name"])}</button>')
+                cfg["actions"].append({"name": a["name"], "selector": f".{acls}",
+                                       "type": a["attrs"].get("type") or "Command"})
+            out.append(f"{pad}  </div>")
+        out.append(f"{pad}</section>")
+        return cfg
+
+    def compile_container(node: dict, out: list[str], pad: str) -> dict:
+        cls = slug("c", node["name"])
+        role = node["attrs"].get("role") or "Region"
+        tag = node["attrs"].get("tag", "").lower()
+        tag = tag if tag in _DSL_TAGS else _ROLE_TAG.get(role.lower(), "div")
+        style_rule(f".{cls}", node, {"display": "flex", "flex-direction": "column", "gap": "12px"})
+        cfg = {"name": node["name"] or cls, "role": role, "selector": f".{cls}", "type": "container",
+               "applets": [], "children": []}
+        out.append(f'{pad}<{tag} class="container {cls}">')
+        for child in node["children"]:
+            if child["kind"] == "applet":
+                cfg["applets"].append(compile_applet(child, out, pad + "  "))
+            elif child["kind"] == "container":
+                cfg["children"].append(compile_container(child, out, pad + "  "))
+        out.append(f"{pad}</{tag}>")
+        return cfg
+
+    title = (page or {}).get("name") or "Generated Page"
+    body: list[str] = []
+    containers = [compile_container(c, body, "  ") for c in tops]
+    if page:
+        style_rule("body", page, {"margin": "0", "font-family": "Arial,sans-serif"})
+    else:
+        css.append("body{margin:0;font-family:Arial,sans-serif}")
+    layout = (page or {}).get("attrs", {}).get("layout") or "mixed"
+    html = (
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"UTF-8\">\n"
+        f"<title>{esc(title)}</title>\n<link rel=\"stylesheet\" href=\"style.css\">\n</head>\n"
+        "<body>\n" + "\n".join(body) + "\n</body>\n</html>\n"
+    )
+    manifest = {"page": {"title": title, "layout": layout, "containers": containers}}
+    return html, "\n".join(css) + "\n", manifest
+
+
+def process_siebel_conversion(image_path: str, out_dir: str, model: str = "gpt-5", max_completion_tokens: int = 6000,
+                              use_region_cache: bool = False, revision_of: str | None = None,
+                              output_mode: str = "fences", use_tiles: bool = False,
+                              use_library: bool = False) -> dict:
     out = Path(out_dir); out.mkdir(parents=True, exist_ok=True)
     raw_file = out / "raw_response.txt"
     html_file = out / "generated.html"
     css_file  = out / "style.css"
     json_file = out / "manifest.json"
 
-    raw, err = _call_model(Path(image_path), model, max_completion_tokens)
+    if revision_of:
+        # patch only the changed areas of a previous run; None means "do a full conversion"
+        from revision import convert_revision
+        report = convert_revision(Path(image_path), Path(revision_of), out, model, max_completion_tokens)
+        if report is not None:
+            return {"raw": str(raw_file), "html": str(html_file), "css": str(css_file), "json": str(json_file),
+                    "revision": report}
+
+    if use_region_cache:
+        # segment the screenshot, reuse cached region fragments, convert only unseen regions
+        from image_regions import convert_by_regions
+        stats = convert_by_regions(Path(image_path), out, model, max_completion_tokens)
+        return {"raw": str(raw_file), "html": str(html_file), "css": str(css_file), "json": str(json_file),
+                "regions": stats}
+
+    if use_tiles:
+        # tall/wide screenshot: convert whitespace-separated tiles concurrently, then stitch
+        from image_tiles import convert_tiled
+        stats = convert_tiled(Path(image_path), out, model, max_completion_tokens)
+        if stats is not None:   # None: the image fits in one tile
+            return {"raw": str(raw_file), "html": str(html_file), "css": str(css_file), "json": str(json_file),
+                    "tiles": stats}
+
+    dsl = output_mode == "dsl"
+    library = None
+    if use_library and not dsl:
+        # shared design-system classes: the model answers with HTML using them + a small CSS delta
+        from design_library import library_prompt, link_library, load_library
+        library = load_library()
+    prompt = DSL_PROMPT if dsl else (library_prompt(library) if library else None)
+    cascade: dict = {}
+    raw, err = _call_model(Path(image_path), model, max_completion_tokens, prompt=prompt, report=cascade)
+    if cascade:  # tier chosen + score, for per-run latency/cost accounting
+        (out / "cascade.json").write_text(json.dumps(cascade, indent=2), "utf-8")
 
     if not raw:
         msg = f"Conversion failed: {err or 'Unknown error'}"
@@ -48,8 +435,44 @@ def process_siebel_conversion(image_path: str, out_dir: str, model: str = "gpt-5
         return {"raw": str(raw_file), "html": str(html_file), "css": str(css_file), "json": str(json_file)}
 
     raw_file.write_text(raw, "utf-8")
-    manifest, html, css = parse_fenced_sections(raw)
+    cut = request_deadline.state()
+    if cut and cut["cut"] and raw.count("```") % 2:
+        # the stream stopped at the deadline inside a fence: close it so the truncated section is kept
+        # (tolerant_json completes a cut-off manifest, browsers render truncated HTML)
+        raw += "\n```"
+    if dsl:
+        # expand the compact outline locally; an unusable outline falls back to any fences present
+        try:
+            html, css, manifest_obj = compile_layout_dsl(extract_block(raw, "layout") or raw)
+            manifest = json.dumps(manifest_obj, indent=2)
+        except LayoutDSLError as e:
+            log.warning("layout DSL compile failed", extra={"error": str(e)})
+            manifest, html, css = parse_fenced_sections(raw)
+    else:
+        manifest, html, css = parse_fenced_sections(raw)
+    if library and html:
+        html = link_library(out, html)
+    json_repair = None
+    if manifest:
+        # store strict JSON so every later reader can json.loads it; the report says what was fixed
+        try:
+            manifest_obj, json_repair = tolerant_json.loads(manifest)
+            if json_repair["repaired"]:
+                manifest = json.dumps(manifest_obj, indent=2, ensure_ascii=False)
+                log.info("manifest JSON repaired", extra={"repairs": json_repair["repairs"]})
+        except json.JSONDecodeError as e:
+            json_repair = {"repaired": False, "error": str(e)}
     html_file.write_text(html or "", "utf-8")
     css_file.write_text(css or "", "utf-8")
     json_file.write_text((manifest or "{}"), "utf-8")
-    return {"raw": str(raw_file), "html": str(html_file), "css": str(css_file), "json": str(json_file)}
+    partial = None
+    if cut and cut["partial"]:
+        sections = {"manifest": manifest, "html": html, "css": css}
+        partial = {"sections": [k for k, v in sections.items() if v],
+                   "missing": [k for k, v in sections.items() if not v]}
+        log.warning("partial conversion", extra=partial)
+    # in-memory copies let a fused convert+generate job skip re-reading the files
+    return {"raw": str(raw_file), "html": str(html_file), "css": str(css_file), "json": str(json_file),
+            "content": {"html": html or "", "css": css or "", "manifest": manifest or "{}"},
+            "json_repair": json_repair, "partial_sections": partial,
+            "design_library": {"classes": len(library["classes"]), "built_at": library["built_at"]} if library else None}
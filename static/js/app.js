@@ -37,6 +37,24 @@ function copyCode(id) {
 // ---------- Siebel WebTemplate generation ----------
 let currentWorkdir = null;
 
+// Whole run in one request (served from the server's in-memory bundle cache)
+async function fetchRunBundle(workdir) {
+  const res = await fetch(`/api/run/${encodeURIComponent(workdir)}/bundle`);
+  if (!res.ok) throw new Error(`bundle ${res.status}`);
+  return res.json();
+}
+async function showRunPreview(iframe, workdir) {
+  try {
+    const bundle = await fetchRunBundle(workdir);
+    iframe.srcdoc = bundle.preview_html;
+    return bundle;
+  } catch (e) {
+    iframe.removeAttribute("srcdoc");   // fall back to the preview route
+    iframe.src = `/preview/${workdir}`;
+    return null;
+  }
+}
+
 async function generateSiebel() {
   const fd = new FormData();
   if (currentWorkdir) fd.append("workdir", currentWorkdir);
@@ -55,7 +73,16 @@ async function generateSiebel() {
   if (data.ok) {
     // Fetch the actual files to render previews if present on page
     const viewCodeEl = document.getElementById("viewCode");
-    if (viewCodeEl && data.files?.view) {
+    const appletCodeEl = document.getElementById("appletCode");
+    let bundle = null;
+    if ((viewCodeEl || appletCodeEl) && currentWorkdir) {
+      // view + applet texts in one request instead of one fetch per file
+      bundle = await fetchRunBundle(currentWorkdir).catch(() => null);
+    }
+    if (bundle) {
+      if (viewCodeEl && bundle.view != null) viewCodeEl.innerText = bundle.view;
+      if (appletCodeEl && bundle.applets.length) appletCodeEl.innerText = bundle.applets[0].content;
+    } else if (viewCodeEl && data.files?.view) {
       try {
         const viewResp = await fetch(data.files.view);
         viewCodeEl.innerText = await viewResp.text();
@@ -64,8 +91,7 @@ async function generateSiebel() {
       }
     }
 
-    const appletCodeEl = document.getElementById("appletCode");
-    if (appletCodeEl && Array.isArray(data.files?.applets) && data.files.applets.length > 0) {
+    if (!bundle && appletCodeEl && Array.isArray(data.files?.applets) && data.files.applets.length > 0) {
       try {
         const first = data.files.applets[0];
         const firstAppletUrl =
@@ -99,6 +125,25 @@ function initUploadConvertSection() {
   const btnRaw       = $("#btnRaw");
   const btnHtml      = $("#btnHtml");
   const imageInput   = $("#imageInput");
+  const regionCache  = $("#regionCache");
+  const layoutDsl    = $("#layoutDsl");
+  const tiled        = $("#tiled");
+  const designLib    = $("#designLibrary");
+  if (designLib) {
+    // start from the server default; disabled until a library has been built
+    fetch("/api/design_library").then((r) => r.json()).then((lib) => {
+      designLib.checked = !!(lib.available && lib.default);
+      designLib.disabled = !lib.available;
+    }).catch(() => { designLib.disabled = true; });
+  }
+  const fusedGen     = $("#fusedGenerate");
+  const deadlineIn   = $("#deadlineSecs");
+  const partialNote = (data) => {
+    if (!data.partial || !data.deadline) return "";
+    const d = data.deadline;
+    const what = [...(d.cut || []), ...(d.skipped || [])].join(", ");
+    return ` Partial result: deadline of ${d.budget_s}s reached${what ? ` (${what})` : ""}.`;
+  };
 
   // Submit (convert)
   uploadForm.addEventListener("submit", async (e) => {
@@ -111,27 +156,56 @@ function initUploadConvertSection() {
       return;
     }
 
-    const fd = new FormData();
-    fd.append("image", file);
-    if (modelSel) fd.append("model", modelSel.value || "");
-    // harmless if backend ignores; kept for backward compatibility
-    fd.append("max_tokens", "6000");
+    const convert = async (onDuplicate, reuseRun, revisionOf) => {
+      const fd = new FormData();
+      fd.append("image", file);
+      if (modelSel) fd.append("model", modelSel.value || "");
+      // harmless if backend ignores; kept for backward compatibility
+      fd.append("max_tokens", "6000");
+      fd.append("on_duplicate", onDuplicate);
+      if (regionCache && regionCache.checked) fd.append("region_cache", "1");
+      if (layoutDsl && layoutDsl.checked) fd.append("output_mode", "dsl");
+      if (tiled && tiled.checked) fd.append("tiles", "1");
+      if (designLib) fd.append("design_library", designLib.checked ? "1" : "0");
+      if (fusedGen && fusedGen.checked) fd.append("generate", "1");
+      if (deadlineIn && Number(deadlineIn.value) > 0) fd.append("deadline", deadlineIn.value);
+      if (reuseRun) fd.append("reuse_run", reuseRun);
+      if (revisionOf) fd.append("revision_of", revisionOf);
+      const res = await fetch("/api/convert", { method: "POST", body: fd });
+      return res.json();
+    };
 
     showLoading(true);
     try {
-      const res = await fetch("/api/convert", { method: "POST", body: fd });
-      const data = await res.json();
+      let data = await convert("ask");
+      // Near-duplicate of an earlier run: offer its result instead of a new conversion
+      if (data.ok && data.duplicate) {
+        const dup = data.duplicate;
+        const reuse = window.confirm(
+          `This screen looks like run ${dup.workdir} converted earlier. ` +
+          "Reuse that result instantly? (Cancel runs a fresh conversion.)"
+        );
+        if (reuse) {
+          data = await convert("reuse", dup.workdir);
+        } else {
+          // use the earlier run as a seed: only the changed areas are sent to the model
+          const revise = window.confirm(`Convert only the differences against run ${dup.workdir}?`);
+          data = await convert("convert", null, revise ? dup.workdir : null);
+        }
+      }
       if (!data.ok) {
         showError(data.error || "Conversion failed.");
         return;
       }
       currentWorkdir = data.workdir;
 
-      if (iframe) iframe.src = `/preview/${currentWorkdir}`;
+      if (iframe) showRunPreview(iframe, currentWorkdir);
       if (previewBlock) previewBlock.style.display = "block";
       if (btnRaw)  btnRaw.href  = `/download/${currentWorkdir}/raw_response.txt`;
       if (btnHtml) btnHtml.href = `/download/${currentWorkdir}/generated.html`;
-      toast("Preview generated.");
+      toast((data.reused_from ? `Reused run ${data.reused_from}.` : "Preview generated.") + partialNote(data));
+      if (data.siebel) renderGenerated(data.siebel);
+      else if (data.siebel_error) showError(`Webtemplate generation failed: ${data.siebel_error}`);
     } catch (err) {
       showError("Network error during conversion.");
     } finally {
@@ -150,6 +224,12 @@ function initUploadConvertSection() {
       fd.append("workdir", currentWorkdir);
       if (modelSel) fd.append("model", modelSel.value || "");
       fd.append("max_tokens", "6000");
+      const rc = $("#regionCache"); if (rc && rc.checked) fd.append("region_cache", "1");
+      const ld = $("#layoutDsl"); if (ld && ld.checked) fd.append("output_mode", "dsl");
+      const tl = $("#tiled"); if (tl && tl.checked) fd.append("tiles", "1");
+      const dl = $("#designLibrary"); if (dl) fd.append("design_library", dl.checked ? "1" : "0");
+      const fg = $("#fusedGenerate"); if (fg && fg.checked) fd.append("generate", "1");
+      if (deadlineIn && Number(deadlineIn.value) > 0) fd.append("deadline", deadlineIn.value);
 
       try {
         const res = await fetch("/api/retry", { method: "POST", body: fd });
@@ -160,10 +240,12 @@ function initUploadConvertSection() {
         }
         currentWorkdir = data.workdir;
 
-        const frame = $("#previewFrame"); if (frame) frame.src = `/preview/${currentWorkdir}`;
+        const frame = $("#previewFrame"); if (frame) showRunPreview(frame, currentWorkdir);
         const r = $("#btnRaw");  if (r) r.href  = `/download/${currentWorkdir}/raw_response.txt`;
         const h = $("#btnHtml"); if (h) h.href = `/download/${currentWorkdir}/generated.html`;
-        toast("New version generated.");
+        toast("New version generated." + partialNote(data));
+        if (data.siebel) renderGenerated(data.siebel);
+        else if (data.siebel_error) showError(`Webtemplate generation failed: ${data.siebel_error}`);
       } catch (e) {
         showError("Network error during retry.");
       } finally {
@@ -172,6 +254,51 @@ function initUploadConvertSection() {
     });
   }
 
+  // Inline .swt contents (fused convert) become blob links: no extra round trips
+  let blobUrls = [];
+  const swtLink = (content, fallbackUrl) => {
+    if (typeof content !== "string") return fallbackUrl;
+    const url = URL.createObjectURL(new Blob([content], { type: "text/plain" }));
+    blobUrls.push(url);
+    return url;
+  };
+
+  // Render the result of /api/generate_siebel (or the "siebel" part of a fused convert)
+  function renderGenerated(data) {
+    const rep = data.repair;
+    if (rep && rep.fixed) toast(`Repaired ${rep.fixed} manifest selector(s) locally.`);
+    if (rep && rep.unresolved && rep.unresolved.length) {
+      showError(`${rep.unresolved.length} selector(s) could not be repaired (${rep.unresolved.join(", ")}). Retry may help.`);
+    }
+    // Auto download zip if provided
+    if (data.zip) window.location.href = data.zip;
+
+    // Render links to individual files
+    const linksEl = $("#generated-links");
+    if (linksEl && data.files) {
+      blobUrls.forEach((u) => URL.revokeObjectURL(u));
+      blobUrls = [];
+      const items = [];
+
+      const viewUrl = swtLink(data.files.view_content, data.files.view);
+      if (viewUrl) items.push(`<li><a href="${viewUrl}" target="_blank" download="view_template.swt">view_template.swt</a></li>`);
+
+      const applets = Array.isArray(data.files.applets) ? data.files.applets : [];
+      applets.forEach((a) => {
+        const url =
+          typeof a === "string"
+            ? a
+            : swtLink(a.content, a.url || (a.file ? `/download/${currentWorkdir}/webtemplate/${a.file}` : ""));
+        const label =
+          (typeof a === "string" && a.split("/").pop()) ||
+          a.file || a.safe || "applet";
+        if (url) items.push(`<li><a href="${url}" target="_blank" download="${label}">${label}</a></li>`);
+      });
+
+      linksEl.innerHTML = items.length ? `<ul>${items.join("")}</ul>` : "";
+    }
+  }
+
   // Generate Siebel WebTemplate
   if (btnGenerate) {
     btnGenerate.addEventListener("click", async () => {
@@ -200,32 +327,7 @@ function initUploadConvertSection() {
         }
 
         toast(data.message || "Generated Siebel WebTemplate.");
-
-        // Auto download zip if provided
-        if (data.zip) window.location.href = data.zip;
-
-        // Render links to individual files
-        const linksEl = $("#generated-links");
-        if (linksEl && data.files) {
-          const items = [];
-
-          const viewUrl = data.files.view;
-          if (viewUrl) items.push(`<li><a href="${viewUrl}" target="_blank">view_template.swt</a></li>`);
-
-          const applets = Array.isArray(data.files.applets) ? data.files.applets : [];
-          applets.forEach((a) => {
-            const url =
-              typeof a === "string"
-                ? a
-                : a.url || (a.file ? `/download/${currentWorkdir}/webtemplate/${a.file}` : "");
-            const label =
-              (typeof a === "string" && a.split("/").pop()) ||
-              a.file || a.safe || "applet";
-            if (url) items.push(`<li><a href="${url}" target="_blank">${label}</a></li>`);
-          });
-
-          linksEl.innerHTML = items.length ? `<ul>${items.join("")}</ul>` : "";
-        }
+        renderGenerated(data);
       } catch (e) {
         console.error(e);
         showError("Network error during generation.");
@@ -276,6 +378,7 @@ function initClientScriptBot() {
       } else {
         bubble(data.answer || (data.error || "Error"), "bot");
       }
+      if (data.partial) bubble(`(Answer cut off at the ${data.deadline.budget_s}s deadline.)`, "bot");
     } catch (e) {
       bubble("Network error", "bot");
     }
@@ -0,0 +1,157 @@
+# storage_roundtrip.py
+"""
+Round-trip check of the remote artifact backends (artifact_store.py).
+
+Two "nodes" are simulated with two temporary output roots sharing one
+backend.  For each backend the check runs:
+
+    1. node A converts a run and publishes it (artifacts + webtemplate + source image)
+    2. node B materializes the run: every artifact, byte for byte
+    3. node B revises the run (revision_of): it finds node A's screenshot in
+       its own uploads/ and patches instead of converting from scratch
+    4. node B regenerates a webtemplate and publishes it
+    5. node A, once its copy is older than ARTIFACT_CACHE_TTL, picks up the new .swt
+
+SQLite always runs; S3 runs against moto's in-process mock when
+`pip install -r requirements-s3.txt` is installed, and is skipped otherwise.
+
+    python storage_roundtrip.py [--backend sqlite|s3|all]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import artifact_store as store_mod
+
+RUN = "20000101_000000"
+FILES = {
+    "generated.html": b"<html><body><div class='a'>hello</div></body></html>",
+    "style.css": b".a{color:red}",
+    "manifest.json": b'{"containers": []}',
+    "webtemplate/applet_a.swt": b"<div>v1</div>",
+}
+
+
+def _write_run(root: Path, source: Path) -> Path:
+    out = root / RUN
+    for name, data in FILES.items():
+        (out / name).parent.mkdir(parents=True, exist_ok=True)
+        (out / name).write_bytes(data)
+    (out / "source_image.txt").write_text(str(source), "utf-8")     # node A's absolute upload path
+    return out
+
+
+def _screenshot(path: Path) -> Path:
+    from PIL import Image
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (64, 48), (240, 240, 240)).save(path)
+    return path
+
+
+def _age_marker(out: Path) -> None:
+    """Pretend the last sync happened longer than CACHE_TTL ago."""
+    old = time.time() - store_mod.CACHE_TTL - 1
+    (out / store_mod.CACHE_MARKER).touch()
+    os.utime(out / store_mod.CACHE_MARKER, (old, old))
+
+
+def roundtrip(backend, tmp: Path) -> list[str]:
+    """Run the scenario against `backend`; returns the failed checks (empty = ok)."""
+    node_a, node_b, uploads = tmp / "node_a", tmp / "node_b", tmp / "uploads"
+    uploads.mkdir(parents=True, exist_ok=True)
+    store_mod._store, store_mod.UPLOAD_ROOT = backend, uploads
+    failed = []
+
+    source = _screenshot(node_a / "uploads" / "abc123_screen.png")
+    out_a = _write_run(node_a, source)
+    published = store_mod.publish_run(out_a, source=source)
+    if published != len(FILES) + 2:
+        failed.append(f"published {published} artifacts, expected {len(FILES) + 2}")
+
+    (uploads / source.name).unlink(missing_ok=True)
+    if not store_mod.materialize_run(RUN, node_b):
+        failed.append("node B could not materialize the run")
+    for name, data in FILES.items():
+        got = (node_b / RUN / name).read_bytes() if (node_b / RUN / name).is_file() else None
+        if got != data:
+            failed.append(f"node B: {name} differs after materialize")
+    if not (uploads / source.name).is_file():
+        failed.append("node B: source image not materialized into uploads/")
+
+    # node A's upload path does not exist on node B
+    source.unlink()
+    if store_mod.source_image(node_b / RUN) != uploads / source.name:
+        failed.append("node B: source_image() does not resolve node A's screenshot")
+    from revision import convert_revision
+
+    revised = node_b / "20000101_000001"
+    revised.mkdir()
+    upload = uploads / "def456_screen.png"
+    upload.write_bytes((uploads / source.name).read_bytes())   # the same screen re-uploaded
+    report = convert_revision(upload, node_b / RUN, revised, "gpt-4o", 1000)
+    if not report or report.get("mode") != "unchanged":
+        failed.append(f"node B: revision_of fell back to a full conversion ({report})")
+
+    time.sleep(1.1)      # S3 LastModified has one-second resolution
+    new_swt = b"<div>v2 regenerated on B</div>"
+    (node_b / RUN / "webtemplate/applet_a.swt").write_bytes(new_swt)
+    store_mod.publish_run(node_b / RUN, ["webtemplate/applet_a.swt"])
+
+    store_mod.materialize_run(RUN, node_a)
+    if (out_a / "webtemplate/applet_a.swt").read_bytes() != b"<div>v1</div>":
+        failed.append("node A revalidated before the TTL expired")
+    _age_marker(out_a)
+    store_mod.materialize_run(RUN, node_a)
+    if (out_a / "webtemplate/applet_a.swt").read_bytes() != new_swt:
+        failed.append("node A still serves the stale .swt after the TTL (producer copy not revalidated)")
+    return failed
+
+
+def _sqlite(tmp: Path):
+    return store_mod.SQLiteStore(tmp / "artifacts.sqlite")
+
+
+def _s3(tmp: Path):
+    import boto3
+
+    for k, v in {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+                 "AWS_DEFAULT_REGION": "us-east-1"}.items():
+        os.environ.setdefault(k, v)
+    boto3.client("s3").create_bucket(Bucket="runs")
+    return store_mod.S3Store("runs", "runs")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--backend", choices=("sqlite", "s3", "all"), default="all")
+    args = ap.parse_args(argv)
+
+    failures = 0
+    for name in ("sqlite", "s3"):
+        if args.backend not in (name, "all"):
+            continue
+        with tempfile.TemporaryDirectory() as d:
+            tmp = Path(d)
+            if name == "s3":
+                try:
+                    from moto import mock_aws
+                except ImportError:
+                    print("s3      skipped (pip install -r requirements-s3.txt)")
+                    continue
+                with mock_aws():
+                    failed = roundtrip(_s3(tmp), tmp)
+            else:
+                failed = roundtrip(_sqlite(tmp), tmp)
+        failures += bool(failed)
+        print(f"{name:7} {'ok' if not failed else 'FAILED'}")
+        for f in failed:
+            print(f"        - {f}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+# tolerant_json.py
+"""
+Single-pass repair of the JSON that models return for manifest.json.
+
+`repair_json` walks the text once, keeping track of strings and of the open
+brackets, and emits strict JSON:
+
+    leading prose / ```json fences      skipped up to the first { or [
+    // line and /* block */ comments    dropped (only outside strings, so URLs survive)
+    trailing and doubled commas         dropped
+    text after the top-level value      dropped (closing fence, explanations)
+    truncated output                    open string closed, dangling key/colon/literal
+                                        completed, open brackets auto-closed
+
+Every step is O(1) per character, with no backtracking regex. `loads` tries
+json.loads first and only repairs when that fails; both return a report
+{"repaired": bool, "repairs": {kind: count}}.  Unrepairable input raises
+json.JSONDecodeError like json.loads does.
+"""
+import json
+import re
+
+_PLAIN = re.compile(r'[^"\\\n\r\t]+')          # string body run without escapes/control chars
+_BARE = re.compile(r"[A-Za-z0-9_.+\-]+")        # number / literal token
+_LITERALS = ("true", "false", "null")
+_CONTROL = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _note(repairs: dict, kind: str) -> None:
+    repairs[kind] = repairs.get(kind, 0) + 1
+
+
+def _complete_bare(tok: str, repairs: dict) -> str:
+    """A literal/number cut off by truncation ("tru", "1.", "-") -> a valid token."""
+    if tok in _LITERALS:
+        return tok
+    for lit in _LITERALS:
+        if lit.startswith(tok):
+            _note(repairs, "truncated_literal")
+            return lit
+    fixed = tok.rstrip(".eE+-")
+    if fixed != tok:
+        _note(repairs, "truncated_literal")
+    return fixed or "null"
+
+
+def repair_json(text: str) -> tuple[str, dict]:
+    """Repair model JSON in one pass; returns (json_text, report)."""
+    repairs: dict = {}
+    n = len(text or "")
+    i = 0
+    # leading prose and opening fences: everything before the first bracket
+    while i < n and text[i] not in "{[":
+        i += 1
+    if i == n:
+        raise json.JSONDecodeError("no JSON object or array found", text or "", 0)
+    if text[:i].strip():
+        _note(repairs, "code_fence" if "```" in text[:i] else "leading_text")
+
+    out: list[str] = []
+    stack: list[str] = []          # expected closers
+    want_key: list[bool] = []      # per frame: object waiting for a key (arrays: False)
+    after_key = False              # object key read, colon not yet seen
+    pending_comma = -1             # index in `out` of a comma that may still turn out trailing
+    last = ""                      # last significant char emitted
+
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            j = i + 1
+            buf = ['"']
+            closed = False
+            while j < n:
+                m = _PLAIN.match(text, j)
+                if m:
+                    buf.append(m.group(0))
+                    j = m.end()
+                    continue
+                c = text[j]
+                if c == '"':
+                    closed = True
+                    j += 1
+                    break
+                if c == "\\":
+                    if j + 1 >= n:          # truncated inside an escape
+                        j += 1
+                        break
+                    buf.append(text[j:j + 2])
+                    j += 2
+                    continue
+                buf.append(_CONTROL[c])     # raw newline/tab inside a string
+                _note(repairs, "control_char")
+                j += 1
+            if not closed:
+                _note(repairs, "unterminated_string")
+            buf.append('"')
+            if pending_comma >= 0:
+                pending_comma = -1
+            out.append("".join(buf))
+            if stack and stack[-1] == "}" and want_key[-1]:
+                want_key[-1], after_key = False, True
+            last = '"'
+            i = j
+            continue
+
+        if ch in " \t\r\n":
+            out.append(ch)
+            i += 1
+            continue
+
+        if ch == "/" and i + 1 < n and text[i + 1] in "/*":
+            if text[i + 1] == "/":
+                j = text.find("\n", i)
+                i = n if j < 0 else j
+            else:
+                j = text.find("*/", i + 2)
+                i = n if j < 0 else j + 2
+            _note(repairs, "comment")
+            continue
+
+        if ch == "`" and text.startswith("```", i):
+            _note(repairs, "code_fence")   # closing fence inside an unfinished value: stop here
+            break
+
+        if ch in "{[":
+            pending_comma = -1
+            out.append(ch)
+            stack.append("}" if ch == "{" else "]")
+            want_key.append(ch == "{")
+            after_key = False
+            last = ch
+            i += 1
+            continue
+
+        if ch in "}]":
+            if not stack:
+                break
+            if pending_comma >= 0:
+                out[pending_comma] = ""
+                pending_comma = -1
+                _note(repairs, "trailing_comma")
+            if after_key:
+                out.append(":null")
+                _note(repairs, "missing_value")
+            elif last == ":":
+                out.append("null")
+                _note(repairs, "missing_value")
+            if ch != stack[-1]:
+                _note(repairs, "mismatched_bracket")
+            out.append(stack.pop())
+            want_key.pop()
+            after_key = False
+            last = "}"
+            i += 1
+            if not stack:
+                break
+            continue
+
+        if ch == ",":
+            if pending_comma >= 0 or last in ("{", "["):
+                _note(repairs, "extra_comma")
+            else:
+                pending_comma = len(out)
+                out.append(",")
+            if stack and stack[-1] == "}":
+                want_key[-1] = True
+            after_key = False
+            i += 1
+            continue
+
+        if ch == ":":
+            after_key = False
+            out.append(ch)
+            last = ch
+            i += 1
+            continue
+
+        m = _BARE.match(text, i)
+        if m is None:                      # stray character (prose inside the value)
+            _note(repairs, "stray_text")
+            i += 1
+            continue
+        tok = m.group(0)
+        if m.end() >= n:
+            tok = _complete_bare(tok, repairs)
+        pending_comma = -1
+        out.append(tok)
+        last = "0"
+        i = m.end()
+
+    if i < n and text[i:].strip() and not stack:
+        _note(repairs, "trailing_text")
+
+    if stack:                              # truncated: finish the innermost value, close the rest
+        if pending_comma >= 0:
+            out[pending_comma] = ""
+            _note(repairs, "trailing_comma")
+        if after_key:
+            out.append(":null")
+            _note(repairs, "missing_value")
+        elif last == ":":
+            out.append("null")
+            _note(repairs, "missing_value")
+        repairs["auto_closed"] = len(stack)
+        out.extend(reversed(stack))
+
+    return "".join(out), {"repaired": bool(repairs), "repairs": repairs}
+
+
+def loads(text: str) -> tuple[object, dict]:
+    """json.loads when the text is already valid, else the repaired parse; returns (value, report)."""
+    try:
+        return json.loads(text), {"repaired": False, "repairs": {}}
+    except (json.JSONDecodeError, TypeError):
+        pass
+    fixed, report = repair_json(text or "")
+    return json.loads(fixed, strict=False), report
+
+
+if __name__ == "__main__":
+    import sys
+
+    value, rep = loads(sys.stdin.read())
+    print(json.dumps(rep), file=sys.stderr)
+    print(json.dumps(value, indent=2))